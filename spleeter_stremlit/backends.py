@@ -0,0 +1,280 @@
+import os
+import tempfile
+import threading
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# tensorflow / tflite threads per process (0: framework default)
+INTRA_OP_THREADS = int(os.environ.get("SPLEETER_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("SPLEETER_INTER_OP_THREADS", "0"))
+
+_threads_lock = threading.Lock()
+
+
+class InferenceBackend(Enum):
+    """
+    Runtime of the separation network; masking and the inverse stft always
+    run in the tensorflow graph
+    """
+    # stock float32 graph restored from the checkpoint
+    TENSORFLOW = "tensorflow"
+    # float32 graph with variables folded into constants
+    FROZEN = "frozen"
+    # tflite with float16 weights
+    TFLITE_FP16 = "tflite16"
+    # tflite with int8 weights (dynamic range quantization)
+    TFLITE_INT8 = "tflite8"
+
+
+def configure_threads(intra_op_threads: int, inter_op_threads: int):
+    """
+    Set threads of models loaded afterwards
+    Args:
+        intra_op_threads: int: threads inside one op (0: framework default)
+        inter_op_threads: int: ops run at the same time (0: framework default)
+    """
+    global INTRA_OP_THREADS, INTER_OP_THREADS
+    with _threads_lock:
+        INTRA_OP_THREADS, INTER_OP_THREADS = intra_op_threads, inter_op_threads
+
+
+def get_intra_op_threads(intra_op_threads: int = 0) -> int:
+    """
+    Get threads inside one op of a model
+    Args:
+        intra_op_threads: int: threads asked for by the settings (0: configured threads)
+    Returns:
+        int: threads (0: framework default)
+    """
+    if intra_op_threads > 0:
+        return intra_op_threads
+    with _threads_lock:
+        return INTRA_OP_THREADS
+
+
+def get_session_config(intra_op_threads: int = 0):
+    """
+    Get tensorflow session config with the configured threads
+    Args:
+        intra_op_threads: int: threads inside one op (0: configured threads)
+    Returns:
+        tf.compat.v1.ConfigProto: session config
+    """
+    import tensorflow as tf
+
+    intra_op_threads = get_intra_op_threads(intra_op_threads)
+    with _threads_lock:
+        return tf.compat.v1.ConfigProto(
+            intra_op_parallelism_threads=intra_op_threads,
+            inter_op_parallelism_threads=INTER_OP_THREADS)
+
+
+def get_spectrogram_features(stft: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Cut a mixture stft into the network input, as spleeter's graph does
+    Args:
+        stft: np.ndarray: complex64 (frames, frame_length // 2 + 1, channels) mixture stft
+        params: dict: spleeter model configuration
+    Returns:
+        np.ndarray: float32 (segments, T, F, channels) magnitude segments
+    """
+    segment_frames, n_bins = params["T"], params["F"]
+    n_segments = -(-stft.shape[0] // segment_frames)
+    features = np.zeros((n_segments * segment_frames, n_bins, stft.shape[2]), dtype=np.float32)
+    features[:stft.shape[0]] = np.abs(stft[:, :n_bins])
+    return features.reshape((n_segments, segment_frames, n_bins, stft.shape[2]))
+
+
+def get_output_node_name(output_name: str) -> str:
+    # model output tensors are named by keras, converted networks by us
+    return f"output_{output_name}"
+
+
+def build_network(params: dict) -> Tuple[object, object, Dict[str, object]]:
+    """
+    Build the network alone on a magnitude input and restore its checkpoint
+    Args:
+        params: dict: spleeter model configuration
+    Returns:
+        Tuple[tf.compat.v1.Session, tf.Tensor, Dict[str, tf.Tensor]]:
+            (session, input placeholder, model output name -> tensor)
+    """
+    import tensorflow as tf
+    from spleeter.model import get_model_function
+    from spleeter.model.provider import ModelProvider
+
+    graph = tf.Graph()
+    with graph.as_default():
+        features = tf.compat.v1.placeholder(
+            tf.float32, shape=(None, params["T"], params["F"], params["n_channels"]),
+            name="features")
+        # same layers in the same order as EstimatorSpecBuilder, so the
+        # checkpoint variable names match
+        apply_model = get_model_function(params["model"]["type"])
+        outputs = {
+            name: tf.identity(tensor, name=get_output_node_name(name))
+            for name, tensor in apply_model(
+                features, params["instrument_list"], params["model"]["params"]).items()
+        }
+        saver = tf.compat.v1.train.Saver()
+        session = tf.compat.v1.Session(graph=graph, config=get_session_config())
+        model_directory = ModelProvider.default().get(params["model_dir"])
+        saver.restore(session, tf.train.latest_checkpoint(model_directory))
+    return session, features, outputs
+
+
+def get_converted_path(params: dict, backend: InferenceBackend) -> Path:
+    """
+    Get where a converted network is kept, next to the checkpoint it comes from
+    Args:
+        params: dict: spleeter model configuration
+        backend: InferenceBackend: backend
+    Returns:
+        Path: converted network path (EX: pretrained_models/4stems/network-tflite16.tflite)
+    """
+    from spleeter.model.provider import ModelProvider
+
+    suffix = "pb" if backend is InferenceBackend.FROZEN else "tflite"
+    model_directory = ModelProvider.default().get(params["model_dir"])
+    return Path(model_directory) / f"network-{backend.value}.{suffix}"
+
+
+def convert_network(params: dict, backend: InferenceBackend) -> bytes:
+    """
+    Convert the network of a checkpoint for a backend
+    Args:
+        params: dict: spleeter model configuration
+        backend: InferenceBackend: FROZEN, TFLITE_FP16 or TFLITE_INT8
+    Returns:
+        bytes: serialized GraphDef (FROZEN) or tflite flatbuffer
+    """
+    import tensorflow as tf
+
+    session, features, outputs = build_network(params)
+    with session:
+        if backend is InferenceBackend.FROZEN:
+            graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(
+                session, session.graph.as_graph_def(),
+                [tensor.op.name for tensor in outputs.values()])
+            return tf.compat.v1.graph_util.remove_training_nodes(graph_def).SerializeToString()
+
+        converter = tf.compat.v1.lite.TFLiteConverter.from_session(
+            session, [features], list(outputs.values()))
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if backend is InferenceBackend.TFLITE_FP16:
+            converter.target_spec.supported_types = [tf.float16]
+        return converter.convert()
+
+
+def load_converted_network(params: dict, backend: InferenceBackend) -> bytes:
+    """
+    Load a converted network, converting and keeping it on first use
+    Args:
+        params: dict: spleeter model configuration
+        backend: InferenceBackend: FROZEN, TFLITE_FP16 or TFLITE_INT8
+    Returns:
+        bytes: serialized GraphDef (FROZEN) or tflite flatbuffer
+    """
+    converted_path = get_converted_path(params, backend)
+    if converted_path.exists():
+        return converted_path.read_bytes()
+
+    print(f"convert network: {params['model_dir']} ({backend.value})")
+    data = convert_network(params, backend)
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=".tmp-network-", dir=str(converted_path.parent))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_name, converted_path)
+    except OSError as e:
+        # read-only model directory: convert again next time
+        print(f"converted network not kept: {e!r}")
+    return data
+
+
+class FrozenNetwork:
+    """
+    Network as a frozen float32 graph
+    Attributes:
+        output_names (List[str]): model output names (EX: vocals_spectrogram)
+    """
+
+    def __init__(self, params: dict, graph_def_data: bytes, intra_op_threads: int = 0):
+        import tensorflow as tf
+
+        graph_def = tf.compat.v1.GraphDef()
+        graph_def.ParseFromString(graph_def_data)
+        self.output_names: List[str] = [f"{instrument}_spectrogram"
+                                        for instrument in params["instrument_list"]]
+        graph = tf.Graph()
+        with graph.as_default():
+            tf.compat.v1.import_graph_def(graph_def, name="")
+        self._features = graph.get_tensor_by_name("features:0")
+        self._outputs = {name: graph.get_tensor_by_name(f"{get_output_node_name(name)}:0")
+                         for name in self.output_names}
+        self._session = tf.compat.v1.Session(
+            graph=graph, config=get_session_config(intra_op_threads))
+
+    def predict(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        return self._session.run(self._outputs, feed_dict={self._features: features})
+
+
+class TFLiteNetwork:
+    """
+    Network as a tflite model with reduced precision weights.
+    The converted model has a batch of one segment, so segments run one by one.
+    Attributes:
+        output_names (List[str]): model output names (EX: vocals_spectrogram)
+    """
+
+    def __init__(self, params: dict, model_content: bytes, intra_op_threads: int = 0):
+        import tensorflow as tf
+
+        self._interpreter = tf.lite.Interpreter(
+            model_content=model_content,
+            num_threads=get_intra_op_threads(intra_op_threads) or None)
+        self._interpreter.allocate_tensors()
+        self._input_index = self._interpreter.get_input_details()[0]["index"]
+        self.output_names: List[str] = [f"{instrument}_spectrogram"
+                                        for instrument in params["instrument_list"]]
+        output_details = self._interpreter.get_output_details()
+        indices = {detail["name"].split(":")[0]: detail["index"] for detail in output_details}
+        if all(get_output_node_name(name) in indices for name in self.output_names):
+            self._output_indices = {name: indices[get_output_node_name(name)]
+                                    for name in self.output_names}
+        else:
+            # outputs keep the order they were converted in
+            self._output_indices = {name: detail["index"]
+                                    for name, detail in zip(self.output_names, output_details)}
+
+    def predict(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        outputs = {name: np.zeros(features.shape, dtype=np.float32) for name in self.output_names}
+        for i in range(features.shape[0]):
+            self._interpreter.set_tensor(self._input_index, features[i:i + 1])
+            self._interpreter.invoke()
+            for name, index in self._output_indices.items():
+                outputs[name][i] = self._interpreter.get_tensor(index)[0]
+        return outputs
+
+
+def load_network(params: dict, backend: InferenceBackend, intra_op_threads: int = 0):
+    """
+    Load the network of a spleeter model for a non-tensorflow backend
+    Args:
+        params: dict: spleeter model configuration
+        backend: InferenceBackend: FROZEN, TFLITE_FP16 or TFLITE_INT8
+        intra_op_threads: int: threads inside one op (0: configured threads)
+    Returns:
+        Union[FrozenNetwork, TFLiteNetwork]: network with predict(features) -> model outputs
+    Raises:
+        ValueError: if backend is TENSORFLOW (runs in the separator's own graph)
+    """
+    if backend is InferenceBackend.TENSORFLOW:
+        raise ValueError("the tensorflow backend runs in the separator graph")
+    data = load_converted_network(params, backend)
+    if backend is InferenceBackend.FROZEN:
+        return FrozenNetwork(params, data, intra_op_threads)
+    return TFLiteNetwork(params, data, intra_op_threads)
@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from spleeter.audio import Codec
+
+import backends
+from backends import InferenceBackend, configure_threads
+from utils import (SPLEETER_SAMPLE_RATE, compute_stft,
+                   encode_raw_stem, get_audio_duration, get_audio_separated_zip,
+                   get_multi_audio_separated_zip, load_stereo_waveform,
+                   parse_model_spec, separator_pool, warm_up_separator)
+
+DEMO_AUDIO = Path(__file__).parent.parent / "demo_audio" / "example.mp3"
+# a case is a regression when it takes this much longer than the baseline
+DEFAULT_THRESHOLD = 0.2
+# peak rss sampling interval
+RSS_SAMPLE_SECONDS = 0.02
+# a case is a regression when its quality drops by more than this (dB)
+QUALITY_TOLERANCE_DB = 1.0
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Measurement of one benchmark case
+    Attributes:
+        name (str): case name (EX: separation:4stems-mwf:synthetic)
+        wall_seconds (float): elapsed time
+        cpu_seconds (float): cpu time of this process and its descendants
+            (EX: batch worker processes, ffmpeg)
+        peak_rss_bytes (int): peak resident memory of this process and its
+            descendants during the case (summed, so shared pages count once per process)
+        audio_seconds (float): length of processed audio (0: not applicable)
+        rtf (Optional[float]): real-time factor, wall_seconds / audio_seconds
+        quality_db (Optional[float]): signal to distortion ratio against the
+            tensorflow backend (separation with other backends only)
+    """
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_bytes: int
+    audio_seconds: float = 0.0
+    rtf: Optional[float] = None
+    quality_db: Optional[float] = None
+
+
+def get_rss() -> int:
+    """
+    Get current resident memory of this process
+    Returns:
+        int: bytes (peak so far where /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is kilobytes on linux and bytes on macOS
+        scale = 1 if platform.system() == "Darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def get_descendant_pids(pid: Optional[int] = None) -> List[int]:
+    """
+    Get processes started by a process and by its children, recursively
+    Args:
+        pid: Optional[int]: process id (None: this process)
+    Returns:
+        List[int]: process ids (empty where /proc/<pid>/task/<tid>/children is not available)
+    """
+    pid = os.getpid() if pid is None else pid
+    children = []
+    for children_file in Path(f"/proc/{pid}/task").glob("*/children"):
+        try:
+            children += [int(child) for child in children_file.read_text().split()]
+        except (OSError, ValueError):
+            continue
+    return children + [descendant for child in children
+                       for descendant in get_descendant_pids(child)]
+
+
+def get_process_usage(pid: int) -> Optional[Tuple[int, float]]:
+    """
+    Get resident memory and cpu time of another process
+    Args:
+        pid: int: process id
+    Returns:
+        Optional[Tuple[int, float]]: (rss bytes, user + system cpu seconds), None if it is gone
+    """
+    try:
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            # fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+    return rss, cpu_seconds
+
+
+def measure(name: str, fn: Callable[[], object], audio_seconds: float = 0.0) -> BenchmarkResult:
+    """
+    Run fn once and measure it, with the processes it runs on
+    (EX: batch worker processes), which are sampled while it runs
+    Args:
+        name: str: case name
+        fn: Callable[[], object]: benchmarked function
+        audio_seconds: float: length of audio processed by fn (0: no real-time factor)
+    Returns:
+        BenchmarkResult: measurement
+    """
+    peak_rss = 0
+    # last seen cpu seconds of every descendant process
+    descendant_cpu: Dict[int, float] = {}
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        rss = get_rss()
+        for pid in get_descendant_pids():
+            usage = get_process_usage(pid)
+            if usage is not None:
+                rss += usage[0]
+                descendant_cpu[pid] = usage[1]
+        peak_rss = max(peak_rss, rss)
+
+    def sample_usage():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            sample()
+
+    sample()
+    # already running processes (EX: warm workers) count from here
+    descendant_cpu_start = dict(descendant_cpu)
+    sampler = threading.Thread(target=sample_usage, daemon=True)
+    sampler.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        fn()
+    finally:
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        done.set()
+        sampler.join()
+    sample()
+    # processes which ended between samples lose their last interval
+    cpu_seconds += sum(cpu - descendant_cpu_start.get(pid, 0.0)
+                       for pid, cpu in descendant_cpu.items())
+
+    result = BenchmarkResult(
+        name, wall_seconds, cpu_seconds, peak_rss, audio_seconds,
+        wall_seconds / audio_seconds if audio_seconds > 0 else None)
+    rtf = f", rtf {result.rtf:.3f}" if result.rtf is not None else ""
+    print(f"{name}: {wall_seconds:.2f}s wall, {cpu_seconds:.2f}s cpu, "
+          f"{peak_rss / 1024 ** 2:.0f}MB rss{rtf}")
+    return result
+
+
+def get_signal_to_distortion(reference: Dict[str, np.ndarray],
+                             estimate: Dict[str, np.ndarray]) -> float:
+    """
+    Compare stems with reference stems
+    Args:
+        reference: Dict[str, np.ndarray]: stem name -> reference waveform
+        estimate: Dict[str, np.ndarray]: stem name -> waveform to compare
+    Returns:
+        float: signal to distortion ratio in dB, averaged over stems (inf: identical)
+    """
+    ratios = []
+    for stem, expected in reference.items():
+        expected = np.asarray(expected, dtype=np.float64)
+        error = np.sum(np.square(expected - np.asarray(estimate[stem], dtype=np.float64)))
+        signal = np.sum(np.square(expected))
+        if error == 0.0:
+            ratios.append(float("inf"))
+        elif signal > 0.0:
+            ratios.append(10.0 * np.log10(signal / error))
+    return float(np.mean(ratios)) if ratios else float("inf")
+
+
+def make_synthetic_audio(path: Path, seconds: float, seed: int = 0) -> Path:
+    """
+    Write a stereo 44.1kHz wav with a chord, a bass line, clicks and noise
+    Args:
+        path: Path: output wav path
+        seconds: float: length
+        seed: int: random seed
+    Returns:
+        Path: output wav path
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SPLEETER_SAMPLE_RATE)) / SPLEETER_SAMPLE_RATE
+    signal = sum(0.1 * np.sin(2 * np.pi * f * t) for f in (261.6, 329.6, 392.0))
+    signal += 0.2 * np.sin(2 * np.pi * 55.0 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    signal += 0.3 * (np.mod(t, 0.5) < 0.01) * rng.standard_normal(t.shape[0])
+    signal += 0.02 * rng.standard_normal(t.shape[0])
+    stereo = np.stack([signal, np.roll(signal, 100)], axis=-1)
+    pcm = (np.clip(stereo, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(SPLEETER_SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def run_benchmarks(work_path: Path,
+                   model_specs: List[str],
+                   codecs: List[Codec],
+                   synthetic_seconds: float = 30.0,
+                   batch_files: int = 4,
+                   use_demo_audio: bool = True) -> List[BenchmarkResult]:
+    """
+    Run all benchmark cases
+    Args:
+        work_path: Path: scratch directory (inputs and outputs)
+        model_specs: List[str]: models to benchmark (see parse_model_spec)
+        codecs: List[Codec]: codecs to benchmark
+        synthetic_seconds: float: length of synthetic inputs
+        batch_files: int: number of files of the batch case
+        use_demo_audio: bool: benchmark demo_audio/example.mp3 too
+    Returns:
+        List[BenchmarkResult]: measurements
+    """
+    input_path = work_path / "input"
+    input_path.mkdir(parents=True, exist_ok=True)
+    inputs = {"synthetic": make_synthetic_audio(input_path / "synthetic.wav", synthetic_seconds)}
+    if use_demo_audio and DEMO_AUDIO.exists():
+        inputs["example"] = DEMO_AUDIO
+    configs = [parse_model_spec(spec) for spec in model_specs]
+    results: List[BenchmarkResult] = []
+
+    # model load: checkpoint restore and a first run on 1 s of silence
+    for spec, config in zip(model_specs, configs):
+        separator_pool.clear()
+        results.append(measure(f"model_load:{spec}", lambda: warm_up_separator(config)))
+
+    for input_name, audio_file in inputs.items():
+        seconds = get_audio_duration(audio_file)
+        waveform = load_stereo_waveform(audio_file)
+        results.append(measure(
+            f"decode:{input_name}", lambda: load_stereo_waveform(audio_file), seconds))
+        results.append(measure(
+            f"stft:{input_name}", lambda: compute_stft(waveform), seconds))
+        stft = compute_stft(waveform)
+
+        references: Dict[tuple, Dict[str, np.ndarray]] = {}
+        for spec, config in zip(model_specs, configs):
+            with separator_pool.acquire(config) as separator:
+                # load outside of the measurement
+                separator.separate(np.zeros((SPLEETER_SAMPLE_RATE, 2), dtype=np.float32))
+                stems: Dict[str, np.ndarray] = {}
+
+                def separate():
+                    stems.update(separator.separate_stft(stft, waveform.shape[0]))
+                result = measure(f"separation:{spec}:{input_name}", separate, seconds)
+
+            # quality against the stock graph of the same model
+            if config.backend is not InferenceBackend.TENSORFLOW:
+                reference_config = replace(config, backend=InferenceBackend.TENSORFLOW)
+                reference_key = (config.split_mode, config.use16kHZ, config.usemwf)
+                if reference_key not in references:
+                    with separator_pool.acquire(reference_config) as separator:
+                        references[reference_key] = separator.separate_stft(stft, waveform.shape[0])
+                result.quality_db = get_signal_to_distortion(references[reference_key], stems)
+                print(f"{result.name}: {result.quality_db:.1f}dB against tensorflow")
+            results.append(result)
+
+        encode_path = work_path / "encode"
+        encode_path.mkdir(exist_ok=True)
+        for codec in codecs:
+            results.append(measure(
+                f"encode:{codec.value}:{input_name}",
+                lambda: encode_raw_stem(waveform, encode_path / f"{input_name}.{codec.value}",
+                                        codec, 192), seconds))
+
+        # cold: empty output directory, warm: everything cached
+        for spec, config in zip(model_specs, configs):
+            output_path = work_path / f"output-{spec}-{input_name}"
+            for run in ("cold", "warm"):
+                results.append(measure(
+                    f"zip:{spec}:{input_name}:{run}",
+                    lambda: get_audio_separated_zip(config, audio_file, output_path), seconds))
+
+    batch_path = input_path / "batch"
+    batch_path.mkdir(exist_ok=True)
+    batch = [make_synthetic_audio(batch_path / f"clip{i}.wav", synthetic_seconds / 2, seed=i + 1)
+             for i in range(batch_files)]
+    for spec, config in zip(model_specs, configs):
+        output_path = work_path / f"output-{spec}-batch"
+        results.append(measure(
+            f"multi_zip:{spec}:{batch_files}files",
+            lambda: get_multi_audio_separated_zip(config, batch, output_path, lambda x: None),
+            synthetic_seconds / 2 * batch_files))
+    return results
+
+
+def compare_results(results: List[dict], baseline: List[dict],
+                    threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Compare results with a baseline
+    Args:
+        results: List[dict]: current results (BenchmarkResult as dict)
+        baseline: List[dict]: baseline results
+        threshold: float: allowed relative slowdown (EX: 0.2 for 20%)
+    Returns:
+        List[str]: regression messages (empty: no regression)
+    """
+    baseline_by_name = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_name.get(result["name"])
+        if base is None:
+            continue
+        for metric in ("wall_seconds", "peak_rss_bytes"):
+            if base[metric] > 0 and result[metric] > base[metric] * (1.0 + threshold):
+                regressions.append(
+                    f"{result['name']}: {metric} {result[metric]:.6g} > "
+                    f"baseline {base[metric]:.6g} (+{result[metric] / base[metric] - 1.0:.0%})")
+        quality, base_quality = result.get("quality_db"), base.get("quality_db")
+        if quality is not None and base_quality is not None \
+                and quality < base_quality - QUALITY_TOLERANCE_DB:
+            regressions.append(
+                f"{result['name']}: quality_db {quality:.1f} < baseline {base_quality:.1f}")
+    return regressions
+
+
+def get_environment() -> Dict[str, object]:
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "intra_op_threads": backends.INTRA_OP_THREADS,
+        "inter_op_threads": backends.INTER_OP_THREADS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark spleeter_stremlit separation and packaging")
+    parser.add_argument("--models", default="2stems,4stems",
+                        help="comma separated models, EX: 2stems,4stems-mwf,5stems-16kHz,"
+                             "4stems-tflite16 (backends: frozen, tflite16, tflite8)")
+    parser.add_argument("--intra-op-threads", type=int, default=backends.INTRA_OP_THREADS,
+                        help="threads inside one op (default: SPLEETER_INTRA_OP_THREADS, 0: all cores)")
+    parser.add_argument("--inter-op-threads", type=int, default=backends.INTER_OP_THREADS,
+                        help="ops run at the same time (default: SPLEETER_INTER_OP_THREADS)")
+    parser.add_argument("--codecs", default="wav,mp3",
+                        help="comma separated codecs, EX: wav,mp3,m4a")
+    parser.add_argument("--seconds", type=float, default=30.0,
+                        help="length of synthetic inputs")
+    parser.add_argument("--batch-files", type=int, default=4,
+                        help="number of files of the batch case")
+    parser.add_argument("--no-demo-audio", action="store_true",
+                        help="skip demo_audio/example.mp3")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="result json path")
+    parser.add_argument("--baseline", default=None,
+                        help="baseline json path to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--work-dir", default=None,
+                        help="scratch directory (default: temporary, removed afterwards)")
+    args = parser.parse_args()
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+
+    work_path = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="spleeter-bench-"))
+    try:
+        results = run_benchmarks(
+            work_path,
+            [spec.strip() for spec in args.models.split(",") if spec.strip()],
+            [Codec(codec.strip()) for codec in args.codecs.split(",") if codec.strip()],
+            args.seconds, args.batch_files, not args.no_demo_audio)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    report = {"environment": get_environment(),
+              "results": [asdict(result) for result in results]}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"saved: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_results(report["results"], baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"no regression over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
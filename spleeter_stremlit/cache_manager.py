@@ -0,0 +1,282 @@
+import argparse
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import UPLOAD_OBJECTS_DIR_NAME, MediaCatalog, get_catalog
+
+# byte budget of output (and optionally upload) files, EX: "20G" (empty: no limit)
+CACHE_BUDGET = os.environ.get("SPLEETER_CACHE_BUDGET", "")
+# evict uploaded audio too when over budget
+CACHE_EVICT_UPLOADS = os.environ.get("SPLEETER_CACHE_EVICT_UPLOADS", "") == "1"
+# byte budget of the decoded audio and stft cache, kept on top of CACHE_BUDGET
+ANALYSIS_CACHE_BUDGET = os.environ.get("SPLEETER_ANALYSIS_BUDGET", "4G")
+# leftover working directories older than this are removed
+STALE_TMP_SECONDS = 24 * 3600
+
+# cost-aware LRU: entries which are expensive to recreate are kept longer.
+# an entry is evicted as if it was last used this many seconds later.
+KIND_RETENTION_SECONDS = {
+    "zip": 0,  # re-zipped from encoded stems
+    "preview": 0,  # a few seconds of separation
+    "remix": 0,  # mixed again from raw stems
+    "rendition": 0,  # excerpt and peaks made again from the output
+    "analysis": 0,  # decoded and transformed again
+    "cache": 3600,  # re-encoded from raw stems
+    "raw": 24 * 3600,  # needs the model again
+    "upload": 7 * 24 * 3600,  # cannot be recreated
+}
+
+
+def parse_size(size: str) -> Optional[int]:
+    """
+    Parse a byte size like "500M" or "20G"
+    Args:
+        size: str: size with optional K/M/G/T suffix (empty: no limit)
+    Returns:
+        Optional[int]: bytes, None for no limit
+    """
+    if not size.strip():
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", size, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"invalid size: {size}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    kind: str
+    path: Path
+    size: int
+    last_access: float
+    audio_hash: Optional[str]
+
+    @property
+    def priority(self) -> float:
+        return self.last_access + KIND_RETENTION_SECONDS.get(self.kind, 0)
+
+
+@dataclass
+class EvictionReport:
+    usage: int
+    budget: Optional[int]
+    evicted: List[CacheEntry]
+    pinned: int
+
+    @property
+    def freed(self) -> int:
+        return sum(entry.size for entry in self.evicted)
+
+
+class CacheManager:
+    """
+    Keep output (and optionally upload) files within a byte budget.
+    Entries are evicted by cost-aware LRU; entries pinned by running jobs
+    or open sessions are skipped.
+    Attributes:
+        output_path (Path): output root path
+        upload_path (Path): upload directory
+        budget (Optional[int]): byte budget, None for no limit
+        evict_uploads (bool): evict uploaded audio too
+        kind_budgets (Dict[str, int]): byte budgets of single kinds (EX: analysis)
+    """
+
+    def __init__(self, output_path: Path, upload_path: Path,
+                 budget: Optional[int] = parse_size(CACHE_BUDGET),
+                 evict_uploads: bool = CACHE_EVICT_UPLOADS,
+                 kind_budgets: Optional[Dict[str, Optional[int]]] = None):
+        self.output_path = Path(output_path)
+        self.upload_path = Path(upload_path)
+        self.budget = budget
+        self.evict_uploads = evict_uploads
+        if kind_budgets is None:
+            kind_budgets = {"analysis": parse_size(ANALYSIS_CACHE_BUDGET)}
+        self.kind_budgets = {kind: kind_budget for kind, kind_budget in kind_budgets.items()
+                             if kind_budget is not None}
+
+    @property
+    def catalog(self) -> MediaCatalog:
+        return get_catalog(self.output_path)
+
+    def list_entries(self) -> List[CacheEntry]:
+        entries = [
+            CacheEntry(row["key"], row["kind"], Path(row["path"]), row["size"],
+                       row["last_access"], row["audio_hash"])
+            for row in self.catalog.list_all_outputs()
+        ]
+        if self.evict_uploads:
+            upload_path = str(self.upload_path.absolute()) + os.sep
+            for row in self.catalog.list_all_media():
+                if row["path"].startswith(upload_path):
+                    entries.append(CacheEntry(
+                        row["path"], "upload", Path(row["path"]), row["size"],
+                        row["added_at"], row["hash"]))
+        return entries
+
+    def get_usage(self, entries: List[CacheEntry]) -> int:
+        # hard linked uploads with the same content take disk only once
+        upload_hashes = set()
+        usage = 0
+        for entry in entries:
+            if entry.kind == "upload":
+                if entry.audio_hash in upload_hashes:
+                    continue
+                upload_hashes.add(entry.audio_hash)
+            usage += entry.size
+        return usage
+
+    def _remove(self, entry: CacheEntry):
+        if entry.kind == "upload":
+            if entry.path.exists():
+                os.remove(entry.path)
+            self.catalog.remove_media(entry.path)
+            # drop stored content when no other name links to it
+            others = [row for row in self.catalog.list_all_media()
+                      if row["hash"] == entry.audio_hash]
+            if not others:
+                for object_file in (self.upload_path / UPLOAD_OBJECTS_DIR_NAME).glob(
+                        f"{entry.audio_hash}*"):
+                    os.remove(object_file)
+            return
+        if entry.path.is_dir():
+            shutil.rmtree(entry.path, ignore_errors=True)
+            # outputs written inside the entry go with it (EX: single file zips)
+            self.catalog.remove_outputs_under(entry.path)
+        elif entry.path.exists():
+            os.remove(entry.path)
+        self.catalog.remove_output(entry.key)
+
+    def evict(self, dry_run: bool = False) -> EvictionReport:
+        """
+        Evict entries until usage fits the kind budgets and the budget
+        Args:
+            dry_run: bool: only report what would be evicted
+        Returns:
+            EvictionReport: report
+        """
+        entries = self.list_entries()
+        report = EvictionReport(usage=self.get_usage(entries), budget=self.budget,
+                                evicted=[], pinned=0)
+        pinned_keys: Optional[set] = None
+
+        budgets: List[Tuple[Optional[str], int]] = list(self.kind_budgets.items())
+        if self.budget is not None:
+            budgets.append((None, self.budget))
+        for kind, budget in budgets:
+            candidates = [entry for entry in entries
+                          if (kind is None or entry.kind == kind) and entry not in report.evicted]
+            usage = self.get_usage(candidates)
+            if usage <= budget:
+                continue
+            if pinned_keys is None:
+                pinned_keys = self.catalog.pinned_keys()
+            for entry in sorted(candidates, key=lambda x: x.priority):
+                if usage <= budget:
+                    break
+                if entry.key in pinned_keys or entry.audio_hash in pinned_keys:
+                    report.pinned += 1
+                    continue
+                if not dry_run:
+                    self._remove(entry)
+                    self.catalog.increment_stat(f"{entry.kind}_eviction")
+                usage -= entry.size
+                report.evicted.append(entry)
+        report.usage -= report.freed
+        return report
+
+    def remove_stale_tmp(self) -> int:
+        """
+        Remove working directories and files left by crashed runs
+        Returns:
+            int: number of removed items
+        """
+        removed = 0
+        now = time.time()
+        for tmp in list(self.output_path.glob("*/.tmp-*")) + \
+                list(self.output_path.glob("*.zip.tmp-*")) + \
+                list(self.output_path.glob("*/*/*.zip.tmp-*")) + \
+                list(self.upload_path.glob(".tmp-*")) + \
+                list((self.upload_path / UPLOAD_OBJECTS_DIR_NAME).glob(".tmp-*")):
+            if now - tmp.stat().st_mtime < STALE_TMP_SECONDS:
+                continue
+            if tmp.is_dir():
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                os.remove(tmp)
+            removed += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get hit, miss and eviction counters and current usage
+        Returns:
+            Dict[str, int]: statistics
+        """
+        entries = self.list_entries()
+        stats = self.catalog.get_stats()
+        stats["usage_bytes"] = self.get_usage(entries)
+        stats["entries"] = len(entries)
+        if self.budget is not None:
+            stats["budget_bytes"] = self.budget
+        return stats
+
+
+def enforce_cache_budget(output_path: Path, upload_path: Path) -> Optional[EvictionReport]:
+    """
+    Evict entries if a budget is configured by SPLEETER_CACHE_BUDGET
+    or SPLEETER_ANALYSIS_BUDGET
+    Returns:
+        Optional[EvictionReport]: report, None if no budget is configured
+    """
+    cache_manager = CacheManager(output_path, upload_path)
+    if cache_manager.budget is None and not cache_manager.kind_budgets:
+        return None
+    report = cache_manager.evict()
+    if report.evicted:
+        print(f"cache: evicted {len(report.evicted)} entries ({report.freed} bytes)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintain spleeter_stremlit output and upload caches")
+    parser.add_argument("--output-dir", default="./output/")
+    parser.add_argument("--upload-dir", default="./upload_files/")
+    parser.add_argument("--budget", default=CACHE_BUDGET,
+                        help="byte budget, EX: 500M, 20G (default: SPLEETER_CACHE_BUDGET)")
+    parser.add_argument("--analysis-budget", default=ANALYSIS_CACHE_BUDGET,
+                        help="byte budget of decoded audio and stft (default: SPLEETER_ANALYSIS_BUDGET)")
+    parser.add_argument("--evict-uploads", action="store_true",
+                        default=CACHE_EVICT_UPLOADS, help="evict uploaded audio too")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only show what would be evicted")
+    parser.add_argument("--stats", action="store_true",
+                        help="show hit, miss and eviction statistics")
+    args = parser.parse_args()
+
+    cache_manager = CacheManager(
+        Path(args.output_dir), Path(args.upload_dir),
+        parse_size(args.budget), args.evict_uploads,
+        {"analysis": parse_size(args.analysis_budget)})
+    if not args.dry_run:
+        print(f"removed stale temporary files: {cache_manager.remove_stale_tmp()}")
+    report = cache_manager.evict(dry_run=args.dry_run)
+    for entry in report.evicted:
+        print(f"{'would evict' if args.dry_run else 'evicted'}: "
+              f"[{entry.kind}] {entry.path} ({entry.size} bytes)")
+    print(f"usage: {report.usage} bytes, budget: {report.budget}, "
+          f"freed: {report.freed} bytes, pinned skipped: {report.pinned}")
+    if args.stats:
+        for name, value in sorted(cache_manager.get_stats().items()):
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
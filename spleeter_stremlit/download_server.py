@@ -0,0 +1,320 @@
+import mimetypes
+import os
+import re
+import socket
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from metrics import metrics_registry
+
+# port of the download server running next to streamlit
+DOWNLOAD_PORT = int(os.environ.get("SPLEETER_DOWNLOAD_PORT", "8502"))
+# listen address; the server has no authentication (EX: 0.0.0.0 behind a reverse proxy)
+DOWNLOAD_HOST = os.environ.get("SPLEETER_DOWNLOAD_HOST", "127.0.0.1")
+
+
+def get_browser_host(host: str) -> str:
+    """
+    Get the url host of a listen address
+    Args:
+        host: str: listen address (EX: 127.0.0.1, 0.0.0.0)
+    Returns:
+        str: host for browser urls (EX: localhost, the machine name for all interfaces)
+    """
+    if host in ("", "0.0.0.0", "::"):
+        return socket.gethostname()
+    if host in ("127.0.0.1", "::1"):
+        return "localhost"
+    return f"[{host}]" if ":" in host else host
+
+
+# url of the download server as seen from the browser (EX: behind a reverse proxy),
+# by default its listen address and port
+DOWNLOAD_URL = os.environ.get(
+    "SPLEETER_DOWNLOAD_URL",
+    f"http://{get_browser_host(DOWNLOAD_HOST)}:{DOWNLOAD_PORT}").rstrip("/")
+
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single http byte range
+    Args:
+        range_header: Optional[str]: value of Range header (EX: bytes=0-1023)
+        file_size: int: size of the requested file
+    Returns:
+        Optional[Tuple[int, int]]: (first byte, last byte) inclusive, None to send the whole file
+    Raises:
+        ValueError: if the range is not satisfiable
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    # multiple ranges or other units: send the whole file
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # suffix range: last n bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(range_header)
+        return max(0, file_size - length), file_size - 1
+    first = int(first)
+    last = file_size - 1 if last == "" else min(int(last), file_size - 1)
+    if first >= file_size or first > last:
+        raise ValueError(range_header)
+    return first, last
+
+
+# output kinds which are served; catalog, logs, decoded audio and raw stems are not
+SERVED_OUTPUT_DIRS = {"cache", "remix", "rendition"}
+
+
+def is_served_path(relative_path: Path) -> bool:
+    """
+    Check if a file under the output root may be downloaded
+    Args:
+        relative_path: Path: path relative to the output root
+    Returns:
+        bool: True for outputs (stems, remixes, renditions, zips), never for dot-files
+    """
+    parts = relative_path.parts
+    if not parts or any(part.startswith(".") for part in parts):
+        return False
+    if len(parts) == 1:
+        # batch zips are kept at the output root
+        return relative_path.suffix == ".zip"
+    return parts[0] in SERVED_OUTPUT_DIRS
+
+
+# bytes per http chunk of a stream
+STREAM_CHUNK_SIZE = 64 * 1024
+# streams kept for download, the oldest are dropped
+MAX_STREAMS = 100
+
+
+class ChunkedWriter:
+    """
+    Write a body of unknown length as http/1.1 chunked transfer encoding
+    Attributes:
+        bytes_written (int): body bytes written so far
+    """
+
+    def __init__(self, wfile: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.bytes_written = 0
+        self._wfile = wfile
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._wfile.write(b"%x\r\n" % len(self._buffer) + bytes(self._buffer) + b"\r\n")
+            self._buffer.clear()
+        self._wfile.flush()
+
+    def close(self):
+        # the last chunk tells the client the body is complete
+        self.flush()
+        self._wfile.write(b"0\r\n\r\n")
+        self._wfile.flush()
+
+
+class DownloadRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve outputs under server.root as /files/<relative path>[?name=<download name>]
+    with range support; the body is sent by sendfile in chunks.
+    Only artifact kinds are served (see is_served_path).
+    Bodies written on request (see add_stream) are served as /streams/<key>
+    with chunked transfer encoding, without range support.
+    Metrics of this process are served as /metrics in prometheus text format.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _resolve(self) -> Optional[Path]:
+        url = urlparse(self.path)
+        if not url.path.startswith("/files/"):
+            return None
+        root = self.server.root.resolve()
+        file_path = (root / unquote(url.path[len("/files/"):])).resolve()
+        if root not in file_path.parents or not file_path.is_file() \
+                or not is_served_path(file_path.relative_to(root)):
+            return None
+        return file_path
+
+    def _serve_metrics(self, send_body: bool):
+        body = metrics_registry.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve_stream(self, send_body: bool):
+        key = unquote(urlparse(self.path).path[len("/streams/"):])
+        with self.server.streams_lock:
+            stream = self.server.streams.get(key)
+        if stream is None:
+            self.send_error(404)
+            return
+        download_name, write = stream
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(
+            download_name)[0] or "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header(
+            "Content-Disposition", f"attachment; filename*=UTF-8''{quote(download_name)}")
+        self.end_headers()
+        if not send_body:
+            return
+        writer = ChunkedWriter(self.wfile)
+        try:
+            write(writer)
+        except Exception as e:
+            # without the last chunk the client sees an incomplete download
+            print(f"{download_name} : stream failed ({e!r})")
+            self.close_connection = True
+            return
+        writer.close()
+        metrics_registry.inc("spleeter_download_bytes_total", writer.bytes_written)
+
+    def _serve(self, send_body: bool):
+        if urlparse(self.path).path == "/metrics":
+            self._serve_metrics(send_body)
+            return
+        if urlparse(self.path).path.startswith("/streams/"):
+            self._serve_stream(send_body)
+            return
+        file_path = self._resolve()
+        if file_path is None:
+            self.send_error(404)
+            return
+        download_name = parse_qs(urlparse(self.path).query).get(
+            "name", [file_path.name])[0]
+
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            try:
+                byte_range = parse_range_header(
+                    self.headers.get("Range"), file_size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{file_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if byte_range is None:
+                first, last = 0, file_size - 1
+                self.send_response(200)
+            else:
+                first, last = byte_range
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", f"bytes {first}-{last}/{file_size}")
+            self.send_header("Content-Type", mimetypes.guess_type(
+                download_name)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(last - first + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header(
+                "Content-Disposition", f"attachment; filename*=UTF-8''{quote(download_name)}")
+            self.end_headers()
+            if send_body and last >= first:
+                self.connection.sendfile(f, first, last - first + 1)
+                metrics_registry.inc("spleeter_download_bytes_total", last - first + 1)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root: Path, port: int = DOWNLOAD_PORT, host: str = DOWNLOAD_HOST):
+        self.root = Path(root)
+        # key -> (download name, body writer), see add_stream
+        self.streams: "OrderedDict[str, Tuple[str, Callable[[BinaryIO], None]]]" = OrderedDict()
+        self.streams_lock = threading.Lock()
+        super().__init__((host, port), DownloadRequestHandler)
+
+
+_download_server: Optional[DownloadServer] = None
+_download_server_lock = threading.Lock()
+
+
+def start_download_server(root: Path, port: int = DOWNLOAD_PORT) -> Optional[DownloadServer]:
+    """
+    Start the download server once per process
+    Args:
+        root: Path: served directory
+        port: int: listen port
+    Returns:
+        Optional[DownloadServer]: running server, None if the port is not available
+    """
+    global _download_server
+    with _download_server_lock:
+        if _download_server is None:
+            os.makedirs(root, exist_ok=True)
+            try:
+                _download_server = DownloadServer(root, port)
+            except OSError as e:
+                print(f"download server is not available: {e}")
+                return None
+            threading.Thread(target=_download_server.serve_forever,
+                             name="spleeter-download", daemon=True).start()
+        return _download_server
+
+
+def get_download_url(server: DownloadServer, file_path: Path,
+                     download_name: Optional[str] = None) -> str:
+    """
+    Get browser url of a served file
+    Args:
+        server: DownloadServer: running server
+        file_path: Path: file under server.root
+        download_name: Optional[str]: file name shown by the browser
+    Returns:
+        str: download url
+    """
+    relative_path = Path(file_path).resolve().relative_to(server.root.resolve())
+    url = f"{DOWNLOAD_URL}/files/{quote(relative_path.as_posix())}"
+    if download_name is not None:
+        url += f"?name={quote(download_name)}"
+    return url
+
+
+def add_stream(server: DownloadServer, key: str, download_name: str,
+               write: Callable[[BinaryIO], None]) -> str:
+    """
+    Serve a body written on request, EX: a zip built while it is downloaded
+    Args:
+        server: DownloadServer: running server
+        key: str: stream key (adding the same key again replaces the stream)
+        download_name: str: file name shown by the browser
+        write: Callable[[BinaryIO], None]: writes the body to the given file object
+    Returns:
+        str: download url
+    """
+    with server.streams_lock:
+        server.streams[key] = (download_name, write)
+        server.streams.move_to_end(key)
+        while len(server.streams) > MAX_STREAMS:
+            server.streams.popitem(last=False)
+    return f"{DOWNLOAD_URL}/streams/{quote(key)}"
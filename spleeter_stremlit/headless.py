@@ -0,0 +1,311 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# app modules import each other by file name, as when run by `streamlit run`;
+# keep that working when imported as spleeter_stremlit.headless (console script)
+if str(Path(__file__).parent) not in sys.path:
+    sys.path.insert(0, str(Path(__file__).parent))
+
+from spleeter.audio import Codec  # noqa: E402
+
+from cache_manager import enforce_cache_budget  # noqa: E402
+from utils import (BATCH_WORKERS, BatchResult, SpleeterSettings,  # noqa: E402
+                   get_audio_hash, get_cache_key, get_multi_audio_separated_zip,
+                   get_output_settings_dict, get_output_stems, parse_model_spec,
+                   pinned, separate_batch, separate_packed)
+
+# same directories as the web app, so both share one cache
+OUTPUT_PATH = Path("./output/")
+UPLOAD_PATH = Path("./upload_files/")
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+
+class JobJournal:
+    """
+    Append-only json lines journal of finished files.
+    A file is done when its last entry for the same content and settings is
+    "done" and every output still exists, so a crashed or restarted run
+    skips it. A torn last line (EX: killed while writing) is ignored.
+    Attributes:
+        path (Path): journal path
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        if not self.path.exists():
+            return
+        text = self.path.read_text()
+        for line in text.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._entries[entry["key"]] = entry
+        if text and not text.endswith("\n"):
+            # terminate a torn line so that the next entry starts on its own line
+            with open(self.path, 'a') as f:
+                f.write("\n")
+
+    def get_outputs(self, key: str) -> Optional[List[Path]]:
+        """
+        Get outputs of a finished file
+        Args:
+            key: str: journal key (see get_journal_key)
+        Returns:
+            Optional[List[Path]]: outputs, None if not done or an output is gone
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry["status"] != "done":
+            return None
+        outputs = [Path(output) for output in entry["outputs"]]
+        if not all(output.exists() for output in outputs):
+            return None
+        return outputs
+
+    def record(self, key: str, result: BatchResult):
+        """
+        Append the result of one file and flush it to disk
+        Args:
+            key: str: journal key (see get_journal_key)
+            result: BatchResult: result of the file
+        """
+        entry = {
+            "key": key,
+            "file": str(result.audio_file),
+            "status": "done" if result.error is None else "failed",
+            "outputs": [str(stem) for stem in result.stems],
+            "error": result.error,
+            "time": time.time(),
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[key] = entry
+
+
+def get_journal_key(config: SpleeterSettings, audio_file: Path, output_path: Path) -> str:
+    """
+    Get journal key of a file: same content with same settings is the same job
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        str: journal key
+    """
+    return get_cache_key(get_audio_hash(audio_file, output_path),
+                         get_output_settings_dict(config))
+
+
+def expand_inputs(patterns: List[str], manifests: Optional[List[Path]] = None) -> List[Path]:
+    """
+    Expand glob patterns and manifests into audio files
+    A manifest is a json list of paths or a text file with one path per line
+    (blank lines and lines starting with # are skipped); relative paths are
+    relative to the manifest.
+    Args:
+        patterns: List[str]: file paths or glob patterns (EX: music/**/*.mp3)
+        manifests: Optional[List[Path]]: manifest paths
+    Returns:
+        List[Path]: existing files in input order, without duplicates
+    Raises:
+        FileNotFoundError: if a plain path (not a pattern) does not exist
+    """
+    files: List[Path] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            files.extend(Path(path) for path in sorted(glob.glob(pattern, recursive=True)))
+        elif Path(pattern).exists():
+            files.append(Path(pattern))
+        else:
+            raise FileNotFoundError(pattern)
+    for manifest in manifests or []:
+        manifest = Path(manifest)
+        text = manifest.read_text()
+        if manifest.suffix == ".json":
+            entries = [str(entry) for entry in json.loads(text)]
+        else:
+            entries = [line.strip() for line in text.splitlines()
+                       if line.strip() and not line.strip().startswith("#")]
+        files.extend(path if path.is_absolute() else manifest.parent / path
+                     for path in map(Path, entries))
+
+    unique: Dict[Path, Path] = {}
+    for file in files:
+        if file.is_file():
+            unique.setdefault(file.resolve(), file)
+    return list(unique.values())
+
+
+@dataclass
+class HeadlessReport:
+    """
+    Result of a headless run
+    Attributes:
+        results (List[BatchResult]): results in input order
+        skipped (int): files already done according to the journal
+        zip_file (Optional[Path]): zip of every separated file (None: not zipped)
+    """
+    results: List[BatchResult] = field(default_factory=list)
+    skipped: int = 0
+    zip_file: Optional[Path] = None
+
+    @property
+    def failed(self) -> List[BatchResult]:
+        return [result for result in self.results if result.error is not None]
+
+
+def run_batch(config: SpleeterSettings,
+              audio_files: List[Path],
+              output_path: Path = OUTPUT_PATH,
+              upload_path: Path = UPLOAD_PATH,
+              workers: int = BATCH_WORKERS,
+              journal: Optional[JobJournal] = None,
+              make_zip: bool = False,
+              progress_callback: Callable[[float], None] = lambda x: None) -> HeadlessReport:
+    """
+    Separate audio files without the web UI, with the same engine and cache.
+    Every finished file is journaled, so a rerun after a crash or restart only
+    separates files which are not done yet.
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_files: List[Path]: audio file paths
+        output_path: Path: output root path (default: the web app's ./output/)
+        upload_path: Path: upload root path, for cache budget enforcement
+        workers: int: number of worker processes (1: run in-process)
+        journal: Optional[JobJournal]: journal (default: output_path/journal.jsonl)
+        make_zip: bool: zip every separated file as the batch mode of the web app does
+        progress_callback: Callable[[float], None]: called with done files ratio,
+            counting the done part of running files
+    Returns:
+        HeadlessReport: results
+    """
+    if journal is None:
+        journal = JobJournal(output_path / JOURNAL_FILE_NAME)
+    report = HeadlessReport()
+    keys = [get_journal_key(config, audio_file, output_path) for audio_file in audio_files]
+    results: Dict[int, BatchResult] = {}
+    pending: List[int] = []
+    for i, (audio_file, key) in enumerate(zip(audio_files, keys)):
+        outputs = journal.get_outputs(key)
+        if outputs is None:
+            pending.append(i)
+        else:
+            print(f"{audio_file.name} : already done")
+            results[i] = BatchResult(audio_file, outputs)
+    report.skipped = len(results)
+
+    pending_files = [audio_files[i] for i in pending]
+    key_by_file = {audio_files[i]: keys[i] for i in pending}
+    audio_hashes = [get_audio_hash(audio_file, output_path) for audio_file in audio_files]
+    with pinned(output_path, audio_hashes, owner=f"headless-{uuid.uuid4().hex}"):
+        if pending_files:
+            def report_done(ratio: float):
+                progress_callback((report.skipped + ratio * len(pending_files)) / len(audio_files))
+
+            separate_packed(config, pending_files, output_path, progress_callback=lambda x: None)
+            batch_results = separate_batch(
+                config, pending_files, output_path, report_done, max_workers=workers,
+                result_callback=lambda result: journal.record(key_by_file[result.audio_file], result))
+            results.update(zip(pending, batch_results))
+        report.results = [results[i] for i in range(len(audio_files))]
+
+        separated = [result.audio_file for result in report.results if result.error is None]
+        if make_zip and separated:
+            # everything is cached by now: only zips
+            report.zip_file = get_multi_audio_separated_zip(
+                config, separated, output_path, lambda x: None)
+        enforce_cache_budget(output_path, upload_path)
+    progress_callback(1.0)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Separate audio files without the web UI, sharing its cache")
+    parser.add_argument("inputs", nargs="*",
+                        help="audio files or glob patterns, EX: 'music/**/*.mp3'")
+    parser.add_argument("--manifest", action="append", default=[],
+                        help="file listing inputs (json list or one path per line), repeatable")
+    parser.add_argument("--model", default="2stems",
+                        help="model spec, EX: 2stems, 4stems-16kHz, 5stems-mwf, 4stems-tflite16")
+    parser.add_argument("--stems", default="",
+                        help="comma separated stems to output (default: every stem of the model)")
+    parser.add_argument("--codec", default=Codec.MP3.value,
+                        choices=[codec.value for codec in Codec])
+    parser.add_argument("--bitrate", type=int, default=192)
+    parser.add_argument("--duration", type=int, default=0,
+                        help="separate only the first seconds (default: 0 for whole audio)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="separate in overlapping chunks with constant memory")
+    parser.add_argument("--skip-silence", action="store_true",
+                        help="don't run the model on silent parts (threshold: SPLEETER_SILENCE_DB)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="model threads inside one op (default: 0 for SPLEETER_INTRA_OP_THREADS, "
+                             "or cpu cores shared by the workers)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="worker processes (default: SPLEETER_BATCH_WORKERS)")
+    parser.add_argument("--zip", action="store_true",
+                        help="zip every separated file, as the batch mode of the web app")
+    parser.add_argument("--output-dir", default=str(OUTPUT_PATH))
+    parser.add_argument("--upload-dir", default=str(UPLOAD_PATH))
+    parser.add_argument("--journal", default=None,
+                        help="job journal path (default: <output-dir>/journal.jsonl)")
+    args = parser.parse_args()
+
+    model = parse_model_spec(args.model)
+    config = SpleeterSettings(
+        model.split_mode, Codec(args.codec), args.bitrate,
+        usemwf=model.usemwf, use16kHZ=model.use16kHZ, backend=model.backend,
+        duration=args.duration or None, streaming=args.streaming,
+        stems=[stem.strip() for stem in args.stems.split(",") if stem.strip()] or None,
+        skip_silence=args.skip_silence, threads=args.threads)
+    try:
+        get_output_stems(config)
+        audio_files = expand_inputs(args.inputs, [Path(m) for m in args.manifest])
+    except (ValueError, FileNotFoundError) as e:
+        parser.error(str(e))
+    if not audio_files:
+        parser.error("no input files")
+
+    output_path = Path(args.output_dir)
+    journal = JobJournal(Path(args.journal) if args.journal else output_path / JOURNAL_FILE_NAME)
+    # progress moves by inference chunk: print each percent once
+    printed = [-1]
+
+    def print_progress(progress: float):
+        if int(progress * 100) > printed[0]:
+            printed[0] = int(progress * 100)
+            print(f"progress: {printed[0]}%")
+
+    report = run_batch(config, audio_files, output_path, Path(args.upload_dir),
+                       args.workers, journal, args.zip, print_progress)
+
+    for result in report.results:
+        outputs = ", ".join(str(stem) for stem in result.stems)
+        print(f"{result.audio_file} : {outputs if result.error is None else result.error}")
+    if report.zip_file is not None:
+        print(f"zip: {report.zip_file}")
+    print(f"{len(report.results) - len(report.failed)} done "
+          f"({report.skipped} from journal), {len(report.failed)} failed")
+    if report.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
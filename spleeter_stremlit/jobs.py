@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache_manager import enforce_cache_budget
+from progress import ProgressState, get_progress_listener, observing, tracking
+from utils import (SpleeterSettings, StemMix, ZipOutput, get_audio_hash,
+                   get_file_hash, get_output_settings_dict, get_remix,
+                   get_split_audio, get_split_stages, make_renditions,
+                   make_split_tracker, pinned, prepare_audio_separated_zip,
+                   prepare_multi_audio_separated_zip)
+
+# number of jobs run at the same time in this process
+JOB_WORKERS = int(os.environ.get("SPLEETER_JOB_WORKERS", "2"))
+# finished jobs kept for status polling
+JOB_HISTORY_SIZE = 100
+
+
+class JobStatus(Enum):
+    # status enum
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """
+    Background job
+    Attributes:
+        id (str): job id
+        key (str): single-flight key (same input and settings share a key)
+        description (str): human readable description
+        status (JobStatus): current status
+        progress (float): progress from 0.0 to 1.0
+        stage (str): running stage (EX: inference), empty if not reported
+        chunk (Optional[Tuple[int, int]]): (done, total) chunks of the stage, if known
+        eta (Optional[float]): estimated seconds left, if known
+        result (Any): return value of the job function
+        error (Optional[str]): error message if the job failed
+    """
+    id: str
+    key: str
+    description: str
+    status: JobStatus = JobStatus.QUEUED
+    progress: float = 0.0
+    stage: str = ""
+    chunk: Optional[Tuple[int, int]] = None
+    eta: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+
+def get_job_key(kind: str, config: SpleeterSettings, audio_file_list: List[Path],
+                extra: Optional[dict] = None) -> str:
+    """
+    Get single-flight key of a separation job
+    Args:
+        kind: str: job kind (EX: single, multiple)
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: input audio files
+        extra: Optional[dict]: other json serializable job parameters (EX: remix settings)
+    Returns:
+        str: job key
+    """
+    key_source = json.dumps({
+        "kind": kind,
+        "settings": get_output_settings_dict(config),
+        "audio": [[get_file_hash(audio_file), audio_file.stem]
+                  for audio_file in audio_file_list],
+        "extra": extra,
+    }, sort_keys=True)
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+
+@dataclass
+class SplitOutput:
+    """
+    Result of a split job
+    Attributes:
+        stems (List[Path]): separated stem paths
+        zip_output (ZipOutput): zip of the stems, built when it is first downloaded
+    """
+    stems: List[Path]
+    zip_output: ZipOutput
+
+
+def make_split_job(config: SpleeterSettings, audio_file: Path,
+                   output_path: Path, upload_path: Path) -> Callable[[Callable[[float], None]], SplitOutput]:
+    """
+    Make a job function which splits one audio file
+    The source is pinned against cache eviction while the job runs, and the
+    cache budget is enforced when it finishes. Renditions of the source and
+    the stems are made for the output view.
+    Progress is reported by stage and chunk (see make_split_tracker).
+    Returns:
+        Callable[[Callable[[float], None]], SplitOutput]: job function returning separated stems
+    """
+    def split_job(progress_callback: Callable[[float], None]) -> SplitOutput:
+        with pinned(output_path, [get_audio_hash(audio_file, output_path)],
+                    owner=f"job-{uuid.uuid4().hex}"):
+            with tracking(make_split_tracker(config, audio_file, output_path, progress_callback,
+                                             listener=get_progress_listener())):
+                output_files = list(get_split_audio(config, audio_file, output_path)[0])
+            make_renditions([audio_file] + output_files, output_path)
+            zip_output = prepare_audio_separated_zip(config, audio_file, output_path, output_files)
+            enforce_cache_budget(output_path, upload_path)
+        return SplitOutput(output_files, zip_output)
+    return split_job
+
+
+def make_batch_job(config: SpleeterSettings, audio_file_list: List[Path],
+                   output_path: Path, upload_path: Path) -> Callable[[Callable[[float], None]], ZipOutput]:
+    """
+    Make a job function which splits multiple audio files for one zip.
+    The zip is built when it is first downloaded (see build_zip_output).
+    Returns:
+        Callable[[Callable[[float], None]], ZipOutput]: job function returning the zip
+    """
+    def batch_job(progress_callback: Callable[[float], None]) -> ZipOutput:
+        audio_hashes = [get_audio_hash(audio_file, output_path)
+                        for audio_file in audio_file_list]
+        with pinned(output_path, audio_hashes, owner=f"job-{uuid.uuid4().hex}"):
+            zip_output = prepare_multi_audio_separated_zip(
+                config, audio_file_list, output_path, progress_callback)
+            enforce_cache_budget(output_path, upload_path)
+        return zip_output
+    return batch_job
+
+
+def make_remix_job(config: SpleeterSettings, audio_file: Path, mix: Dict[str, StemMix],
+                   output_path: Path, upload_path: Path) -> Callable[[Callable[[float], None]], Path]:
+    """
+    Make a job function which renders a remix of one audio file
+    Returns:
+        Callable[[Callable[[float], None]], Path]: job function returning the remix path
+    """
+    def remix_job(progress_callback: Callable[[float], None]) -> Path:
+        # the stems are separated first if they are not cached
+        stages = get_split_stages(config)[:-1] + ["remix"]
+        with pinned(output_path, [get_audio_hash(audio_file, output_path)],
+                    owner=f"job-{uuid.uuid4().hex}"):
+            with tracking(make_split_tracker(config, audio_file, output_path, progress_callback,
+                                             stages, get_progress_listener())):
+                remix_file_path = get_remix(config, audio_file, output_path, mix)
+            make_renditions([remix_file_path], output_path)
+            enforce_cache_budget(output_path, upload_path)
+        return remix_file_path
+    return remix_job
+
+
+class JobManager:
+    """
+    Process-wide job queue run by a local thread pool.
+    Submitting a job whose key is already queued or running joins that job
+    instead of starting the work twice.
+    Attributes:
+        max_workers (int): number of jobs run at the same time
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="spleeter-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        # key -> id of the queued or running job
+        self._active: Dict[str, str] = {}
+
+    def submit(self, key: str,
+               fn: Callable[[Callable[[float], None]], Any],
+               description: str = "") -> Job:
+        """
+        Submit a job, or join the active job with the same key
+        Args:
+            key: str: single-flight key
+            fn: Callable[[Callable[[float], None]], Any]: job function, called with a progress callback
+            description: str: human readable description
+        Returns:
+            Job: submitted or joined job
+        """
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id is not None:
+                return self._jobs[active_id]
+            job = Job(id=uuid.uuid4().hex[:12], key=key, description=description)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._trim_history()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Callable[[float], None]], Any]):
+        def progress_callback(progress: float):
+            job.progress = min(max(float(progress), 0.0), 1.0)
+
+        def progress_listener(state: ProgressState):
+            job.stage, job.chunk, job.eta = state.stage, state.chunk, state.eta
+
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        try:
+            with observing(progress_listener):
+                job.result = fn(progress_callback)
+            job.progress, job.eta = 1.0, None
+            job.status = JobStatus.DONE
+        except Exception as e:
+            traceback.print_exc()
+            job.error = repr(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) == job.id:
+                    del self._active[job.key]
+
+    def _trim_history(self):
+        finished = [job for job in self._jobs.values() if job.is_finished]
+        for job in finished[:max(0, len(finished) - JOB_HISTORY_SIZE)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+
+job_manager = JobManager()
@@ -1,18 +1,56 @@
-import os
+import json
+import time
+import uuid
+from dataclasses import asdict
 from pathlib import Path
-from typing import Generator, List
-
-import streamlit as st
-from spleeter.separator import Codec
-
-from utils import (ProcessingMode, SpleeterMode, SpleeterSettings,
-                   download_youtube_as_mp3, get_audio_separated_zip,
-                   get_multi_audio_separated_zip, get_split_audio,
-                   get_title_from_youtube_url)
+from typing import Generator, List, Optional
+
+# when the app started: taken before the imports below (utils loads tensorflow),
+# which are most of the time to the first render
+APP_START_TIME = time.time()
+
+import streamlit as st  # noqa: E402
+from spleeter.audio import Codec  # noqa: E402
+
+from backends import InferenceBackend  # noqa: E402
+from download_server import (DOWNLOAD_URL, add_stream,  # noqa: E402
+                             get_download_url, start_download_server)
+from jobs import (Job, JobStatus, SplitOutput, get_job_key,  # noqa: E402
+                  job_manager, make_batch_job, make_remix_job, make_split_job)
+from metrics import metrics_registry  # noqa: E402
+from progress import format_eta  # noqa: E402
+from utils import (RENDITION_SECONDS, ProcessingMode,  # noqa: E402
+                   SpleeterMode, SpleeterSettings, StemMix, YoutubeDownloadError, ZipOutput,
+                   build_zip_output, download_youtube_as_mp3,
+                   get_audio_hash, get_catalog, get_preview, get_rendition,
+                   get_startup_metrics, get_youtube_info, get_zip_key,
+                   ingest_upload, record_startup_metric, start_prewarm)
 
 # global variables
 UPLOAD_DIR = Path("./upload_files/")
 OUTPUT_DIR = Path("./output/")
+# seconds a page keeps its outputs pinned after its last rerun
+SESSION_PIN_TTL = 3600.0
+# stems of every split mode, in model order
+ALL_STEMS = list(dict.fromkeys(
+    stem for mode in SpleeterMode for stem in mode.value.stems))
+
+# serves outputs as chunked, range-capable http responses
+# (None if it failed to start: files are sent through the page instead)
+download_server = start_download_server(OUTPUT_DIR)
+# load default models in background (SPLEETER_PREWARM_MODELS)
+start_prewarm()
+
+
+@st.experimental_singleton
+def get_media_catalog():
+    catalog = get_catalog(OUTPUT_DIR)
+    # index files which were added before the catalog existed (once per process)
+    catalog.sync_directory(UPLOAD_DIR)
+    return catalog
+
+
+media_catalog = get_media_catalog()
 
 # page states ---------------------------------------------------------------
 if 'is_youtube_downloading' not in st.session_state:
@@ -21,12 +59,23 @@ if 'audio_files' not in st.session_state:
     st.session_state.audio_files = []
 if 'output_files' not in st.session_state:
     st.session_state.output_files = []
+if 'zip_output' not in st.session_state:
+    st.session_state.zip_output = None
 if 'spleeter_settings' not in st.session_state:
     st.session_state.spleeter_settings = None
 if 'selected_music_file' not in st.session_state:
     st.session_state.selected_music_file = None
 if 'selected_music_files' not in st.session_state:
     st.session_state.selected_music_files = None
+if 'ingested_uploads' not in st.session_state:
+    st.session_state.ingested_uploads = {}
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'preview_files' not in st.session_state:
+    st.session_state.preview_files = []
+if 'job_id' not in st.session_state:
+    # restore the running job after a browser refresh
+    st.session_state.job_id = st.experimental_get_query_params().get("job", [None])[0]
 # states updater -------------------------------------------------------------
 
 
@@ -36,21 +85,110 @@ def add_audio_files(audio_file: Path):
 
 
 def save_uploaded_file(upload_file) -> Path:
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-    escaped_file_path = Path(upload_file.name)
-
-    # check if upload_file name last charactor is not space charactor
-    if(escaped_file_path.stem[-1] == " "):
-        escaped_file_path = escaped_file_path.parent / \
-            f"{escaped_file_path.stem[:-1]}{escaped_file_path.suffix}"
-
-    file_path = UPLOAD_DIR / escaped_file_path
-    print(f"upload file:{file_path}")
-    with open(file_path, 'wb') as f:
-        f.write(upload_file.read())
-
-    return file_path
+    # uploads are ingested once; reruns reuse the ingested path
+    upload_key = (getattr(upload_file, "id", None),
+                  upload_file.name, upload_file.size)
+    if upload_key not in st.session_state.ingested_uploads:
+        file_path, file_hash = ingest_upload(
+            upload_file, upload_file.name, UPLOAD_DIR)
+        media_catalog.add_media(file_path, file_hash)
+        st.session_state.ingested_uploads[upload_key] = file_path
+
+    return st.session_state.ingested_uploads[upload_key]
+
+
+def pin_for_session(audio_files: List[Path], zip_file_path: Optional[Path] = None):
+    # keep outputs shown in this session from being evicted
+    keys = [get_audio_hash(audio_file, OUTPUT_DIR) for audio_file in audio_files]
+    if zip_file_path is not None:
+        keys.append(get_zip_key(OUTPUT_DIR, zip_file_path))
+    for key in keys:
+        media_catalog.pin(
+            key, f"session-{st.session_state.session_id}", SESSION_PIN_TTL)
+
+
+def submit_job(key: str, fn, description: str) -> Job:
+    job = job_manager.submit(key, fn, description)
+    st.session_state.job_id = job.id
+    st.experimental_set_query_params(job=job.id)
+    return job
+
+
+def wait_job(job: Optional[Job]) -> bool:
+    """
+    Show status of a job and poll it until it is finished
+    Returns:
+        bool: True if the job is done
+    """
+    if job is None:
+        return False
+    if job.status == JobStatus.FAILED:
+        st.error(f"Failed: {job.description} ({job.error})")
+        return False
+    if job.status == JobStatus.DONE:
+        return True
+    st.info(f"{job.status.value}: {job.description}")
+    st.progress(job.progress)
+    if job.stage:
+        chunk = f" {job.chunk[0]}/{job.chunk[1]}" if job.chunk else ""
+        eta = format_eta(job.eta)
+        st.caption(f"{job.stage}{chunk} ({job.progress:.0%}){', ' + eta if eta else ''}")
+    time.sleep(1.0)
+    st.experimental_rerun()
+    return False
+
+
+def download_link(file_path: Path, label: str = "Download", file_name: Optional[str] = None):
+    file_name = file_name or file_path.name
+    if download_server is not None:
+        st.markdown(
+            f"[{label}]({get_download_url(download_server, file_path, file_name)})")
+    else:
+        # fallback: loads the whole file into server memory
+        with open(file_path, 'rb') as f:
+            st.download_button(label=label, data=f, file_name=file_name)
+
+
+def zip_download_link(zip_output: ZipOutput, label: str = "Download"):
+    if zip_output.is_built or zip_output.path.exists():
+        download_link(zip_output.path, label)
+    elif download_server is not None:
+        # built while it is sent to the first download, then kept
+        url = add_stream(download_server, get_zip_key(OUTPUT_DIR, zip_output.path),
+                         zip_output.path.name,
+                         lambda fileobj: build_zip_output(OUTPUT_DIR, zip_output, fileobj))
+        st.markdown(f"[{label}]({url})")
+    else:
+        build_zip_output(OUTPUT_DIR, zip_output)
+        download_link(zip_output.path, label)
+
+
+def get_waveform_svg(peaks: List[float], height: int = 40) -> str:
+    bars = "".join(f"M{i} {height / 2 * (1 - peak):.1f}V{height / 2 * (1 + peak):.1f}"
+                   for i, peak in enumerate(peaks))
+    return (f'<svg viewBox="0 0 {len(peaks)} {height}" preserveAspectRatio="none" '
+            f'width="100%" height="{height}"><path d="{bars}" stroke="#ff4b4b" '
+            f'stroke-width="0.8"/></svg>')
+
+
+def audio_player(audio_file: Path):
+    """
+    Show the waveform and play a short low-bitrate rendition of an audio file;
+    the full file is only sent by download_link
+    """
+    try:
+        rendition_file, peaks = get_rendition(audio_file, OUTPUT_DIR)
+    except Exception as e:
+        print(f"{audio_file.name} : no rendition ({e!r})")
+        st.audio(str(audio_file))
+        return
+    st.markdown(get_waveform_svg(peaks), unsafe_allow_html=True)
+    if download_server is not None:
+        # the browser fetches it from the download server, not through the page
+        st.audio(get_download_url(download_server, rendition_file), format="audio/mpeg")
+    else:
+        # renditions are small enough to send through the page
+        st.audio(rendition_file.read_bytes(), format="audio/mpeg")
 
 
 # sidebar start --------------------------------------------------------------
@@ -82,11 +220,19 @@ def youtube_dl_wrapper(url, bitrate):
     if(url == ""):
         st.warning("Please enter a valid url")
     else:
-        with st.spinner(f'Downloading {get_title_from_youtube_url(url)}...'):
+        youtube_info = get_youtube_info(url)
+        with st.spinner(f'Downloading {youtube_info.title}...'):
             progress = st.progress(0)
-            file_list = download_youtube_as_mp3(
-                url, UPLOAD_DIR, progress.progress, bitrate)
+            try:
+                file_list = download_youtube_as_mp3(
+                    url, UPLOAD_DIR, progress.progress, bitrate, youtube_info)
+            except YoutubeDownloadError as e:
+                # keep the entries which were downloaded
+                file_list = e.files
+                for title, error in e.errors:
+                    st.error(f"Failed to download {title}: {error}")
             for file in file_list:
+                media_catalog.add_media(file)
                 add_audio_files(file)
 
 
@@ -101,10 +247,12 @@ with st.sidebar.form("youtube_dl_form"):
 st.sidebar.write("# Reload already uploaded audio files")
 if st.sidebar.button("Reload"):
     st.sidebar.info("Reloading...")
-    for file in Path(UPLOAD_DIR).glob("*"):
+    for file in media_catalog.list_media(UPLOAD_DIR):
         add_audio_files(file)
     st.sidebar.success("Done!")
 
+show_diagnostics = st.sidebar.checkbox("Show diagnostics", value=False)
+
 # sidebar end --------------------------------------------------------------
 
 # main page -------------------------------------------------------------------
@@ -130,6 +278,8 @@ if(current_mode == ProcessingMode.SINGLE):
 
         select_stems = st.selectbox(
             "Selected split mode", SpleeterMode, format_func=lambda x: x.value.label)
+        output_stems = st.multiselect(
+            "Output stems", ALL_STEMS, help="Only these stems are separated and encoded, stems which the split mode does not have are ignored. Empty means every stem of the split mode")
 
         with st.expander("Detail Settings"):
             col1, col2 = st.columns(2)
@@ -145,8 +295,43 @@ if(current_mode == ProcessingMode.SINGLE):
                     "Use multi-channel Wiener filtering", value=True, help="Use multi-channel Wiener filtering to improve the quality of the output audio, but this may increase the processing time")
                 use_16kHz: bool = st.checkbox(
                     "Use 16kHz model (instead of 11kHz)", value=True, help="Use 16kHz model is better for high quality audio than 11kHz, but it may increase the processing time")
+                select_backend: InferenceBackend = st.selectbox(
+                    "Inference backend", list(InferenceBackend), format_func=lambda x: x.value, help="frozen: same quality, less overhead. tflite16 / tflite8: float16 / int8 weights, faster on cpu with a small quality loss. The model is converted on first use")
+                model_threads: int = st.number_input(
+                    "Model threads", 0, 256, 0, help="Threads the model uses inside one operation (tensorflow intra-op threads, tflite threads). 0 means SPLEETER_INTRA_OP_THREADS, or every cpu core if it is not set")
+                use_streaming: bool = st.checkbox(
+                    "Streaming separation", value=False, help="Separate the audio chunk by chunk with constant memory usage. Use this for long recordings such as DJ sets")
+                use_skip_silence: bool = st.checkbox(
+                    "Skip silence", value=False, help="Don't run the model on silent parts (podcasts, live recordings...), which are output as silence. Has no effect with Wiener filtering")
                 duaration_minutes: int = st.slider(
-                    "Max duration minutes", 0, 60, 10, help="Max duration minutes of the audio to be processed. If the audio is longer than the duration, the audio will be ignored.")
+                    "Max duration minutes", 0, 60, 10, help="Max duration minutes of the audio to be processed. If the audio is longer than the duration, the rest of the audio will be ignored. 0 means no limit")
+
+        with st.expander("Preview Settings"):
+            col1, col2 = st.columns(2)
+            with col1:
+                preview_offset: int = st.number_input(
+                    "Preview start seconds", 0, 3600, 0, help="Start of the previewed part of the audio")
+            with col2:
+                preview_seconds: int = st.slider(
+                    "Preview seconds", 5, 60, 20, help="A preview from the start of the audio is reused by a following streaming separation")
+
+        preview_submitted = st.form_submit_button("Preview")
+        if preview_submitted:
+            if(selected_music == None or select_stems == None):
+                st.error("Please select an audio file.")
+            else:
+                preview_settings = SpleeterSettings(
+                    select_stems, select_codec, select_bitrate, use_mwf, use_16kHz,
+                    stems=[x for x in output_stems if x in select_stems.value.stems] or None,
+                    backend=select_backend, threads=model_threads)
+                with st.spinner("Separating preview..."):
+                    try:
+                        st.session_state.preview_files = get_preview(
+                            preview_settings, selected_music, OUTPUT_DIR,
+                            float(preview_offset), float(preview_seconds))
+                    except ValueError as e:
+                        st.session_state.preview_files = []
+                        st.error(str(e))
 
         if st.form_submit_button("Split"):
             # check if settings are selected:
@@ -160,23 +345,39 @@ if(current_mode == ProcessingMode.SINGLE):
                     select_bitrate,
                     use_mwf,
                     use_16kHz,
-                    duaration_minutes*60
+                    duaration_minutes*60 if duaration_minutes > 0 else None,
+                    use_streaming,
+                    [x for x in output_stems if x in select_stems.value.stems] or None,
+                    use_skip_silence,
+                    select_backend,
+                    model_threads
                 )
                 st.session_state.spleeter_settings = current_settings
                 st.session_state.selected_music_file = selected_music
                 st.session_state.output_files = []
-                with st.spinner('Wait for spleeter processing...'):
-                    output_files_generator, is_exist = get_split_audio(
-                        st.session_state.spleeter_settings,
-                        selected_music,
-                        OUTPUT_DIR)
-                    for x in output_files_generator:
-                        st.session_state.output_files.append(x)
-                st.success("Done!")
+                submit_job(
+                    get_job_key("single", current_settings, [selected_music]),
+                    make_split_job(current_settings, selected_music,
+                                   OUTPUT_DIR, UPLOAD_DIR),
+                    f"split {selected_music.name}")
+
+    if st.session_state.preview_files:
+        with st.container():
+            st.subheader("Preview")
+            for audio_file in st.session_state.preview_files:
+                st.caption(audio_file.stem)
+                st.audio(str(audio_file))
+
+    job = job_manager.get(st.session_state.job_id)
+    if wait_job(job) and isinstance(job.result, SplitOutput):
+        st.session_state.output_files = job.result.stems
+        st.session_state.zip_output = job.result.zip_output
 
     with st.container():
         st.subheader("Output")
-        if(st.session_state.selected_music_file != None and select_stems != None):
+        if(st.session_state.selected_music_file != None and select_stems != None
+           and bool(st.session_state.output_files)):
+            pin_for_session([st.session_state.selected_music_file])
             col1, col2, col3 = st.columns(3)
             with col1:
                 st.caption("Audio:")
@@ -187,24 +388,21 @@ if(current_mode == ProcessingMode.SINGLE):
                     f"{select_stems.value.name}{'-16kHz' if use_16kHz else '-11kHz'}{'-mwf' if use_mwf else '-no-mwf'}")
             with col3:
                 st.caption("Zip:")
-                zip_file_path = get_audio_separated_zip(
-                    audio_file=st.session_state.selected_music_file,
-                    output_path=OUTPUT_DIR,
-                    config=st.session_state.spleeter_settings,
-                )
-                with open(zip_file_path, 'rb') as f:
-                    st.download_button(
-                        label="Download",
-                        data=f,
-                        file_name=zip_file_path.name,
-                    )
+                # made by the split job: nothing is looked up on reruns
+                zip_download_link(st.session_state.zip_output)
+            if RENDITION_SECONDS > 0:
+                st.caption(f"Players play the first {RENDITION_SECONDS:g} seconds at a low bitrate, "
+                           "download for the full audio")
             st.caption("Original audio: " +
                        st.session_state.selected_music_file.name)
-            st.audio(str(selected_music))
+            audio_player(st.session_state.selected_music_file)
 
             for i, audio_file in enumerate(st.session_state.output_files):
                 st.caption(audio_file.name)
-                st.audio(str(audio_file))
+                audio_player(audio_file)
+                download_link(
+                    audio_file, f"Download {audio_file.name}",
+                    f"{st.session_state.selected_music_file.stem}_{audio_file.name}")
 
 # multiple file mode -----------------------------------------------------------
 elif(current_mode == ProcessingMode.MULTIPLE):
@@ -215,6 +413,8 @@ elif(current_mode == ProcessingMode.MULTIPLE):
 
         select_stems = st.selectbox(
             "Selected split mode", SpleeterMode, format_func=lambda x: x.value.label)
+        output_stems = st.multiselect(
+            "Output stems", ALL_STEMS, help="Only these stems are separated and encoded, stems which the split mode does not have are ignored. Empty means every stem of the split mode")
 
         with st.expander("Detail Settings"):
             col1, col2 = st.columns(2)
@@ -230,8 +430,16 @@ elif(current_mode == ProcessingMode.MULTIPLE):
                     "Use multi-channel Wiener filtering", value=True, help="Use multi-channel Wiener filtering to improve the quality of the output audio, but this may increase the processing time")
                 use_16kHz: bool = st.checkbox(
                     "Use 16kHz model (instead of 11kHz)", value=True, help="Use 16kHz model is better for high quality audio than 11kHz, but it may increase the processing time")
+                select_backend: InferenceBackend = st.selectbox(
+                    "Inference backend", list(InferenceBackend), format_func=lambda x: x.value, help="frozen: same quality, less overhead. tflite16 / tflite8: float16 / int8 weights, faster on cpu with a small quality loss. The model is converted on first use")
+                model_threads: int = st.number_input(
+                    "Model threads", 0, 256, 0, help="Threads the model uses inside one operation (tensorflow intra-op threads, tflite threads). 0 means SPLEETER_INTRA_OP_THREADS, or every cpu core if it is not set")
+                use_streaming: bool = st.checkbox(
+                    "Streaming separation", value=False, help="Separate the audio chunk by chunk with constant memory usage. Use this for long recordings such as DJ sets")
+                use_skip_silence: bool = st.checkbox(
+                    "Skip silence", value=False, help="Don't run the model on silent parts (podcasts, live recordings...), which are output as silence. Has no effect with Wiener filtering")
                 duaration_minutes: int = st.slider(
-                    "Max duration minutes", 0, 60, 10, help="Max duration minutes of the audio to be processed. If the audio is longer than the duration, the audio will be ignored.")
+                    "Max duration minutes", 0, 60, 10, help="Max duration minutes of the audio to be processed. If the audio is longer than the duration, the rest of the audio will be ignored. 0 means no limit")
 
         if st.form_submit_button("Split"):
             # check if settings are selected:
@@ -245,23 +453,29 @@ elif(current_mode == ProcessingMode.MULTIPLE):
                     select_bitrate,
                     use_mwf,
                     use_16kHz,
-                    duaration_minutes*60
+                    duaration_minutes*60 if duaration_minutes > 0 else None,
+                    use_streaming,
+                    [x for x in output_stems if x in select_stems.value.stems] or None,
+                    use_skip_silence,
+                    select_backend,
+                    model_threads
                 )
                 st.session_state.spleeter_settings = current_settings
                 st.session_state.selected_music_files = selected_musics
                 st.session_state.output_files = []
-                with st.spinner('Wait for spleeter processing...'):
-                    progress = st.progress(0)
-                    output_zip_path = get_multi_audio_separated_zip(
-                        st.session_state.spleeter_settings,
-                        selected_musics,
-                        OUTPUT_DIR,
-                        progress_callback=progress.progress)
-                st.success("Done!")
+                submit_job(
+                    get_job_key("multiple", current_settings, selected_musics),
+                    make_batch_job(current_settings, list(selected_musics),
+                                   OUTPUT_DIR, UPLOAD_DIR),
+                    f"split {len(selected_musics)} files")
+
+    job = job_manager.get(st.session_state.job_id)
+    is_job_done = wait_job(job) and isinstance(job.result, ZipOutput)
 
     with st.container():
         st.subheader("Output")
-        if(bool(st.session_state.selected_music_files)):
+        if(bool(st.session_state.selected_music_files) and is_job_done):
+            pin_for_session(st.session_state.selected_music_files, job.result.path)
             col1, col2, col3 = st.columns(3)
             with col1:
                 st.caption("Selected Audio files:")
@@ -274,14 +488,122 @@ elif(current_mode == ProcessingMode.MULTIPLE):
                     f"{select_stems.value.name}{'-16kHz' if use_16kHz else '-11kHz'}{'-mwf' if use_mwf else '-no-mwf'}")
             with col3:
                 st.caption("Zip:")
-                output_zip_path = get_multi_audio_separated_zip(
-                    st.session_state.spleeter_settings,
-                    selected_musics,
-                    OUTPUT_DIR,
-                    progress_callback=lambda x: x)
-                with open(output_zip_path, 'rb') as f:
-                    st.download_button(
-                        label="Download",
-                        data=f,
-                        file_name=output_zip_path.name,
-                    )
+                zip_download_link(job.result)
+
+# combine mode ----------------------------------------------------------------
+elif(current_mode == ProcessingMode.COMBINE):
+    st.subheader("Mode: "+current_mode.value)
+    # outside of the form: stem controls depend on the split mode
+    select_stems = st.selectbox(
+        "Selected split mode", SpleeterMode, format_func=lambda x: x.value.label)
+
+    with st.form("combine_mode"):
+        selected_music = st.selectbox(
+            "Select an audio file", st.session_state.audio_files, help="To select audio, you have to upload or download an audio file at least once",
+            format_func=lambda x: x.name)
+
+        stem_mixes = {}
+        for stem in select_stems.value.stems:
+            col1, col2, col3 = st.columns([1, 3, 3])
+            with col1:
+                mute: bool = st.checkbox("Mute", key=f"mute_{stem}")
+            with col2:
+                gain_db: float = st.slider(
+                    f"{stem} gain (dB)", -24.0, 12.0, 0.0, 0.5, key=f"gain_{stem}")
+            with col3:
+                pan: float = st.slider(
+                    f"{stem} pan (L-R)", -1.0, 1.0, 0.0, 0.1, key=f"pan_{stem}")
+            stem_mixes[stem] = StemMix(gain_db, mute, pan)
+
+        with st.expander("Detail Settings"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("Output audio settings")
+                select_codec = st.selectbox(
+                    "Codec", list(Codec), format_func=lambda x: x.value, index=1)
+                select_bitrate = st.slider(
+                    "Bitrate", 1, 512, 192)
+            with col2:
+                st.subheader("Spleetor processing settings")
+                use_mwf: bool = st.checkbox(
+                    "Use multi-channel Wiener filtering", value=True, help="Use multi-channel Wiener filtering to improve the quality of the output audio, but this may increase the processing time")
+                use_16kHz: bool = st.checkbox(
+                    "Use 16kHz model (instead of 11kHz)", value=True, help="Use 16kHz model is better for high quality audio than 11kHz, but it may increase the processing time")
+                select_backend: InferenceBackend = st.selectbox(
+                    "Inference backend", list(InferenceBackend), format_func=lambda x: x.value, help="frozen: same quality, less overhead. tflite16 / tflite8: float16 / int8 weights, faster on cpu with a small quality loss. The model is converted on first use")
+                model_threads: int = st.number_input(
+                    "Model threads", 0, 256, 0, help="Threads the model uses inside one operation (tensorflow intra-op threads, tflite threads). 0 means SPLEETER_INTRA_OP_THREADS, or every cpu core if it is not set")
+                duaration_minutes: int = st.slider(
+                    "Max duration minutes", 0, 60, 10, help="Max duration minutes of the audio to be processed. If the audio is longer than the duration, the rest of the audio will be ignored. 0 means no limit")
+
+        if st.form_submit_button("Combine"):
+            if(selected_music == None):
+                st.error("Please select an audio file.")
+            else:
+                current_settings = SpleeterSettings(
+                    select_stems,
+                    select_codec,
+                    select_bitrate,
+                    use_mwf,
+                    use_16kHz,
+                    duaration_minutes*60 if duaration_minutes > 0 else None,
+                    backend=select_backend,
+                    threads=model_threads
+                )
+                st.session_state.selected_music_file = selected_music
+                st.session_state.remix_job_key = get_job_key(
+                    "combine", current_settings, [selected_music],
+                    {stem: asdict(x) for stem, x in stem_mixes.items()})
+                submit_job(
+                    st.session_state.remix_job_key,
+                    make_remix_job(current_settings, selected_music, stem_mixes,
+                                   OUTPUT_DIR, UPLOAD_DIR),
+                    f"remix {selected_music.name}")
+
+    job = job_manager.get(st.session_state.job_id)
+    is_job_done = wait_job(job) and job.key == st.session_state.get("remix_job_key")
+
+    with st.container():
+        st.subheader("Output")
+        if(st.session_state.selected_music_file != None and is_job_done):
+            pin_for_session([st.session_state.selected_music_file])
+            st.caption("Remix of " + st.session_state.selected_music_file.name)
+            audio_player(job.result)
+            download_link(
+                job.result, "Download remix",
+                f"{st.session_state.selected_music_file.stem}_{job.result.name}")
+
+# diagnostics -----------------------------------------------------------------
+if show_diagnostics:
+    st.subheader("Diagnostics")
+    spans = metrics_registry.recent_spans()
+    st.caption("Recent stages (this process):")
+    if spans:
+        st.table([{
+            "stage": x.stage,
+            "labels": ", ".join(f"{k}={v}" for k, v in x.labels.items()),
+            "seconds": round(x.duration, 3),
+            "MB in": round(x.bytes_in / 1024 ** 2, 2),
+            "MB out": round(x.bytes_out / 1024 ** 2, 2),
+            "peak RSS MB": round(x.peak_rss / 1024 ** 2),
+            "error": x.error or "",
+        } for x in reversed(spans)])
+    else:
+        st.write("No stage has run yet.")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Startup (seconds):")
+        st.json(get_startup_metrics())
+    with col2:
+        st.caption("Cache:")
+        st.json(media_catalog.get_stats())
+    with st.expander("Prometheus metrics"):
+        if download_server is not None:
+            st.markdown(f"Scrape: [{DOWNLOAD_URL}/metrics]({DOWNLOAD_URL}/metrics)")
+        st.code(metrics_registry.to_prometheus(), language="text")
+    st.download_button("Download stages as JSON",
+                       json.dumps([asdict(x) for x in spans], indent=2),
+                       file_name="spleeter_stages.json")
+
+# only the first run counts: later reruns start the clock again
+record_startup_metric("time_to_first_render", APP_START_TIME)
@@ -0,0 +1,218 @@
+import json
+import os
+import platform
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+# json lines log of finished spans (empty: no log), EX: ./output/metrics.jsonl
+METRICS_LOG = os.environ.get("SPLEETER_METRICS_LOG", "")
+# number of finished spans kept in memory for the diagnostics panel
+RECENT_SPANS_SIZE = 200
+# upper bounds of the stage duration histogram (seconds)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def get_peak_rss() -> int:
+    """
+    Get memory high-water mark of this process
+    Returns:
+        int: bytes
+    """
+    # ru_maxrss is kilobytes on linux and bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+@dataclass
+class Span:
+    """
+    One timed pipeline stage
+    Attributes:
+        stage (str): stage name (EX: decode, inference, encode)
+        labels (Dict[str, str]): extra labels (EX: model, codec)
+        start (float): unix time when the stage started
+        duration (float): seconds
+        bytes_in (int): bytes read by the stage
+        bytes_out (int): bytes written by the stage
+        peak_rss (int): memory high-water mark of the process when the stage ended
+        error (Optional[str]): exception if the stage failed
+    """
+    stage: str
+    labels: Dict[str, str] = field(default_factory=dict)
+    start: float = 0.0
+    duration: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    peak_rss: int = 0
+    error: Optional[str] = None
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges, stage duration histograms and recent spans.
+    Exported in prometheus text format and as a json lines log.
+    Attributes:
+        log_path (str): json lines log path (empty: no log)
+    """
+
+    def __init__(self, log_path: str = METRICS_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Labels, List[float]] = {}
+        self._recent: Deque[Span] = deque(maxlen=RECENT_SPANS_SIZE)
+        self._captures: List[List[Span]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        """
+        Increment a counter
+        Args:
+            name: str: metric name (EX: spleeter_cache_requests_total)
+            value: float: increment
+            labels: str: metric labels
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str):
+        """
+        Set a gauge
+        Args:
+            name: str: metric name (EX: spleeter_stage_real_time_factor)
+            value: float: current value
+            labels: str: metric labels
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def record(self, span: Span, log: bool = True):
+        """
+        Record a finished span
+        Args:
+            span: Span: finished span
+            log: bool: append it to the json lines log (False: already logged, EX: by a worker)
+        """
+        labels = tuple(sorted({"stage": span.stage, **span.labels}.items()))
+        with self._lock:
+            # bucket counts, then sum and count
+            histogram = self._histograms.setdefault(
+                labels, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += span.duration
+            histogram[-1] += 1
+            self._recent.append(span)
+            for captured in self._captures:
+                captured.append(span)
+        self.inc("spleeter_stage_bytes_in_total", span.bytes_in, stage=span.stage)
+        self.inc("spleeter_stage_bytes_out_total", span.bytes_out, stage=span.stage)
+        if span.error is not None:
+            self.inc("spleeter_stage_errors_total", stage=span.stage)
+        if log and self.log_path:
+            line = json.dumps({"pid": os.getpid(), **asdict(span)})
+            with self._lock, open(self.log_path, 'a') as f:
+                f.write(line + "\n")
+
+    @contextmanager
+    def capturing(self) -> Iterator[List[Span]]:
+        """
+        Collect spans recorded by any thread of this process, EX: to send
+        the spans of a worker process to its parent
+        Returns:
+            Iterator[List[Span]]: spans recorded so far (use as context manager)
+        """
+        captured: List[Span] = []
+        with self._lock:
+            self._captures.append(captured)
+        try:
+            yield captured
+        finally:
+            with self._lock:
+                self._captures = [x for x in self._captures if x is not captured]
+
+    def recent_spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._recent)
+
+    def to_prometheus(self) -> str:
+        """
+        Export metrics in prometheus text exposition format
+        Returns:
+            str: metrics text
+        """
+        def format_labels(labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (
+                (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items())
+        names_seen = set()
+        for (name, labels), value in counters:
+            if name not in names_seen:
+                names_seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for (name, labels), value in gauges:
+            if name not in names_seen:
+                names_seen.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+        name = "spleeter_stage_duration_seconds"
+        if histograms:
+            lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in histograms:
+            for bound, count in zip(DURATION_BUCKETS, histogram):
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', f'{bound:g}'),))} {count:g}")
+            lines.append(f"{name}_bucket{format_labels(labels, (('le', '+Inf'),))} {histogram[-1]:g}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram[-2]:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram[-1]:g}")
+
+        lines.append("# TYPE spleeter_peak_rss_bytes gauge")
+        lines.append(f"spleeter_peak_rss_bytes {get_peak_rss()}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+@contextmanager
+def span(stage: str, **labels: object) -> Iterator[Span]:
+    """
+    Time a pipeline stage; set bytes_in / bytes_out on the yielded span
+    Args:
+        stage: str: stage name
+        labels: object: extra labels
+    Returns:
+        Iterator[Span]: running span (use as context manager)
+    """
+    current = Span(stage, {k: str(v) for k, v in labels.items()}, time.time())
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        current.peak_rss = get_peak_rss()
+        metrics_registry.record(current)
@@ -0,0 +1,299 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import metrics_registry
+
+# seconds of work per second of audio of each stage, until it is measured
+DEFAULT_REAL_TIME_FACTORS = {
+    "decode": 0.02,
+    "stft": 0.01,
+    "inference": 0.3,
+    "masks": 0.05,
+    "wiener": 0.3,
+    "encode": 0.05,
+    "remix": 0.05,
+    "zip": 0.005,
+}
+# weight of the newest measurement in the real time factor moving average
+REAL_TIME_FACTOR_SMOOTHING = 0.3
+
+
+class RealTimeFactors:
+    """
+    Process-wide measured real time factors (stage seconds per audio second)
+    by stage and profile, as exponential moving averages.
+    Exported as the spleeter_stage_real_time_factor gauge.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factors: Dict[Tuple[str, str], float] = {}
+
+    def get(self, stage: str, profile: str = "") -> float:
+        """
+        Get real time factor of a stage
+        Args:
+            stage: str: stage name (EX: inference)
+            profile: str: what the factor depends on (EX: model spec 4stems-mwf)
+        Returns:
+            float: measured factor, or the default one if never measured
+        """
+        with self._lock:
+            factor = self._factors.get((stage, profile))
+        if factor is None:
+            return DEFAULT_REAL_TIME_FACTORS.get(stage, 0.05)
+        return factor
+
+    def update(self, stage: str, profile: str, factor: float):
+        """
+        Add a measurement
+        Args:
+            stage: str: stage name
+            profile: str: profile (see get)
+            factor: float: measured stage seconds per audio second
+        """
+        with self._lock:
+            previous = self._factors.get((stage, profile))
+            if previous is not None:
+                factor = previous + (factor - previous) * REAL_TIME_FACTOR_SMOOTHING
+            self._factors[(stage, profile)] = factor
+        metrics_registry.set("spleeter_stage_real_time_factor", factor,
+                             stage=stage, profile=profile)
+
+
+real_time_factors = RealTimeFactors()
+
+
+@dataclass
+class ProgressState:
+    """
+    Snapshot of a running separation
+    Attributes:
+        progress (float): progress from 0.0 to 1.0
+        stage (str): running stage (EX: inference), empty before the first one
+        chunk (Optional[Tuple[int, int]]): (done, total) chunks of the stage, if known
+        eta (Optional[float]): estimated seconds left (None: unknown)
+    """
+    progress: float = 0.0
+    stage: str = ""
+    chunk: Optional[Tuple[int, int]] = None
+    eta: Optional[float] = None
+
+
+class ProgressTracker:
+    """
+    Progress of one separation, from its planned stages.
+    Every stage is weighted by its expected time (audio length times its real
+    time factor), so progress moves at about the same speed through the whole
+    run. The time left is measured on the running stage and expected from
+    real time factors on the stages after it. Finished stages update the real
+    time factors; stages which don't run (EX: cached decode) count as done as
+    soon as a later stage starts.
+    Attributes:
+        stages (List[str]): planned stages in run order
+        audio_seconds (float): length of the separated audio (0.0: unknown)
+        profile (str): real time factor profile (EX: model spec 4stems-mwf)
+        state (ProgressState): last reported state
+    """
+
+    def __init__(self, progress_callback: Callable[[float], None],
+                 audio_seconds: float,
+                 stages: List[str],
+                 profile: str = "",
+                 listener: Optional[Callable[[ProgressState], None]] = None):
+        self.stages = list(stages)
+        self.audio_seconds = max(0.0, audio_seconds or 0.0)
+        self.profile = profile
+        self.state = ProgressState()
+        self._progress_callback = progress_callback
+        self._listener = listener
+        self._lock = threading.Lock()
+        # unknown length: weight by real time factors alone, without eta
+        seconds = self.audio_seconds or 1.0
+        self._expected = {stage: seconds * real_time_factors.get(stage, profile)
+                          for stage in self.stages}
+        self._done: List[str] = []
+        self._current: Optional[str] = None
+        self._current_started = 0.0
+        self._current_ratio = 0.0
+
+    def start(self, stage: str):
+        """
+        Start a stage; earlier stages which did not run count as done
+        Args:
+            stage: str: stage name (stages which are not planned are ignored)
+        """
+        if stage not in self.stages:
+            return
+        with self._lock:
+            for earlier in self.stages[:self.stages.index(stage)]:
+                if earlier not in self._done:
+                    self._done.append(earlier)
+            self._current = stage
+            self._current_started = time.perf_counter()
+            self._current_ratio = 0.0
+            self.state.chunk = None
+        self._report()
+
+    def chunk(self, done: int, total: int):
+        """
+        Report chunks done in the running stage
+        Args:
+            done: int: done chunks
+            total: int: total chunks of the stage
+        """
+        if self._current is None or total <= 0:
+            return
+        with self._lock:
+            self._current_ratio = min(max(done / total, 0.0), 1.0)
+            self.state.chunk = (done, total)
+        self._report()
+
+    def finish(self, stage: str):
+        """
+        Finish a stage and measure its real time factor
+        Args:
+            stage: str: stage name
+        """
+        if stage != self._current:
+            return
+        with self._lock:
+            elapsed = time.perf_counter() - self._current_started
+            self._done.append(stage)
+            self._current = None
+            self._current_ratio = 0.0
+        if self.audio_seconds > 0.0:
+            real_time_factors.update(stage, self.profile, elapsed / self.audio_seconds)
+        self._report()
+
+    def _report(self):
+        with self._lock:
+            total = sum(self._expected.values()) or 1.0
+            done = sum(self._expected[stage] for stage in self._done)
+            left = sum(self._expected[stage] for stage in self.stages
+                       if stage not in self._done and stage != self._current)
+            if self._current is not None:
+                expected = self._expected[self._current]
+                done += expected * self._current_ratio
+                elapsed = time.perf_counter() - self._current_started
+                if self._current_ratio > 0.0:
+                    left += elapsed * (1.0 - self._current_ratio) / self._current_ratio
+                else:
+                    left += max(0.0, expected - elapsed)
+            self.state.progress = min(1.0, done / total)
+            self.state.stage = self._current or (self._done[-1] if self._done else "")
+            self.state.eta = left if self.audio_seconds > 0.0 else None
+            state = ProgressState(self.state.progress, self.state.stage,
+                                  self.state.chunk, self.state.eta)
+        self._progress_callback(state.progress)
+        if self._listener is not None:
+            self._listener(state)
+
+
+# the tracker of the separation running on this thread, so that stages deep
+# in the pipeline report without passing it through every call
+_local = threading.local()
+
+
+@contextmanager
+def tracking(tracker: Optional[ProgressTracker]) -> Iterator[Optional[ProgressTracker]]:
+    """
+    Report stages and chunks run on this thread to a tracker
+    Args:
+        tracker: Optional[ProgressTracker]: tracker (None: don't report)
+    Returns:
+        Iterator[Optional[ProgressTracker]]: tracker (use as context manager)
+    """
+    previous = getattr(_local, "tracker", None), getattr(_local, "depth", 0)
+    _local.tracker, _local.depth = tracker, 0
+    try:
+        yield tracker
+    finally:
+        _local.tracker, _local.depth = previous
+
+
+@contextmanager
+def progress_stage(stage: str) -> Iterator[None]:
+    """
+    Report a stage to the tracker of this thread.
+    Only the outermost stage is reported (EX: the inference of a streaming
+    window is part of the streaming stage). A failed stage is not measured.
+    Args:
+        stage: str: stage name
+    """
+    tracker = getattr(_local, "tracker", None)
+    if tracker is None:
+        yield
+        return
+    _local.depth += 1
+    try:
+        if _local.depth == 1:
+            tracker.start(stage)
+        yield
+        if _local.depth == 1:
+            tracker.finish(stage)
+    finally:
+        _local.depth -= 1
+
+
+def is_tracking() -> bool:
+    return getattr(_local, "tracker", None) is not None
+
+
+def progress_chunk(done: int, total: int):
+    """
+    Report chunks done in the outermost running stage of this thread
+    Args:
+        done: int: done chunks
+        total: int: total chunks of the stage
+    """
+    tracker = getattr(_local, "tracker", None)
+    if tracker is not None and getattr(_local, "depth", 0) == 1:
+        tracker.chunk(done, total)
+
+
+@contextmanager
+def observing(listener: Optional[Callable[[ProgressState], None]]) -> Iterator[None]:
+    """
+    Set where progress states of this thread go (EX: the running job)
+    Args:
+        listener: Optional[Callable[[ProgressState], None]]: called with every state
+    """
+    previous = getattr(_local, "listener", None)
+    _local.listener = listener
+    try:
+        yield
+    finally:
+        _local.listener = previous
+
+
+def get_progress_listener() -> Optional[Callable[[ProgressState], None]]:
+    return getattr(_local, "listener", None)
+
+
+def report_progress_state(state: ProgressState):
+    """
+    Pass a progress state to the listener of this thread, if any
+    Args:
+        state: ProgressState: state
+    """
+    listener = get_progress_listener()
+    if listener is not None:
+        listener(state)
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """
+    Format time left for display
+    Args:
+        seconds: Optional[float]: seconds left
+    Returns:
+        str: EX: "1:05 left", "" if unknown
+    """
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d} left"
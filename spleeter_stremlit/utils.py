@@ -1,24 +1,48 @@
+import copy
 import hashlib
+import json
+import multiprocessing
 import os
 import re
 import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
 import zipfile
-from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed, wait)
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field, replace
 from enum import Enum
 from gc import callbacks
 from importlib.resources import path
 from pathlib import Path
-from typing import Callable, Generator, List, Tuple
+from typing import (BinaryIO, Callable, Dict, Generator,
+                    Iterator, List, Optional, Tuple)
 
-import yt_dlp as youtube_dl
-from spleeter.separator import Codec, Separator
+import ffmpeg
+import numpy as np
+# spleeter.audio does not import tensorflow; spleeter.separator and
+# spleeter.audio.adapter do, so they are imported when first needed.
+# yt_dlp is only needed to download, so it is imported there too
+from spleeter.audio import Codec
+
+from backends import (InferenceBackend, get_session_config,
+                      get_spectrogram_features, load_network)
+from metrics import Span, metrics_registry, span
+from progress import (ProgressState, ProgressTracker, get_progress_listener,
+                      is_tracking, progress_chunk, progress_stage,
+                      report_progress_state, tracking)
 
 
 class ProcessingMode(Enum):
     # mode enum
     SINGLE = "Split a single audio file"
     MULTIPLE = "Split multiple audio files at once"
-    # COMBINE = "Combine splited audio"
+    COMBINE = "Combine splited audio"
 
 
 @dataclass
@@ -57,36 +81,766 @@ class SpleeterSettings:
         bitrate (int): Bitrate to use
         usemwf (bool): Use multi-channel Wiener filtering (default: False)
         use16kHZ (bool): Use 16kHz sampling rate (default: False for 11kHz)
-        duration (int): Duration in seconds
+        duration (Optional[int]): Duration in seconds (None: whole audio)
+        streaming (bool): Separate in overlapping chunks with constant memory (default: False)
+        stems (Optional[List[str]]): Stems to output (default: None for every stem of split_mode)
+        skip_silence (bool): Don't run the network on silent regions, which are written as zeros (default: False)
+        backend (InferenceBackend): Runtime of the network (default: TENSORFLOW, stock float32 graph)
+        threads (int): Threads inside one op of the model (default: 0 for SPLEETER_INTRA_OP_THREADS)
     """
     split_mode: SpleeterMode
     codec: Codec
     bitrate: int
     usemwf: bool = False
     use16kHZ: bool = False
-    duration: int = 600
+    duration: Optional[int] = 600
+    streaming: bool = False
+    stems: Optional[List[str]] = None
+    skip_silence: bool = False
+    backend: InferenceBackend = InferenceBackend.TENSORFLOW
+    threads: int = 0
 
 
-def get_title_from_youtube_url(youtube_url: str) -> str:
+def get_output_stems(config: SpleeterSettings) -> List[str]:
     """
-    Get title from youtube url
+    Get requested stems in model order
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        List[str]: stem names (EX: ["vocals", "drums"])
+    Raises:
+        ValueError: if a requested stem is not produced by split_mode
+    """
+    model_stems = config.split_mode.value.stems
+    if not config.stems:
+        return list(model_stems)
+    unknown = set(config.stems) - set(model_stems)
+    if unknown:
+        raise ValueError(
+            f"{config.split_mode.value.name} has no stem: {', '.join(sorted(unknown))}")
+    return [stem for stem in model_stems if stem in config.stems]
+
+
+# spectrogram separator -------------------------------------------------------
+# stft parameters shared by all spleeter models
+SPLEETER_FRAME_LENGTH = 4096
+SPLEETER_FRAME_STEP = 1024
+STFT_BLOCK_FRAMES = 256
+
+
+def iter_stft_blocks(waveform: np.ndarray,
+                     frame_length: int = SPLEETER_FRAME_LENGTH,
+                     frame_step: int = SPLEETER_FRAME_STEP,
+                     block_frames: int = STFT_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Compute the stft spleeter's model computes from a waveform, block by block.
+    Same framing as spleeter: the waveform is prepadded with frame_length zeros,
+    the end is zero padded to whole frames and every frame is weighted with a
+    periodic hann window.
+    Args:
+        waveform: np.ndarray: (samples, channels) waveform
+        frame_length: int: fft size
+        frame_step: int: hop size
+        block_frames: int: frames per yielded block
+    Returns:
+        Iterator[np.ndarray]: complex64 (frames, frame_length // 2 + 1, channels) blocks
+    """
+    n_samples, n_channels = waveform.shape
+    n_frames = -(-(n_samples + frame_length) // frame_step)
+    window = (0.5 - 0.5 * np.cos(
+        2.0 * np.pi * np.arange(frame_length) / frame_length)).astype(np.float32)
+
+    for start in range(0, n_frames, block_frames):
+        frames = min(block_frames, n_frames - start)
+        # segment of the prepadded signal covered by this block
+        seg_start = start * frame_step - frame_length
+        seg_length = (frames - 1) * frame_step + frame_length
+        segment = np.zeros((n_channels, seg_length), dtype=np.float32)
+        lo, hi = max(0, seg_start), min(n_samples, seg_start + seg_length)
+        if hi > lo:
+            segment[:, lo - seg_start:hi - seg_start] = waveform[lo:hi].T
+        itemsize = segment.strides[1]
+        framed = np.lib.stride_tricks.as_strided(
+            segment,
+            shape=(frames, n_channels, frame_length),
+            strides=(frame_step * itemsize, segment.strides[0], itemsize),
+            writeable=False)
+        spectrum = np.fft.rfft(framed * window, axis=-1)
+        yield spectrum.transpose(0, 2, 1).astype(np.complex64)
+
+
+def compute_stft(waveform: np.ndarray,
+                 frame_length: int = SPLEETER_FRAME_LENGTH,
+                 frame_step: int = SPLEETER_FRAME_STEP) -> np.ndarray:
+    """
+    Compute the stft spleeter's model computes from a waveform (see iter_stft_blocks)
+    Args:
+        waveform: np.ndarray: (samples, channels) waveform
+        frame_length: int: fft size
+        frame_step: int: hop size
+    Returns:
+        np.ndarray: complex64 (frames, frame_length // 2 + 1, channels) stft
+    """
+    blocks = list(iter_stft_blocks(waveform, frame_length, frame_step))
+    if not blocks:
+        return np.zeros((0, frame_length // 2 + 1, waveform.shape[1]), dtype=np.complex64)
+    return np.concatenate(blocks)
+
+
+# regions quieter than this (rms of the louder channel) are silent when skip_silence is set
+SILENCE_THRESHOLD_DB = float(os.environ.get("SPLEETER_SILENCE_DB", "-60"))
+# hop blocks per rms pass, bounds the memory of the pass on long memory-mapped audio
+SILENCE_PASS_BLOCKS = 8192
+
+
+def get_loud_blocks(waveform: np.ndarray, frame_step: int, threshold_db: float) -> np.ndarray:
+    """
+    Find hop-sized blocks louder than a threshold
+    Args:
+        waveform: np.ndarray: (samples, channels) waveform
+        frame_step: int: hop size (block length)
+        threshold_db: float: rms threshold in dBFS
+    Returns:
+        np.ndarray: bool (blocks,) loudness of every block of frame_step samples
+    """
+    n_samples, n_channels = waveform.shape
+    n_blocks = -(-n_samples // frame_step)
+    threshold = 10.0 ** (threshold_db / 10.0)
+    loud = np.zeros(n_blocks, dtype=bool)
+    for start in range(0, n_blocks, SILENCE_PASS_BLOCKS):
+        stop = min(n_blocks, start + SILENCE_PASS_BLOCKS)
+        chunk = np.zeros(((stop - start) * frame_step, n_channels), dtype=np.float32)
+        data = waveform[start * frame_step:stop * frame_step]
+        chunk[:data.shape[0]] = data
+        power = np.square(chunk).reshape(stop - start, frame_step, n_channels).mean(axis=1)
+        loud[start:stop] = power.max(axis=-1) > threshold
+    return loud
+
+
+def find_silent_segments(waveform: np.ndarray, threshold_db: float = SILENCE_THRESHOLD_DB,
+                         frame_length: int = SPLEETER_FRAME_LENGTH,
+                         frame_step: int = SPLEETER_FRAME_STEP,
+                         segment_frames: int = 512) -> np.ndarray:
+    """
+    Find model segments whose stft frames only see silence.
+    The model runs on segments of segment_frames stft frames (see iter_stft_blocks
+    for the framing); a segment is silent when no sample under any of its frames
+    is in a block louder than the threshold.
+    Args:
+        waveform: np.ndarray: (samples, channels) waveform
+        threshold_db: float: rms threshold in dBFS
+        frame_length: int: fft size
+        frame_step: int: hop size
+        segment_frames: int: stft frames per model segment
+    Returns:
+        np.ndarray: bool (segments,) silence of every segment
+    """
+    n_frames = -(-(waveform.shape[0] + frame_length) // frame_step)
+    n_segments = -(-n_frames // segment_frames)
+    loud = get_loud_blocks(waveform, frame_step, threshold_db)
+    loud_count = np.concatenate([[0], np.cumsum(loud)])
+    # frame j sees blocks [j - frame_blocks, j) of the waveform
+    frame_blocks = -(-frame_length // frame_step)
+    starts = np.clip(np.arange(n_segments) * segment_frames - frame_blocks, 0, loud.shape[0])
+    stops = np.clip(np.minimum(np.arange(1, n_segments + 1) * segment_frames, n_frames),
+                    0, loud.shape[0])
+    return loud_count[stops] - loud_count[starts] == 0
+
+
+@dataclass
+class SilenceReport:
+    """
+    Work saved by skipping silent segments
+    Attributes:
+        segments (int): model segments of the input
+        skipped_segments (int): segments the network did not run on
+        skipped_seconds (float): audio length of the skipped segments
+        saved_seconds (float): estimated inference time saved
+    """
+    segments: int = 0
+    skipped_segments: int = 0
+    skipped_seconds: float = 0.0
+    saved_seconds: float = 0.0
+
+
+def print_silence_report(audio_descriptor: str, report: SilenceReport):
+    if report.skipped_segments:
+        print(f"{audio_descriptor} : skipped {report.skipped_seconds:.1f}s of silence "
+              f"({report.skipped_segments}/{report.segments} segments), "
+              f"saved ~{report.saved_seconds:.1f}s of inference")
+
+
+# model segments per network run while progress is tracked, so that
+# inference reports every few seconds of audio
+INFERENCE_PROGRESS_SEGMENTS = 2
+
+
+class SpectrogramSeparator:
+    """
+    Spleeter model which takes the mixture stft as input.
+    The graph is spleeter's own prediction graph (EstimatorSpecBuilder) fed
+    with a precomputed stft instead of the waveform, so one decoded and
+    transformed source can be separated by every model without redoing
+    the decode and the stft.
+    With another backend than TENSORFLOW the network runs on that backend
+    and its estimates are fed to the graph, which only masks and inverts.
+    Attributes:
+        params (dict): spleeter model configuration
+        backend (InferenceBackend): runtime of the network
+        intra_op_threads (int): threads inside one op (0: configured threads)
+        labels (Dict[str, object]): metric labels (model, mwf and backend)
+    """
+
+    def __init__(self, params_descriptor: str, MWF: bool = False,
+                 backend: InferenceBackend = InferenceBackend.TENSORFLOW,
+                 intra_op_threads: int = 0):
+        from spleeter.utils.configuration import load_configuration
+
+        self.params = load_configuration(params_descriptor)
+        self.params["MWF"] = MWF
+        self.backend = backend
+        self.intra_op_threads = intra_op_threads
+        # metric labels
+        self.labels = {"model": params_descriptor.split(":")[-1], "mwf": MWF,
+                       "backend": backend.value}
+        self._session = None
+        self._network = None
+        self._lock = threading.Lock()
+        # network seconds per segment of the last run, to estimate skipped work
+        self._segment_seconds = 0.0
+
+    @property
+    def frame_length(self) -> int:
+        return self.params["frame_length"]
+
+    @property
+    def frame_step(self) -> int:
+        return self.params["frame_step"]
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is not None:
+                return self._session
+            import tensorflow as tf
+            from spleeter.model import EstimatorSpecBuilder
+            from spleeter.model.provider import ModelProvider
+
+            n_channels = self.params["n_channels"]
+            graph = tf.Graph()
+            with span("model_load", **self.labels), graph.as_default():
+                self._waveform = tf.compat.v1.placeholder(
+                    tf.float32, shape=(None, n_channels), name="waveform")
+                self._stft = tf.compat.v1.placeholder(
+                    tf.complex64,
+                    shape=(None, self.frame_length // 2 + 1, n_channels),
+                    name=f"{self.params['mix_name']}_stft")
+                builder = EstimatorSpecBuilder(
+                    {"waveform": self._waveform,
+                     f"{self.params['mix_name']}_stft": self._stft},
+                    self.params)
+                self._outputs = builder.outputs
+                # network estimates of every instrument, fed back to make
+                # further stems later without running the network
+                self._model_outputs = builder.model_outputs
+                session = tf.compat.v1.Session(
+                    graph=graph, config=get_session_config(self.intra_op_threads))
+                if self.backend is InferenceBackend.TENSORFLOW:
+                    saver = tf.compat.v1.train.Saver()
+                    model_directory = ModelProvider.default().get(self.params["model_dir"])
+                    saver.restore(session, tf.train.latest_checkpoint(model_directory))
+                else:
+                    # network estimates are always fed, so the graph's own
+                    # network variables are never read
+                    self._network = load_network(
+                        self.params, self.backend, self.intra_op_threads)
+            self._session = session
+            return session
+
+    def run(self, stft: np.ndarray, n_samples: int,
+            stems: Optional[List[str]] = None,
+            model_outputs: Optional[Dict[str, np.ndarray]] = None,
+            fetch_model_outputs: bool = False) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Separate a mixture stft into some stems.
+        Only the masks and inverse stfts of the requested stems are computed
+        (MWF filters every stem at once, so it always runs in full).
+        Args:
+            stft: np.ndarray: complex64 (frames, frame_length // 2 + 1, 2) mixture stft
+            n_samples: int: number of samples of the source waveform
+            stems: Optional[List[str]]: stems to compute (None: every stem)
+            model_outputs: Optional[Dict[str, np.ndarray]]: network estimates from
+                an earlier run; the network is skipped when given
+            fetch_model_outputs: bool: return the network estimates too
+        Returns:
+            Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]: (stem name -> (n_samples, 2)
+                waveform, model output name -> network estimate or {} if not fetched)
+        """
+        session = self._get_session()
+        if stems is None:
+            stems = list(self._outputs.keys())
+        fetched: Dict[str, np.ndarray] = {}
+        if model_outputs is None and (self._network is not None or is_tracking()):
+            # the graph only masks and inverts the backend's estimates
+            # (or the chunked estimates, to report inference progress)
+            model_outputs = self._run_network(stft)
+            if fetch_model_outputs:
+                fetched, fetch_model_outputs = model_outputs, False
+        fetches = {"stems": {stem: self._outputs[stem] for stem in stems}}
+        if fetch_model_outputs:
+            fetches["model_outputs"] = self._model_outputs
+        # the waveform is only used for its length (to crop the inverse stft)
+        feed_dict = {
+            self._stft: stft,
+            self._waveform: np.zeros((n_samples, self.params["n_channels"]), dtype=np.float32),
+        }
+        if model_outputs is not None:
+            feed_dict.update({self._model_outputs[name]: data
+                              for name, data in model_outputs.items()})
+
+        # mwf runs inside the graph, so its time is part of inference (see the mwf label)
+        with span("inference", **self.labels, network=model_outputs is None) as current, \
+                progress_stage("wiener" if self.params["MWF"] else "masks"):
+            current.bytes_in = stft.nbytes
+            results = session.run(fetches, feed_dict=feed_dict)
+            current.bytes_out = sum(data.nbytes for data in results["stems"].values())
+        return results["stems"], results.get("model_outputs", fetched)
+
+    def _run_network(self, stft: np.ndarray) -> Dict[str, np.ndarray]:
+        session = self._get_session()
+        # segments are estimated independently, so running them in chunks
+        # gives the same estimates
+        chunk_frames = INFERENCE_PROGRESS_SEGMENTS * self.params["T"] \
+            if is_tracking() else max(1, stft.shape[0])
+        n_chunks = max(1, -(-stft.shape[0] // chunk_frames))
+        with span("inference", **self.labels, network=True) as current, \
+                progress_stage("inference"):
+            current.bytes_in = stft.nbytes
+            started = time.perf_counter()
+            chunks: List[Dict[str, np.ndarray]] = []
+            for i in range(n_chunks):
+                stft_chunk = stft[i * chunk_frames:(i + 1) * chunk_frames]
+                if self._network is not None:
+                    chunks.append(self._network.predict(
+                        get_spectrogram_features(stft_chunk, self.params)))
+                else:
+                    # the waveform only crops the inverse stft, which is not fetched here
+                    chunks.append(session.run(self._model_outputs,
+                                              feed_dict={self._stft: stft_chunk}))
+                progress_chunk(i + 1, n_chunks)
+            model_outputs = chunks[0] if n_chunks == 1 else {
+                name: np.concatenate([chunk[name] for chunk in chunks])
+                for name in chunks[0]}
+            del chunks
+            segments = next(iter(model_outputs.values())).shape[0]
+            if segments > 0:
+                self._segment_seconds = (time.perf_counter() - started) / segments
+        return model_outputs
+
+    def run_skipping(self, stft: np.ndarray, n_samples: int, silent_segments: np.ndarray,
+                     stems: Optional[List[str]] = None,
+                     model_outputs: Optional[Dict[str, np.ndarray]] = None,
+                     fetch_model_outputs: bool = False
+                     ) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], SilenceReport]:
+        """
+        Separate a mixture stft without running the network on silent segments.
+        The network sees every other segment unchanged (segments are estimated
+        independently), its estimates are zero on silent segments, and samples
+        under silent frames only are written as zeros, so the stems are the
+        same as run() outside of silence. MWF filters with statistics of the
+        whole input, so it never skips.
+        Args:
+            stft: np.ndarray: complex64 (frames, frame_length // 2 + 1, 2) mixture stft
+            n_samples: int: number of samples of the source waveform
+            silent_segments: np.ndarray: bool (segments,) (see find_silent_segments)
+            stems: Optional[List[str]]: stems to compute (None: every stem)
+            model_outputs: Optional[Dict[str, np.ndarray]]: network estimates from an earlier run
+            fetch_model_outputs: bool: return the network estimates too
+        Returns:
+            Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], SilenceReport]:
+                (stems, network estimates or {} if not fetched, saved work)
+        """
+        segment_frames = self.params["T"]
+        report = SilenceReport(segments=silent_segments.shape[0])
+        if self.params["MWF"] or not silent_segments.any():
+            return (*self.run(stft, n_samples, stems, model_outputs, fetch_model_outputs), report)
+
+        if model_outputs is None:
+            padded = np.zeros((silent_segments.shape[0] * segment_frames,) + stft.shape[1:],
+                              dtype=np.complex64)
+            padded[:stft.shape[0]] = stft
+            loud_stft = padded.reshape((-1, segment_frames) + stft.shape[1:])[~silent_segments]
+            del padded
+            estimates_shape = (silent_segments.shape[0], segment_frames,
+                               self.params["F"], self.params["n_channels"])
+            loud_outputs = self._run_network(loud_stft.reshape((-1,) + stft.shape[1:])) \
+                if loud_stft.shape[0] > 0 else {}
+            model_outputs = {}
+            for name in self._model_outputs:
+                model_outputs[name] = np.zeros(estimates_shape, dtype=np.float32)
+                if name in loud_outputs:
+                    model_outputs[name][~silent_segments] = loud_outputs[name]
+            report.skipped_segments = int(silent_segments.sum())
+            report.skipped_seconds = report.skipped_segments * segment_frames * \
+                self.frame_step / SPLEETER_SAMPLE_RATE
+            report.saved_seconds = report.skipped_segments * self._segment_seconds
+            metrics_registry.inc("spleeter_silence_skipped_seconds_total",
+                                 report.skipped_seconds, **self.labels)
+            metrics_registry.inc("spleeter_inference_saved_seconds_total",
+                                 report.saved_seconds, **self.labels)
+        sources, _ = self.run(stft, n_samples, stems, model_outputs)
+
+        # zero the samples no loud frame reaches: frame j covers blocks [j - frame_blocks, j)
+        frame_blocks = -(-self.frame_length // self.frame_step)
+        loud_frames = np.repeat(~silent_segments, segment_frames)[:stft.shape[0]]
+        loud_count = np.concatenate([[0], np.cumsum(loud_frames)])
+        n_blocks = -(-n_samples // self.frame_step)
+        blocks = np.arange(n_blocks)
+        reached = loud_count[np.minimum(blocks + frame_blocks + 1, stft.shape[0])] - \
+            loud_count[np.minimum(blocks + 1, stft.shape[0])] > 0
+        silent_samples = np.repeat(~reached, self.frame_step)[:n_samples]
+        for data in sources.values():
+            data[silent_samples[:data.shape[0]]] = 0.0
+        return sources, model_outputs if fetch_model_outputs else {}, report
+
+    def separate_stft(self, stft: np.ndarray, n_samples: int) -> Dict[str, np.ndarray]:
+        """
+        Separate a mixture stft
+        Args:
+            stft: np.ndarray: complex64 (frames, frame_length // 2 + 1, 2) mixture stft
+            n_samples: int: number of samples of the source waveform
+        Returns:
+            Dict[str, np.ndarray]: stem name -> (n_samples, 2) waveform
+        """
+        return self.run(stft, n_samples)[0]
+
+    def separate(self, waveform: np.ndarray, audio_descriptor: str = "",
+                 silence_db: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Separate a waveform (same interface as spleeter's Separator.separate)
+        Args:
+            waveform: np.ndarray: (samples, channels) waveform
+            audio_descriptor: str: name shown in the silence skipping log
+            silence_db: Optional[float]: skip silent segments below this dBFS (None: no skipping)
+        Returns:
+            Dict[str, np.ndarray]: stem name -> (samples, 2) waveform
+        """
+        waveform = np.asarray(waveform, dtype=np.float32)
+        if waveform.shape[-1] == 1:
+            waveform = np.repeat(waveform, 2, axis=-1)
+        waveform = waveform[:, :2]
+        with span("stft") as current, progress_stage("stft"):
+            stft = compute_stft(waveform, self.frame_length, self.frame_step)
+            current.bytes_in, current.bytes_out = waveform.nbytes, stft.nbytes
+        if silence_db is None:
+            return self.separate_stft(stft, waveform.shape[0])
+        silent_segments = find_silent_segments(
+            waveform, silence_db, self.frame_length, self.frame_step, self.params["T"])
+        sources, _, report = self.run_skipping(stft, waveform.shape[0], silent_segments)
+        print_silence_report(audio_descriptor, report)
+        return sources
+
+
+# separator pool --------------------------------------------------------------
+# max number of loaded spleeter models kept in memory
+SEPARATOR_POOL_SIZE = int(os.environ.get("SPLEETER_POOL_SIZE", "2"))
+
+SeparatorKey = Tuple[str, bool, bool, str, int]
+
+
+def get_separator_key(config: SpleeterSettings) -> SeparatorKey:
+    """
+    Get separator pool key from spleeter settings
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        SeparatorKey: (split_mode name, use16kHZ, usemwf, backend, threads)
+    """
+    return (config.split_mode.value.name, config.use16kHZ, config.usemwf, config.backend.value,
+            config.threads)
+
+
+class SeparatorPool:
+    """
+    Process-wide pool of loaded spleeter separators.
+    Separators are kept by (split_mode, use16kHZ, usemwf, backend, threads) and the least
+    recently used one is dropped when the pool holds more than max_size models.
+    Attributes:
+        max_size (int): max number of loaded separators
+    """
+
+    def __init__(self, max_size: int = SEPARATOR_POOL_SIZE):
+        self.max_size = max(1, max_size)
+        self._lock = threading.Lock()
+        self._separators: "OrderedDict[SeparatorKey, SpectrogramSeparator]" = OrderedDict()
+        # one lock per model: a separator graph must not run concurrently
+        self._key_locks: Dict[SeparatorKey, threading.Lock] = {}
+
+    def _get_key_lock(self, key: SeparatorKey) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _load(self, key: SeparatorKey) -> SpectrogramSeparator:
+        with self._lock:
+            separator = self._separators.get(key)
+            if separator is not None:
+                self._separators.move_to_end(key)
+                return separator
+
+        split_mode_name, use16kHZ, usemwf, backend, threads = key
+        print(f"load separator: {key}")
+        separator = SpectrogramSeparator(
+            params_descriptor=f"spleeter:{split_mode_name}{'-16kHz' if use16kHZ else ''}",
+            MWF=usemwf,
+            backend=InferenceBackend(backend),
+            intra_op_threads=threads
+        )
+
+        with self._lock:
+            self._separators[key] = separator
+            self._separators.move_to_end(key)
+            while len(self._separators) > self.max_size:
+                # dropped without close(): it may still be in use, the session
+                # is released with its last reference
+                evicted_key, _ = self._separators.popitem(last=False)
+                print(f"evict separator: {evicted_key}")
+        return separator
+
+    @contextmanager
+    def acquire(self, config: SpleeterSettings) -> Iterator[SpectrogramSeparator]:
+        """
+        Borrow a loaded separator for the given settings
+        Args:
+            config: SpleeterSettings: spleeter settings
+        Returns:
+            Iterator[SpectrogramSeparator]: separator (use as context manager)
+        """
+        key = get_separator_key(config)
+        with self._get_key_lock(key):
+            yield self._load(key)
+
+    def loaded_keys(self) -> List[SeparatorKey]:
+        with self._lock:
+            return list(self._separators.keys())
+
+    def clear(self):
+        with self._lock:
+            self._separators.clear()
+
+
+separator_pool = SeparatorPool()
+
+
+# startup ---------------------------------------------------------------------
+# models loaded in background when the app starts (EX: "2stems-16kHz-mwf,4stems")
+PREWARM_MODELS = os.environ.get("SPLEETER_PREWARM_MODELS", "")
+
+_startup_metrics: Dict[str, float] = {}
+_startup_metrics_lock = threading.Lock()
+_prewarm_thread: Optional[threading.Thread] = None
+
+
+def record_startup_metric(name: str, since: float):
+    """
+    Record seconds to the first occurrence of an event
+    Args:
+        name: str: metric name (EX: time_to_first_render)
+        since: float: time.time() the event was started at (EX: app start)
+    """
+    with _startup_metrics_lock:
+        if name in _startup_metrics:
+            return
+        _startup_metrics[name] = time.time() - since
+    print(f"{name}: {_startup_metrics[name]:.2f}s")
+
+
+def get_startup_metrics() -> Dict[str, float]:
+    with _startup_metrics_lock:
+        return dict(_startup_metrics)
+
+
+def parse_model_spec(model_spec: str) -> SpleeterSettings:
+    """
+    Parse model spec like "4stems-16kHz-mwf" into spleeter settings
+    Args:
+        model_spec: str: [2stems|4stems|5stems][-16kHz][-mwf][-frozen|-tflite16|-tflite8]
+    Returns:
+        SpleeterSettings: settings (codec and bitrate are defaults)
+    """
+    name, *flags = model_spec.strip().split("-")
+    split_mode = next(mode for mode in SpleeterMode if mode.value.name == name)
+    backend = next((backend for backend in InferenceBackend if backend.value in flags),
+                   InferenceBackend.TENSORFLOW)
+    return SpleeterSettings(split_mode, Codec.MP3, 192,
+                            usemwf="mwf" in flags, use16kHZ="16kHz" in flags, backend=backend)
+
+
+def get_model_spec(config: SpleeterSettings) -> str:
+    """
+    Get model spec of spleeter settings (inverse of parse_model_spec)
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        str: model spec (EX: 4stems-16kHz-mwf)
+    """
+    flags = [flag for flag, enabled in (("16kHz", config.use16kHZ), ("mwf", config.usemwf))
+             if enabled]
+    if config.backend is not InferenceBackend.TENSORFLOW:
+        flags.append(config.backend.value)
+    return "-".join([config.split_mode.value.name] + flags)
+
+
+def warm_up_separator(config: SpleeterSettings):
+    """
+    Load a separator into the pool and run it once on silence, so that
+    the model graph and checkpoint are ready before the first split
+    Args:
+        config: SpleeterSettings: spleeter settings
+    """
+    with separator_pool.acquire(config) as separator:
+        separator.separate(np.zeros((SPLEETER_SAMPLE_RATE, 2), dtype=np.float32))
+
+
+def start_prewarm(model_specs: str = PREWARM_MODELS) -> Optional[threading.Thread]:
+    """
+    Warm up models on a background thread (once per process)
+    Args:
+        model_specs: str: comma separated model specs (see parse_model_spec)
+    Returns:
+        Optional[threading.Thread]: warm-up thread, None if there is nothing to warm up
+    """
+    global _prewarm_thread
+    configs = [parse_model_spec(spec)
+               for spec in model_specs.split(",") if spec.strip()]
+
+    def prewarm():
+        for config in configs:
+            try:
+                warm_up_separator(config)
+                print(f"prewarmed: {get_separator_key(config)}")
+            except Exception as e:
+                print(f"prewarm failed: {get_separator_key(config)} ({e!r})")
+
+    with _startup_metrics_lock:
+        if not configs or _prewarm_thread is not None:
+            return _prewarm_thread
+        _prewarm_thread = threading.Thread(
+            target=prewarm, name="spleeter-prewarm", daemon=True)
+        _prewarm_thread.start()
+    return _prewarm_thread
+
+
+# youtube ---------------------------------------------------------------------
+# number of playlist entries downloaded and transcoded at the same time
+YOUTUBE_DOWNLOAD_WORKERS = int(
+    os.environ.get("SPLEETER_YOUTUBE_WORKERS", "4"))
+# share of an entry's progress taken by the download (the rest is mp3 transcode)
+YOUTUBE_DOWNLOAD_PROGRESS_WEIGHT = 0.9
+# extracted metadata is reused this long; format urls in it are signed and expire
+YOUTUBE_INFO_TTL_SECONDS = 600
+
+
+@dataclass
+class YoutubeInfo:
+    """
+    Metadata of a youtube url, extracted once and reused for title and download
+    Attributes:
+        title (str): title of the video or "playlist: " + playlist title
+        items (List[YoutubeItemData]): videos to download
+        info (Optional[dict]): full extractor info of a single video
+        extracted_at (float): unix time of the extraction
+    """
+    title: str
+    items: List["YoutubeItemData"]
+    info: Optional[dict] = None
+    extracted_at: float = field(default_factory=time.time)
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.extracted_at < YOUTUBE_INFO_TTL_SECONDS
+
+
+class YoutubeDownloadError(Exception):
+    """
+    Some entries of a youtube url failed to download
+    Attributes:
+        files (List[Path]): mp3 files of the entries which were downloaded
+        errors (List[Tuple[str, str]]): (entry title, error) of the failed entries
+    """
+
+    def __init__(self, files: List[Path], errors: List[Tuple[str, str]]):
+        super().__init__("; ".join(f"{title}: {error}" for title, error in errors))
+        self.files = files
+        self.errors = errors
+
+
+_youtube_info_memo: "OrderedDict[str, YoutubeInfo]" = OrderedDict()
+_youtube_info_memo_lock = threading.Lock()
+
+
+def get_youtube_info(youtube_url: str) -> YoutubeInfo:
+    """
+    Extract metadata of a youtube url (memoized for YOUTUBE_INFO_TTL_SECONDS)
+    Playlists are extracted flat, so a playlist costs one request regardless of its length.
     Args:
         youtube_url: str: youtube url
     Returns:
-        str: title
+        YoutubeInfo: metadata
     """
-    # check if youtube url is playlist
-    if youtube_url.startswith("https://www.youtube.com/playlist?list="):
-        return "playlist: " + youtube_dl.YoutubeDL({}).extract_info(
-            youtube_url, download=False)["title"]
+    with _youtube_info_memo_lock:
+        youtube_info = _youtube_info_memo.get(youtube_url)
+        if youtube_info is not None and youtube_info.is_fresh:
+            return youtube_info
+
     # check if youtube url is video in playlist
-    elif(re.search(r'watch\?v=.*\&list=', youtube_url)):
-        return youtube_dl.YoutubeDL({}).extract_info(
-            youtube_url, download=False,)["entries"][0]["title"]
+    url = youtube_url
+    if re.search(r'watch\?v=.*\&list=', url):
+        # remove playlist id
+        url = re.sub(r'\&list=.*', '', url)
+
+    import yt_dlp as youtube_dl
+
+    with youtube_dl.YoutubeDL({"extract_flat": "in_playlist", "quiet": True}) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    # check if youtube url is playlist
+    if info.get("_type") == "playlist":
+        youtube_info = YoutubeInfo(
+            title="playlist: " + info["title"],
+            items=[
+                YoutubeItemData(
+                    title=entry.get("title") or entry["id"],
+                    url=entry.get("webpage_url") or entry["url"],
+                    id=entry["id"]
+                ) for entry in info["entries"] if entry
+            ])
     # check if youtube url is video
     else:
-        return youtube_dl.YoutubeDL({}).extract_info(
-            youtube_url, download=False)["title"]
+        youtube_info = YoutubeInfo(
+            title=info["title"],
+            items=[YoutubeItemData(
+                title=info["title"],
+                url=info.get("webpage_url") or url,
+                id=info["id"])],
+            info=info)
+
+    with _youtube_info_memo_lock:
+        _youtube_info_memo[youtube_url] = youtube_info
+        while len(_youtube_info_memo) > 32:
+            _youtube_info_memo.popitem(last=False)
+    return youtube_info
+
+
+def get_title_from_youtube_url(youtube_url: str) -> str:
+    """
+    Get title from youtube url
+    Args:
+        youtube_url: str: youtube url
+    Returns:
+        str: title
+    """
+    return get_youtube_info(youtube_url).title
 
 
 def strip_ansi_escape_codes(s):
@@ -109,6 +863,7 @@ def youtube_dl_percent_str_to_float(percent_str: str) -> float:
 class YoutubeItemData:
     title: str
     url: str
+    id: str = ""
 
 
 def progress_float_formatter(hookdata, current_num=1, total_num=1):
@@ -121,217 +876,2495 @@ def progress_float_formatter(hookdata, current_num=1, total_num=1):
         return progress
 
 
+def find_youtube_download(output_path: Path, video_id: str) -> Optional[Path]:
+    """
+    Find downloaded mp3 of a video by its id
+    Args:
+        output_path: Path: download directory
+        video_id: str: video id
+    Returns:
+        Optional[Path]: mp3 file path, None if not downloaded yet
+    """
+    if not output_path.exists():
+        return None
+    suffix = f" [{video_id}].mp3"
+    for file in output_path.iterdir():
+        if file.name.endswith(suffix):
+            return file
+    return None
+
+
 def download_youtube_as_mp3(youtube_url: str, output_path: Path,
                             progress_callback: Callable[[float], None],
-                            bit_rate: int = 192, ) -> List[Path]:
+                            bit_rate: int = 192,
+                            youtube_info: Optional[YoutubeInfo] = None) -> List[Path]:
     """
     Download youtube video as mp3
+    Playlist entries are downloaded and transcoded concurrently; entries
+    already downloaded (by video id) are skipped.
     Args:
         youtube_url: str: youtube url
         output_path: Path: output path
-        progress_callback: Callable[[float], None]: progress callback
+        progress_callback: Callable[[float], None]: progress callback (called from the caller's thread)
+        bit_rate: int: mp3 bitrate
+        youtube_info: Optional[YoutubeInfo]: metadata from get_youtube_info (extracted if None)
     Returns:
-        Tuple[bool, str]: (is_exist, output_file_path)
+        List[Path]: downloaded mp3 file paths
+    Raises:
+        YoutubeDownloadError: if an entry failed, with the files of the other entries
     """
-    youtube_item_list: List[YoutubeItemData]
+    import yt_dlp as youtube_dl
 
-    # check if youtube url is playlist
-    if youtube_url.startswith("https://www.youtube.com/playlist?list="):
-        playlist_info = youtube_dl.YoutubeDL({}).extract_info(
-            youtube_url, download=False)["entries"]
-        youtube_title_list = [
-            YoutubeItemData(
-                title=playlist_info[i]["title"],
-                url=playlist_info[i]["webpage_url"]
-            ) for i in range(len(playlist_info))
-        ]
-    # check if youtube url is video in playlist
-    elif(re.search(r'watch\?v=.*\&list=', youtube_url)):
-        # remove playlist id
-        youtube_url = re.sub(r'\&list=.*', '', youtube_url)
-        youtube_title_list = [
-            YoutubeItemData(
-                title=youtube_dl.YoutubeDL({}).extract_info(
-                    youtube_url, download=False,)["title"],
-                url=youtube_url
-            )]
-    # check if youtube url is video
-    else:
-        youtube_title_list = [
-            YoutubeItemData(
-                title=youtube_dl.YoutubeDL({}).extract_info(
-                    youtube_url, download=False,)["title"],
-                url=youtube_url
-            )]
-    current_num = 1
-
-    def progress_hook(x): return progress_callback(
-        youtube_dl_percent_str_to_float(x["_percent_str"])
-    )
+    if youtube_info is None:
+        youtube_info = get_youtube_info(youtube_url)
+    os.makedirs(output_path, exist_ok=True)
 
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl':  str(output_path.absolute()) + "/%(title)s.%(ext)s",
-        'progress_hooks': [progress_hook],
-        'postprocessors': [
-            {'key': 'FFmpegExtractAudio',
-             'preferredcodec': 'mp3',
-             'preferredquality': bit_rate},
-            {'key': 'FFmpegMetadata'},
-        ],
-    }
+    items = youtube_info.items
+    progress = [0.0] * len(items)
+    pending = []
+    for i, youtube_item in enumerate(items):
+        if find_youtube_download(output_path, youtube_item.id) is not None:
+            progress[i] = 1.0
+        else:
+            pending.append(i)
 
-    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-        for youtube_item in youtube_title_list:
-            current_num += 1
-            if os.path.exists(output_path / f"{youtube_item.title}.mp3"):
-                continue
-            ydl.download([youtube_item.url])
+    def download(i: int):
+        def progress_hook(hookdata):
+            total = hookdata.get("total_bytes") or hookdata.get(
+                "total_bytes_estimate")
+            if hookdata["status"] == "finished":
+                progress[i] = YOUTUBE_DOWNLOAD_PROGRESS_WEIGHT
+            elif total:
+                progress[i] = YOUTUBE_DOWNLOAD_PROGRESS_WEIGHT * \
+                    min(1.0, hookdata.get("downloaded_bytes", 0) / total)
+
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': str(output_path.absolute()) + "/%(title)s [%(id)s].%(ext)s",
+            'progress_hooks': [progress_hook],
+            'quiet': True,
+            'postprocessors': [
+                {'key': 'FFmpegExtractAudio',
+                 'preferredcodec': 'mp3',
+                 'preferredquality': bit_rate},
+                {'key': 'FFmpegMetadata'},
+            ],
+        }
+        # YoutubeDL instances are not thread safe: one per entry
+        with span("youtube_download") as current, youtube_dl.YoutubeDL(ydl_opts) as ydl:
+            if youtube_info.info is not None and youtube_info.is_fresh:
+                # reuse the metadata of the single video while its format urls are valid
+                ydl.process_ie_result(
+                    copy.deepcopy(youtube_info.info), download=True)
+            else:
+                ydl.download([items[i].url])
+            downloaded = find_youtube_download(output_path, items[i].id)
+            if downloaded is not None:
+                current.bytes_out = downloaded.stat().st_size
+        progress[i] = 1.0
+
+    errors: List[Tuple[str, str]] = []
+    progress_callback(sum(progress) / max(1, len(items)))
+    if pending:
+        with ThreadPoolExecutor(max_workers=YOUTUBE_DOWNLOAD_WORKERS) as executor:
+            future_to_index = {executor.submit(download, i): i for i in pending}
+            futures = list(future_to_index)
+            while futures:
+                done, not_done = wait(futures, timeout=0.5)
+                for future in done:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"youtube download failed: {e!r}")
+                        errors.append((items[future_to_index[future]].title,
+                                       strip_ansi_escape_codes(str(e))))
+                futures = list(not_done)
+                progress_callback(sum(progress) / max(1, len(items)))
 
     progress_callback(1.0)
-    return [output_path / f"{youtube_item.title}.mp3" for youtube_item in youtube_title_list]
+    downloaded = [find_youtube_download(output_path, youtube_item.id)
+                  for youtube_item in items]
+    files = [file for file in downloaded if file is not None]
+    if errors:
+        raise YoutubeDownloadError(files, errors)
+    return files
 
 
-def get_split_audio(config: SpleeterSettings,
-                    audio_file: Path,
-                    output_path: Path) -> Tuple[Generator[Path, None, None], bool]:
+# media catalog ---------------------------------------------------------------
+CATALOG_FILE_NAME = "catalog.sqlite3"
+AUDIO_FILE_SUFFIXES = {".wav", ".mp3", ".m4a", ".ogg", ".flac", ".wma"}
+
+
+def probe_audio(audio_file: Path) -> dict:
     """
-    Split audio file
+    Probe audio metadata by ffprobe
     Args:
-        SpleeterSettings: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
     Returns:
-        Tuple[Generator[Path, None, None], bool]: (output_files, is_exist)
+        dict: duration, sample_rate and channels (None if unknown)
     """
+    try:
+        probe = ffmpeg.probe(str(audio_file))
+    except ffmpeg.Error:
+        return {"duration": None, "sample_rate": None, "channels": None}
+    audio_stream = next((stream for stream in probe["streams"]
+                         if stream.get("codec_type") == "audio"), {})
+    duration = probe["format"].get("duration")
+    sample_rate = audio_stream.get("sample_rate")
+    return {
+        "duration": float(duration) if duration else None,
+        "sample_rate": int(sample_rate) if sample_rate else None,
+        "channels": audio_stream.get("channels"),
+    }
 
-    is_exist = False
-    output_path_base = Path(
-        output_path/f"{audio_file.stem}/{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else '-11kHz'}{'' if config.usemwf else '-noMWF'}/")
-    print("output_path_base:" + str(output_path_base))
 
-    # check if audio file exists
-    if os.path.exists(output_path_base/f"{audio_file.stem}_vocals.{config.codec.value}"):
-        print(
-            f"{audio_file.stem} [{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}] : already splited")
-        is_exist = True
+class MediaCatalog:
+    """
+    On-disk sqlite index of uploaded media and finished outputs.
+    Media rows hold probed metadata and content hash, output rows hold the
+    manifest of committed cache entries and zips, so listing and "already
+    split?" checks don't need filesystem scans.
+    Attributes:
+        db_path (Path): sqlite database path
+    """
 
-    else:
-        # create output path
-        os.makedirs(str(output_path_base.absolute()), exist_ok=True)
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        # shared by threads, serialized by self._lock; other processes use WAL
+        self._connection = sqlite3.connect(
+            str(self.db_path), timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS media (
+                    path TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    duration REAL,
+                    sample_rate INTEGER,
+                    channels INTEGER,
+                    added_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS media_hash ON media (hash);
+                CREATE TABLE IF NOT EXISTS outputs (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    audio_hash TEXT,
+                    path TEXT NOT NULL,
+                    manifest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS outputs_audio_hash ON outputs (audio_hash);
+                CREATE TABLE IF NOT EXISTS pins (
+                    key TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (key, owner)
+                );
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
 
-        # split audio file by using spleeter
-        separator = Separator(
-            params_descriptor=f"spleeter:{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}",
-            MWF=config.usemwf, multiprocess=False
-        )
-        separator.separate_to_file(
-            str(audio_file),
-            bitrate=f"{config.bitrate}k",
-            destination=str(output_path),
-            codec=config.codec,
-            filename_format=f"{{filename}}/{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else '-11kHz'}{'' if config.usemwf else '-noMWF'}/{{filename}}_{{instrument}}.{{codec}}",
-            duration=config.duration
-        )
+    def _execute(self, sql: str, parameters: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock, self._connection:
+            return self._connection.execute(sql, parameters).fetchall()
 
-    # return output file path list
-    return output_path_base.glob(f'*.{config.codec.value}'), is_exist
+    # media
+    def get_media(self, file_path: Path) -> Optional[sqlite3.Row]:
+        """
+        Get media row if the file is unchanged since it was cataloged
+        Args:
+            file_path: Path: media file path
+        Returns:
+            Optional[sqlite3.Row]: media row
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        rows = self._execute(
+            "SELECT * FROM media WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (str(Path(file_path).absolute()), stat.st_size, stat.st_mtime_ns))
+        return rows[0] if rows else None
 
+    def add_media(self, file_path: Path, file_hash: Optional[str] = None) -> sqlite3.Row:
+        """
+        Add or refresh a media file (hashed and probed only if it changed)
+        Args:
+            file_path: Path: media file path
+            file_hash: Optional[str]: content hash if already known
+        Returns:
+            sqlite3.Row: media row
+        """
+        row = self.get_media(file_path)
+        if row is not None and (file_hash is None or row["hash"] == file_hash):
+            return row
+        stat = os.stat(file_path)
+        file_hash = file_hash or get_file_hash(file_path)
+        metadata = probe_audio(file_path)
+        self._execute(
+            "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(Path(file_path).absolute()), file_hash, stat.st_size,
+             stat.st_mtime_ns, metadata["duration"], metadata["sample_rate"],
+             metadata["channels"], time.time()))
+        return self.get_media(file_path)
 
-def get_audio_separated_zip(config: SpleeterSettings,
-                            audio_file: Path,
-                            output_path: Path) -> Path:
-    """
-    Get separated audio zip file
-    Args:
-        audio_file: Path: audio file path
-        output_path: Path: audio file path
-        config: SpleeterSettings: spleeter settings
-    Returns:
-        Path: separated audio zip file path (EX: output_path/RYDEEN/RYDEEN_4stem.zip)
-    """
-    zip_file_basepath = Path(
-        output_path/f"{audio_file.stem}/{audio_file.stem}_{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}")
-    zip_file_path = zip_file_basepath.parent / \
-        Path(zip_file_basepath.name + ".zip")
+    def list_media(self, directory: Optional[Path] = None) -> List[Path]:
+        """
+        List cataloged media
+        Args:
+            directory: Optional[Path]: only list media in this directory
+        Returns:
+            List[Path]: media file paths ordered by name
+        """
+        if directory is None:
+            rows = self._execute("SELECT path FROM media")
+        else:
+            prefix = str(Path(directory).absolute()) + os.sep
+            rows = self._execute(
+                "SELECT path FROM media WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix))
+        return sorted((Path(row["path"]) for row in rows), key=lambda x: x.name)
 
-    # check if separated audio zip file already exists
-    if os.path.exists(zip_file_path):
-        print(
-            f"{audio_file.stem} [{config.split_mode.value.name}] : already zipped")
+    def remove_media(self, file_path: Path):
+        self._execute("DELETE FROM media WHERE path = ?",
+                      (str(Path(file_path).absolute()),))
 
-    # get split audio path list and zip them
-    else:
-        separated_audio_path_list, is_exist = get_split_audio(
-            config, audio_file, output_path)
-        separated_audio_path_parent: Path = separated_audio_path_list.__next__().parent
-        # zip separated audio folder
-        shutil.make_archive(
-            str(zip_file_basepath), 'zip', str(separated_audio_path_parent))
+    def sync_directory(self, directory: Path) -> List[Path]:
+        """
+        Catalog audio files of a directory which are new or changed, and
+        forget removed ones
+        Args:
+            directory: Path: media directory
+        Returns:
+            List[Path]: media file paths
+        """
+        if Path(directory).exists():
+            for file in Path(directory).iterdir():
+                if file.is_file() and not file.name.startswith(".") \
+                        and file.suffix.lower() in AUDIO_FILE_SUFFIXES:
+                    self.add_media(file)
+        for file in self.list_media(directory):
+            if not file.exists():
+                self.remove_media(file)
+        return self.list_media(directory)
 
-    return zip_file_path
+    # outputs
+    def add_output(self, key: str, kind: str, path: Path, manifest: dict,
+                   size: Optional[int] = None):
+        """
+        Add a finished output
+        Args:
+            key: str: cache key (or zip file name)
+            kind: str: output kind (EX: cache, raw, zip)
+            path: Path: output directory or file
+            manifest: dict: manifest of the output
+            size: Optional[int]: size in bytes (measured if None)
+        """
+        if size is None:
+            size = get_disk_usage(path)
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, manifest.get("audio_hash"), str(Path(path).absolute()),
+             json.dumps(manifest), size, now, now))
 
-# https://stackoverflow.com/questions/46229764/python-zip-multiple-directories-into-one-zip-file
+    def extend_output(self, key: str, manifest: dict, added_size: int) -> bool:
+        """
+        Replace the manifest of an extended output and add the size of its new files
+        Args:
+            key: str: cache key
+            manifest: dict: manifest of the output
+            added_size: int: bytes added to the output
+        Returns:
+            bool: False if the output is not in the catalog
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE outputs SET manifest = ?, size = size + ?, last_access = ? WHERE key = ?",
+                (json.dumps(manifest), added_size, time.time(), key))
+            return cursor.rowcount > 0
 
+    def get_output(self, key: str) -> Optional[dict]:
+        """
+        Get manifest of a finished output and mark it as recently used
+        Args:
+            key: str: cache key (or zip file name)
+        Returns:
+            Optional[dict]: manifest
+        """
+        rows = self._execute("SELECT manifest FROM outputs WHERE key = ?", (key,))
+        if not rows:
+            return None
+        self._execute("UPDATE outputs SET last_access = ? WHERE key = ?",
+                      (time.time(), key))
+        return json.loads(rows[0]["manifest"])
 
-def zipdir(path: Path, ziph):
-    # ziph is zipfile handle
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            ziph.write(os.path.join(root, file),
-                       os.path.relpath(os.path.join(root, file),
-                                       os.path.join(path, "..", "..")))
+    def list_outputs(self, audio_hash: str) -> List[dict]:
+        """
+        List finished outputs of a source
+        Args:
+            audio_hash: str: sha256 of the source audio file
+        Returns:
+            List[dict]: manifests
+        """
+        rows = self._execute(
+            "SELECT manifest FROM outputs WHERE audio_hash = ?", (audio_hash,))
+        return [json.loads(row["manifest"]) for row in rows]
 
+    def remove_output(self, key: str):
+        self._execute("DELETE FROM outputs WHERE key = ?", (key,))
 
-def zipit(dir_list, zip_name):
-    zipf = zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED)
-    for dir in dir_list:
-        zipdir(dir, zipf)
-    zipf.close()
+    def remove_outputs_under(self, directory: Path):
+        """
+        Forget outputs inside a removed directory (EX: the zip of a cache entry)
+        Args:
+            directory: Path: removed directory
+        """
+        prefix = str(Path(directory).absolute()) + os.sep
+        self._execute("DELETE FROM outputs WHERE substr(path, 1, ?) = ?",
+                      (len(prefix), prefix))
 
+    def list_all_outputs(self) -> List[sqlite3.Row]:
+        return self._execute("SELECT * FROM outputs")
 
-def get_multi_audio_separated_zip(config: SpleeterSettings,
-                                  audio_file_list: List[Path],
-                                  output_path: Path,
-                                  progress_callback: Callable[[float], None]) -> Path:
+    def list_all_media(self) -> List[sqlite3.Row]:
+        return self._execute("SELECT * FROM media")
+
+    # pins
+    def pin(self, key: str, owner: str, ttl: float = 3600.0):
+        """
+        Protect an output key or an audio hash from eviction until unpinned or expired
+        Args:
+            key: str: output key or audio hash
+            owner: str: pin owner (EX: job id, session id)
+            ttl: float: seconds until the pin expires
+        """
+        self._execute("INSERT OR REPLACE INTO pins VALUES (?, ?, ?)",
+                      (key, owner, time.time() + ttl))
+
+    def unpin(self, key: str, owner: str):
+        self._execute("DELETE FROM pins WHERE key = ? AND owner = ?", (key, owner))
+
+    def pinned_keys(self) -> set:
+        self._execute("DELETE FROM pins WHERE expires_at < ?", (time.time(),))
+        return {row["key"] for row in self._execute("SELECT key FROM pins")}
+
+    # stats
+    def increment_stat(self, name: str, value: int = 1):
+        self._execute(
+            "INSERT INTO stats VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, value))
+
+    def get_stats(self) -> Dict[str, int]:
+        return {row["name"]: row["value"]
+                for row in self._execute("SELECT * FROM stats")}
+
+
+_catalogs: Dict[str, MediaCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(output_path: Path) -> MediaCatalog:
     """
-    Get separated multiple audio into one zip file
+    Get the catalog stored in an output directory (one instance per process)
     Args:
-        audio_file_list: List[Path]: audio file path list
-        output_path: Path: audio file path
-        config: SpleeterSettings: spleeter settings
-        progress_callback: Callable[[None], float]: pass progress as float
+        output_path: Path: output root path
     Returns:
-        Path: separated audio zip file path (EX: output_path/5files-2stems_[filename's_hash].zip)
+        MediaCatalog: catalog
     """
-    progress_max = float(len(audio_file_list)) + 1.0
-    progress_count = 0.0
-    progress_callback(0.0)
-    # get hash of audio file list from each filename
-    audio_file_list_hash = hashlib.sha256(
-        str(audio_file_list.sort()).encode()).hexdigest()[:6]
+    db_path = str((Path(output_path) / CATALOG_FILE_NAME).absolute())
+    with _catalogs_lock:
+        if db_path not in _catalogs:
+            _catalogs[db_path] = MediaCatalog(Path(db_path))
+        return _catalogs[db_path]
 
-    zip_file_basepath = Path(
-        output_path/f"{len(audio_file_list)}files-{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}_{audio_file_list_hash}")
-    zip_file_path = zip_file_basepath.parent / \
-        Path(zip_file_basepath.name + ".zip")
 
-    # check if separated audio zip file already exists
-    if os.path.exists(zip_file_path):
-        print(
-            f"{zip_file_path.name} : already zipped")
+def get_disk_usage(path: Path) -> int:
+    """
+    Get size of a file or a directory tree in bytes
+    """
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
 
-    # get split audio path list and zip them
-    else:
-        separated_audio_parent_path_list = []
-        for audio_file in audio_file_list:
-            separated_audio_path_gen, is_exist_ = get_split_audio(
-                config, audio_file, output_path)
-            separated_audio_parent_path_list.append(
-                separated_audio_path_gen.__next__().parent)
-            progress_count += 1
-            progress_callback(progress_count/progress_max)
-
-        # zip all separated audio parent folder
-        zipit(separated_audio_parent_path_list, str(zip_file_path))
 
-    progress_callback(1.0)
-    return zip_file_path
+def get_audio_hash(audio_file: Path, output_path: Path) -> str:
+    """
+    Get content hash of an audio file through the catalog of output_path
+    Args:
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        str: sha256 hex digest
+    """
+    return get_catalog(output_path).add_media(audio_file)["hash"]
+
+
+@contextmanager
+def pinned(output_path: Path, keys: List[str], owner: str, ttl: float = 24 * 3600.0):
+    """
+    Pin output keys or audio hashes while the block runs
+    Args:
+        output_path: Path: output root path
+        keys: List[str]: output keys or audio hashes
+        owner: str: pin owner (EX: job id)
+        ttl: float: seconds until the pins expire if never released (EX: crash)
+    """
+    catalog = get_catalog(output_path)
+    for key in keys:
+        catalog.pin(key, owner, ttl)
+    try:
+        yield
+    finally:
+        for key in keys:
+            catalog.unpin(key, owner)
+
+
+# separation cache ------------------------------------------------------------
+# bump when the layout of a cache entry changes
+SEPARATION_CACHE_VERSION = 1
+CACHE_MANIFEST_NAME = "manifest.json"
+
+_file_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_file_hash_memo_lock = threading.Lock()
+
+
+def get_file_hash(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Get sha256 hash of file content (memoized by path, size and mtime)
+    Args:
+        file_path: Path: file path
+        chunk_size: int: read chunk size in bytes
+    Returns:
+        str: sha256 hex digest
+    """
+    stat = os.stat(file_path)
+    memo_key = (str(Path(file_path).absolute()), stat.st_size, stat.st_mtime_ns)
+    with _file_hash_memo_lock:
+        if memo_key in _file_hash_memo:
+            return _file_hash_memo[memo_key]
+
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    file_hash = sha256.hexdigest()
+
+    with _file_hash_memo_lock:
+        _file_hash_memo[memo_key] = file_hash
+    return file_hash
+
+
+def get_model_settings_dict(config: SpleeterSettings) -> dict:
+    """
+    Get every setting which affects the raw (not yet encoded) separated stems
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        dict: json serializable settings
+    """
+    settings = {
+        "split_mode": config.split_mode.value.name,
+        "use16kHZ": config.use16kHZ,
+        "usemwf": config.usemwf,
+        "duration": config.duration,
+        "streaming": config.streaming,
+    }
+    if config.skip_silence:
+        settings["skip_silence_db"] = SILENCE_THRESHOLD_DB
+    if config.backend is not InferenceBackend.TENSORFLOW:
+        settings["backend"] = config.backend.value
+    return settings
+
+
+def get_settings_dict(config: SpleeterSettings) -> dict:
+    """
+    Get every setting which affects the separated output
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        dict: json serializable settings
+    """
+    return {
+        **get_model_settings_dict(config),
+        "codec": config.codec.value,
+        "bitrate": config.bitrate,
+    }
+
+
+def get_output_settings_dict(config: SpleeterSettings) -> dict:
+    """
+    Get settings and requested stems, which together define a zip or a job
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        dict: json serializable settings
+    """
+    return {**get_settings_dict(config), "stems": get_output_stems(config)}
+
+
+def get_cache_key(audio_hash: str, settings: dict) -> str:
+    """
+    Get content addressed cache key
+    Args:
+        audio_hash: str: sha256 of the source audio file
+        settings: dict: settings which affect the cached data
+    Returns:
+        str: cache key
+    """
+    key_source = json.dumps({
+        "version": SEPARATION_CACHE_VERSION,
+        "audio_hash": audio_hash,
+        "settings": settings,
+    }, sort_keys=True)
+    return hashlib.sha256(key_source.encode()).hexdigest()[:32]
+
+
+def get_separation_cache_key(config: SpleeterSettings, audio_hash: str) -> str:
+    """
+    Get content addressed cache key of an encoded separation
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_hash: str: sha256 of the source audio file
+    Returns:
+        str: cache key
+    """
+    return get_cache_key(audio_hash, get_settings_dict(config))
+
+
+def get_separation_cache_dir(config: SpleeterSettings,
+                             audio_file: Path,
+                             output_path: Path) -> Path:
+    """
+    Get cache entry directory of an encoded separation
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        Path: cache entry directory (EX: output_path/cache/[key])
+    """
+    cache_key = get_separation_cache_key(
+        config, get_audio_hash(audio_file, output_path))
+    return output_path / "cache" / cache_key
+
+
+def get_raw_stems_dir(config: SpleeterSettings,
+                      audio_file: Path,
+                      output_path: Path) -> Path:
+    """
+    Get cache entry directory of raw separated stems (independent of codec and bitrate)
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        Path: cache entry directory (EX: output_path/raw/[key])
+    """
+    cache_key = get_cache_key(
+        get_audio_hash(audio_file, output_path), get_model_settings_dict(config))
+    return output_path / "raw" / cache_key
+
+
+def read_cache_manifest(cache_dir: Path, record_stats: bool = True) -> Optional[dict]:
+    """
+    Read manifest of a committed cache entry (from the catalog if indexed).
+    A hit always has every file of the entry.
+    Args:
+        cache_dir: Path: cache entry directory (output_path/[kind]/[key])
+        record_stats: bool: count the lookup as a hit or miss (False: the caller counts it)
+    Returns:
+        Optional[dict]: manifest, None if the entry is missing or incomplete
+    """
+    kind = cache_dir.parent.name
+    catalog = get_catalog(cache_dir.parent.parent)
+    manifest = catalog.get_output(cache_dir.name)
+    if manifest is not None and \
+            not all((cache_dir / stem).exists() for stem in manifest["stems"]):
+        # files removed behind the catalog's back (EX: rm -rf, crash while evicting)
+        catalog.remove_output(cache_dir.name)
+        manifest = None
+    if manifest is None:
+        try:
+            with open(cache_dir / CACHE_MANIFEST_NAME, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is not None:
+            if all((cache_dir / stem).exists() for stem in manifest["stems"]):
+                # entry committed before the catalog existed
+                catalog.add_output(cache_dir.name, kind, cache_dir, manifest)
+            else:
+                manifest = None
+    if record_stats:
+        record_cache_lookup(catalog, kind, manifest is not None)
+    return manifest
+
+
+def record_cache_lookup(catalog: MediaCatalog, kind: str, hit: bool):
+    """
+    Count a cache hit or miss in the catalog and in the metrics
+    Args:
+        catalog: MediaCatalog: catalog of the output root
+        kind: str: output kind (EX: cache, raw, zip)
+        hit: bool: the entry was found
+    """
+    result = "hit" if hit else "miss"
+    catalog.increment_stat(f"{kind}_{result}")
+    metrics_registry.inc("spleeter_cache_requests_total", kind=kind, result=result)
+
+
+def make_cache_tmp_dir(cache_dir: Path) -> Path:
+    """
+    Make a private working directory next to a cache entry
+    Args:
+        cache_dir: Path: cache entry directory
+    Returns:
+        Path: working directory to be committed by commit_cache_dir
+    """
+    os.makedirs(str(cache_dir.parent.absolute()), exist_ok=True)
+    return Path(tempfile.mkdtemp(
+        prefix=f".tmp-{cache_dir.name}-", dir=str(cache_dir.parent)))
+
+
+def commit_cache_dir(tmp_dir: Path, cache_dir: Path, manifest: dict) -> dict:
+    """
+    Write manifest and atomically move a finished entry into the cache
+    Args:
+        tmp_dir: Path: finished working directory (same filesystem)
+        cache_dir: Path: cache entry directory
+        manifest: dict: manifest of the entry
+    Returns:
+        dict: manifest of the committed entry (another worker's if it committed first)
+    """
+    with open(tmp_dir / CACHE_MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # same entry was committed by another worker in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        committed = read_cache_manifest(cache_dir)
+        if committed is None:
+            raise
+        return committed
+    get_catalog(cache_dir.parent.parent).add_output(
+        cache_dir.name, cache_dir.parent.name, cache_dir, manifest)
+    return manifest
+
+
+def extend_cache_dir(tmp_dir: Path, cache_dir: Path, manifest: dict) -> dict:
+    """
+    Move files of a working directory into a committed entry and replace its manifest.
+    Entries are only extended, so a concurrent extension at worst drops
+    files from the manifest, which are then made again.
+    Args:
+        tmp_dir: Path: working directory with the new files (same filesystem)
+        cache_dir: Path: committed cache entry directory
+        manifest: dict: manifest listing old and new files
+    Returns:
+        dict: manifest
+    """
+    # only the moved files are measured: the entry directory may hold other
+    # outputs, which are counted on their own (EX: the zip of a single file)
+    added_size = 0
+
+    def replace_file(file: Path, name: str):
+        nonlocal added_size
+        target = cache_dir / name
+        added_size += file.stat().st_size - (target.stat().st_size if target.exists() else 0)
+        os.replace(file, target)
+
+    for file in tmp_dir.iterdir():
+        replace_file(file, file.name)
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-manifest-", dir=str(cache_dir))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    replace_file(Path(tmp_name), CACHE_MANIFEST_NAME)
+    catalog = get_catalog(cache_dir.parent.parent)
+    if not catalog.extend_output(cache_dir.name, manifest, added_size):
+        catalog.add_output(cache_dir.name, cache_dir.parent.name, cache_dir, manifest)
+    return manifest
+
+
+# upload ingest ---------------------------------------------------------------
+# content addressed store of uploaded audio (named files are hard links to it)
+UPLOAD_OBJECTS_DIR_NAME = ".objects"
+INGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def remember_file_hash(file_path: Path, file_hash: str):
+    """
+    Record an already known content hash so get_file_hash() does not read the file again
+    Args:
+        file_path: Path: file path
+        file_hash: str: sha256 hex digest of the file
+    """
+    stat = os.stat(file_path)
+    memo_key = (str(Path(file_path).absolute()), stat.st_size, stat.st_mtime_ns)
+    with _file_hash_memo_lock:
+        _file_hash_memo[memo_key] = file_hash
+
+
+def escape_upload_file_name(file_name: str) -> str:
+    escaped_file_path = Path(Path(file_name).name)
+    # check if upload_file name last charactor is not space charactor
+    if(escaped_file_path.stem[-1:] == " "):
+        escaped_file_path = Path(
+            f"{escaped_file_path.stem.rstrip()}{escaped_file_path.suffix}")
+    return str(escaped_file_path)
+
+
+def ingest_upload(upload_file: BinaryIO, file_name: str, upload_path: Path) -> Tuple[Path, str]:
+    """
+    Copy an uploaded file to disk in chunks while hashing it.
+    Content is stored once under upload_path/.objects/[hash] and the named
+    file is a hard link to it, so duplicates under other names cost no disk.
+    Args:
+        upload_file: BinaryIO: readable uploaded file
+        file_name: str: uploaded file name
+        upload_path: Path: upload directory
+    Returns:
+        Tuple[Path, str]: (ingested file path, sha256 of the content)
+    """
+    objects_path = upload_path / UPLOAD_OBJECTS_DIR_NAME
+    os.makedirs(objects_path, exist_ok=True)
+    file_path = upload_path / escape_upload_file_name(file_name)
+
+    # stream to a temporary file and hash on the way
+    sha256 = hashlib.sha256()
+    fd, tmp_name = tempfile.mkstemp(prefix=".tmp-", dir=str(objects_path))
+    try:
+        with span("ingest") as current, os.fdopen(fd, 'wb') as f:
+            if hasattr(upload_file, "seek"):
+                upload_file.seek(0)
+            for chunk in iter(lambda: upload_file.read(INGEST_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                f.write(chunk)
+            current.bytes_in = current.bytes_out = f.tell()
+        file_hash = sha256.hexdigest()
+        object_path = objects_path / f"{file_hash}{file_path.suffix.lower()}"
+        if object_path.exists():
+            os.remove(tmp_name)
+        else:
+            os.replace(tmp_name, object_path)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+    # link the named file to the stored content
+    if not (file_path.exists() and os.path.samefile(file_path, object_path)):
+        tmp_link = upload_path / f".tmp-{file_hash}-{threading.get_ident()}"
+        try:
+            os.link(object_path, tmp_link)
+        except OSError:
+            # filesystem without hard links
+            shutil.copyfile(object_path, tmp_link)
+        os.replace(tmp_link, file_path)
+        print(f"upload file:{file_path}")
+
+    remember_file_hash(file_path, file_hash)
+    remember_file_hash(object_path, file_hash)
+    return file_path, file_hash
+
+
+# separation ------------------------------------------------------------------
+SPLEETER_SAMPLE_RATE = 44100
+# length of one separated window and of the cross-faded overlap between windows
+STREAMING_CHUNK_SECONDS = float(os.environ.get("SPLEETER_CHUNK_SECONDS", "30"))
+STREAMING_OVERLAP_SECONDS = 2.0
+# raw stems are stored as interleaved stereo little-endian float16
+RAW_STEM_DTYPE = np.dtype("<f2")
+RAW_STEM_SUFFIX = "f16"
+# samples piped to ffmpeg at once when encoding raw stems
+ENCODE_CHUNK_SAMPLES = SPLEETER_SAMPLE_RATE * 10
+
+
+def get_audio_duration(audio_file: Path) -> float:
+    """
+    Get audio duration by ffprobe
+    Args:
+        audio_file: Path: audio file path
+    Returns:
+        float: duration in seconds
+    """
+    return float(ffmpeg.probe(str(audio_file))["format"]["duration"])
+
+
+def open_stem_encoder(stem_path: Path, codec: Codec, bitrate: int,
+                      sample_rate: int = SPLEETER_SAMPLE_RATE) -> subprocess.Popen:
+    """
+    Open ffmpeg process which encodes stereo float32 pcm written to its stdin
+    Args:
+        stem_path: Path: output file path
+        codec: Codec: output codec
+        bitrate: int: output bitrate (kbps)
+        sample_rate: int: input sample rate
+    Returns:
+        subprocess.Popen: ffmpeg process
+    """
+    output_kwargs = {"ar": sample_rate, "strict": "-2",
+                     "audio_bitrate": f"{bitrate}k"}
+    # same codec mapping as spleeter's ffmpeg audio adapter
+    ffmpeg_codec = {"m4a": "aac", "ogg": "libvorbis",
+                    "wma": "wmav2"}.get(codec.value)
+    if ffmpeg_codec is not None:
+        output_kwargs["codec"] = ffmpeg_codec
+    return (
+        ffmpeg
+        .input("pipe:", format="f32le", ac=2, ar=sample_rate)
+        .output(str(stem_path), **output_kwargs)
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .run_async(pipe_stdin=True)
+    )
+
+
+def separate_waveform(separator: SpectrogramSeparator,
+                      config: SpleeterSettings,
+                      audio_file: Path,
+                      write: Callable[[str, np.ndarray], None],
+                      first_window: Optional[Dict[str, np.ndarray]] = None):
+    """
+    Separate audio file and pass every stem to write() in time order.
+    In streaming mode the audio is separated window by window; windows overlap
+    by STREAMING_OVERLAP_SECONDS and are linearly cross-faded, so peak memory
+    depends on the window length only.
+    Args:
+        separator: SpectrogramSeparator: loaded separator
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        write: Callable[[str, np.ndarray], None]: called with (stem, samples)
+        first_window: Optional[Dict[str, np.ndarray]]: every stem of an already
+            separated window at the start of the audio (EX: a preview), used
+            as the first window in streaming mode
+    """
+    sample_rate = SPLEETER_SAMPLE_RATE
+    silence_db = SILENCE_THRESHOLD_DB if config.skip_silence else None
+
+    if not config.streaming:
+        with progress_stage("decode"):
+            waveform = load_stereo_waveform(audio_file, duration=config.duration)
+        for stem, data in separator.separate(waveform, audio_file.name, silence_db).items():
+            write(stem, np.asarray(data, dtype=np.float32))
+        return
+
+    total_seconds = get_audio_duration(audio_file)
+    if config.duration is not None:
+        total_seconds = min(total_seconds, config.duration)
+    total_samples = int(total_seconds * sample_rate)
+    chunk = int(STREAMING_CHUNK_SECONDS * sample_rate)
+    overlap = int(STREAMING_OVERLAP_SECONDS * sample_rate)
+    # windows are the inference chunks
+    n_windows = max(1, -(-total_samples // chunk))
+    with progress_stage("inference"):
+        tails: Dict[str, np.ndarray] = {}
+        offset = 0
+        if first_window is not None:
+            window_length = min(data.shape[0] for data in first_window.values())
+            if window_length >= total_samples:
+                for stem, data in first_window.items():
+                    write(stem, np.asarray(data[:total_samples], dtype=np.float32))
+                return
+            if window_length > overlap:
+                offset = window_length - overlap
+                for stem, data in first_window.items():
+                    data = np.asarray(data[:window_length], dtype=np.float32)
+                    write(stem, data[:offset])
+                    tails[stem] = data[offset:].copy()
+
+        while offset < total_samples:
+            length = min(chunk + overlap, total_samples - offset)
+            waveform = load_stereo_waveform(
+                audio_file, duration=length / sample_rate, offset=offset / sample_rate)
+            if waveform.shape[0] == 0:
+                break
+            is_last = offset + chunk >= total_samples \
+                or waveform.shape[0] <= chunk
+            sources = separator.separate(waveform, audio_file.name, silence_db)
+
+            for stem, data in sources.items():
+                data = np.asarray(data, dtype=np.float32)
+                # cross-fade head of this window with tail of previous window
+                if stem in tails:
+                    n = min(tails[stem].shape[0], data.shape[0])
+                    fade_in = np.linspace(
+                        0.0, 1.0, n, dtype=np.float32)[:, np.newaxis]
+                    data[:n] = tails[stem][:n] * \
+                        (1.0 - fade_in) + data[:n] * fade_in
+                if is_last:
+                    write(stem, data)
+                else:
+                    write(stem, data[:chunk])
+                    tails[stem] = data[chunk:chunk + overlap].copy()
+
+            offset += chunk
+            progress_chunk(min(n_windows, -(-offset // chunk)), n_windows)
+            if is_last:
+                break
+
+
+def commit_raw_stems(config: SpleeterSettings,
+                     audio_file: Path,
+                     output_path: Path,
+                     produce: Callable[[Callable[[str, np.ndarray], None]], Optional[Dict[str, np.ndarray]]],
+                     manifest: Optional[dict] = None) -> Tuple[Path, dict]:
+    """
+    Write raw stems produced by produce(write) and commit them to the raw cache
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        produce: Callable: called with write(stem, samples), which appends samples to a stem;
+            may return network estimates to keep for the stems not written yet
+        manifest: Optional[dict]: committed entry to extend (None: new entry)
+    Returns:
+        Tuple[Path, dict]: (raw stems directory, manifest)
+    """
+    raw_dir = get_raw_stems_dir(config, audio_file, output_path)
+    tmp_dir = make_cache_tmp_dir(raw_dir)
+    try:
+        raw_files: Dict[str, BinaryIO] = {}
+        samples: Dict[str, int] = {}
+
+        def write(stem: str, data: np.ndarray):
+            if stem not in raw_files:
+                raw_files[stem] = open(tmp_dir / f"{stem}.{RAW_STEM_SUFFIX}", 'wb')
+                samples[stem] = 0
+            raw_files[stem].write(
+                np.ascontiguousarray(data, dtype=RAW_STEM_DTYPE).tobytes())
+            samples[stem] += data.shape[0]
+
+        try:
+            model_outputs = produce(write) or {}
+        finally:
+            for raw_file in raw_files.values():
+                raw_file.close()
+        for name, data in model_outputs.items():
+            np.ascontiguousarray(data, dtype=RAW_STEM_DTYPE).tofile(
+                str(tmp_dir / f"{name}.{RAW_STEM_SUFFIX}"))
+
+        if manifest is None:
+            new_manifest = {
+                "key": raw_dir.name,
+                "audio_hash": get_file_hash(audio_file),
+                "source_name": audio_file.name,
+                "settings": get_model_settings_dict(config),
+                "sample_rate": SPLEETER_SAMPLE_RATE,
+                "samples": {},
+                "model_outputs": {},
+            }
+        else:
+            new_manifest = copy.deepcopy(manifest)
+        new_manifest["samples"].update(samples)
+        new_manifest.setdefault("model_outputs", {}).update(
+            {name: list(data.shape) for name, data in model_outputs.items()})
+        new_manifest["stems"] = [
+            f"{stem}.{RAW_STEM_SUFFIX}" for stem in config.split_mode.value.stems
+            if stem in new_manifest["samples"]
+        ] + [f"{name}.{RAW_STEM_SUFFIX}" for name in new_manifest["model_outputs"]]
+
+        if manifest is None:
+            manifest = commit_cache_dir(tmp_dir, raw_dir, new_manifest)
+        else:
+            manifest = extend_cache_dir(tmp_dir, raw_dir, new_manifest)
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return raw_dir, manifest
+
+
+def get_missing_raw_stems(config: SpleeterSettings, manifest: Optional[dict]) -> List[str]:
+    """
+    Get requested stems which are not in a raw stems entry
+    Args:
+        config: SpleeterSettings: spleeter settings
+        manifest: Optional[dict]: raw stems manifest (None: no entry)
+    Returns:
+        List[str]: stem names
+    """
+    if manifest is None:
+        return get_output_stems(config)
+    return [stem for stem in get_output_stems(config) if stem not in manifest["samples"]]
+
+
+def get_raw_stems(config: SpleeterSettings,
+                  audio_file: Path,
+                  output_path: Path) -> Tuple[Path, dict]:
+    """
+    Get raw separated stems; the network runs only once per source and model settings.
+    Only the requested stems are made. When some stems are left out, the network
+    estimates are kept in the entry, so missing stems are added later from them.
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        Tuple[Path, dict]: (raw stems directory, manifest with at least the requested stems)
+    """
+    raw_dir = get_raw_stems_dir(config, audio_file, output_path)
+    manifest = read_cache_manifest(raw_dir)
+    missing = get_missing_raw_stems(config, manifest)
+    if not missing:
+        return raw_dir, manifest
+
+    def produce(write: Callable[[str, np.ndarray], None]) -> Optional[Dict[str, np.ndarray]]:
+        started = time.time()
+        if config.streaming:
+            # every window runs the network anyway: keep every stem
+            first_window = load_preview_window(config, audio_file, output_path)
+            with separator_pool.acquire(config) as separator:
+                separate_waveform(separator, config, audio_file, write, first_window)
+            record_startup_metric("time_to_first_separation", started)
+            return None
+
+        # decode and stft are shared with other models, and run
+        # before the model is locked
+        waveform, stft = get_analysis(config, audio_file, output_path)
+        model_outputs = None
+        if manifest is not None and manifest.get("model_outputs"):
+            model_outputs = {
+                name: np.memmap(raw_dir / f"{name}.{RAW_STEM_SUFFIX}", dtype=RAW_STEM_DTYPE,
+                                mode='r', shape=tuple(shape)).astype(np.float32)
+                for name, shape in manifest["model_outputs"].items()
+            }
+        # keep network estimates while some stems are left out
+        fetch_model_outputs = model_outputs is None and \
+            len(missing) < len(config.split_mode.value.stems)
+        with separator_pool.acquire(config) as separator:
+            if config.skip_silence:
+                silent_segments = find_silent_segments(
+                    waveform, SILENCE_THRESHOLD_DB, separator.frame_length,
+                    separator.frame_step, separator.params["T"])
+                sources, fetched, report = separator.run_skipping(
+                    stft, waveform.shape[0], silent_segments, missing,
+                    model_outputs, fetch_model_outputs)
+                print_silence_report(audio_file.name, report)
+            else:
+                sources, fetched = separator.run(
+                    stft, waveform.shape[0], missing, model_outputs, fetch_model_outputs)
+        del stft, model_outputs
+        for stem, data in sources.items():
+            write(stem, np.asarray(data, dtype=np.float32))
+        record_startup_metric("time_to_first_separation", started)
+        return fetched
+
+    raw_dir, manifest = commit_raw_stems(config, audio_file, output_path, produce, manifest)
+    if get_missing_raw_stems(config, manifest):
+        # another worker committed the entry first with other stems
+        return get_raw_stems(config, audio_file, output_path)
+    return raw_dir, manifest
+
+
+# analysis cache --------------------------------------------------------------
+# decoded waveform and mixture stft of a source, shared by every model and
+# output setting (EX: 2stems then 4stems of the same song decode and
+# transform it only once). Kept under output_path/analysis/[key].
+ANALYSIS_WAVEFORM_NAME = "waveform.f32"
+ANALYSIS_WAVEFORM_DTYPE = np.dtype("<f4")
+# stft is stored as computed (complex64), so a cached stft separates exactly
+# like a fresh one
+ANALYSIS_STFT_DTYPE = np.dtype("<c8")
+
+
+def get_stft_file_name(frame_length: int, frame_step: int) -> str:
+    return f"stft-{frame_length}-{frame_step}.c64"
+
+
+def load_stereo_waveform(audio_file: Path, duration: Optional[float] = None,
+                         offset: float = 0.0) -> np.ndarray:
+    """
+    Decode audio file as 44.1kHz stereo float32
+    Args:
+        audio_file: Path: audio file path
+        duration: Optional[float]: duration in seconds (None: whole audio)
+        offset: float: start position in seconds
+    Returns:
+        np.ndarray: (samples, 2) waveform
+    """
+    from spleeter.audio.adapter import AudioAdapter
+
+    with span("decode", format=audio_file.suffix.lstrip(".")) as current:
+        waveform, _ = AudioAdapter.default().load(
+            str(audio_file), offset=offset, duration=duration,
+            sample_rate=SPLEETER_SAMPLE_RATE)
+        waveform = np.asarray(waveform, dtype=np.float32)
+        if waveform.shape[-1] == 1:
+            waveform = np.repeat(waveform, 2, axis=-1)
+        current.bytes_in = audio_file.stat().st_size if offset == 0.0 and duration is None else 0
+        current.bytes_out = waveform[:, :2].nbytes
+    return waveform[:, :2]
+
+
+def get_analysis_dir(config: SpleeterSettings,
+                     audio_file: Path,
+                     output_path: Path) -> Path:
+    """
+    Get analysis cache entry directory (depends on the source and duration only)
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        Path: cache entry directory (EX: output_path/analysis/[key])
+    """
+    cache_key = get_cache_key(
+        get_audio_hash(audio_file, output_path),
+        {"duration": config.duration, "sample_rate": SPLEETER_SAMPLE_RATE})
+    return output_path / "analysis" / cache_key
+
+
+def add_analysis_stft(analysis_dir: Path, manifest: dict,
+                      frame_length: int, frame_step: int) -> dict:
+    """
+    Compute the stft of a cached waveform and add it to the analysis entry
+    Args:
+        analysis_dir: Path: analysis cache entry directory
+        manifest: dict: manifest of the entry
+        frame_length: int: fft size
+        frame_step: int: hop size
+    Returns:
+        dict: updated manifest
+    """
+    stft_name = get_stft_file_name(frame_length, frame_step)
+    waveform = load_analysis_waveform(analysis_dir, manifest)
+    tmp_dir = make_cache_tmp_dir(analysis_dir)
+    try:
+        with span("stft") as current, open(tmp_dir / stft_name, 'wb') as f:
+            for block in iter_stft_blocks(waveform, frame_length, frame_step):
+                f.write(block.astype(ANALYSIS_STFT_DTYPE).tobytes())
+            current.bytes_in, current.bytes_out = waveform.nbytes, f.tell()
+
+        manifest = dict(manifest)
+        manifest["stems"] = sorted(set(manifest["stems"]) | {stft_name})
+        manifest["stft"] = dict(manifest.get("stft", {}))
+        manifest["stft"][stft_name] = {
+            "frame_length": frame_length, "frame_step": frame_step,
+            "frames": -(-(waveform.shape[0] + frame_length) // frame_step),
+        }
+        return extend_cache_dir(tmp_dir, analysis_dir, manifest)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_analysis_waveform(analysis_dir: Path, manifest: dict) -> np.ndarray:
+    """
+    Memory map cached waveform
+    Args:
+        analysis_dir: Path: analysis cache entry directory
+        manifest: dict: manifest of the entry
+    Returns:
+        np.ndarray: read only (samples, 2) float32 waveform
+    """
+    if manifest["samples"] == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    return np.memmap(analysis_dir / ANALYSIS_WAVEFORM_NAME,
+                     dtype=ANALYSIS_WAVEFORM_DTYPE, mode='r',
+                     shape=(manifest["samples"], 2))
+
+
+def get_analysis(config: SpleeterSettings,
+                 audio_file: Path,
+                 output_path: Path,
+                 frame_length: int = SPLEETER_FRAME_LENGTH,
+                 frame_step: int = SPLEETER_FRAME_STEP) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get decoded waveform and mixture stft of a source, computing each only once
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        frame_length: int: fft size
+        frame_step: int: hop size
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: memory mapped ((samples, 2) waveform,
+            complex64 (frames, frame_length // 2 + 1, 2) stft)
+    """
+    analysis_dir = get_analysis_dir(config, audio_file, output_path)
+    manifest = read_cache_manifest(analysis_dir)
+    if manifest is None:
+        tmp_dir = make_cache_tmp_dir(analysis_dir)
+        try:
+            with progress_stage("decode"):
+                waveform = load_stereo_waveform(audio_file, duration=config.duration)
+                waveform.astype(ANALYSIS_WAVEFORM_DTYPE).tofile(
+                    str(tmp_dir / ANALYSIS_WAVEFORM_NAME))
+            manifest = {
+                "key": analysis_dir.name,
+                "audio_hash": get_file_hash(audio_file),
+                "source_name": audio_file.name,
+                "settings": {"duration": config.duration},
+                "sample_rate": SPLEETER_SAMPLE_RATE,
+                "samples": waveform.shape[0],
+                "stems": [ANALYSIS_WAVEFORM_NAME],
+            }
+            del waveform
+            commit_cache_dir(tmp_dir, analysis_dir, manifest)
+        finally:
+            if tmp_dir.exists():
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    stft_name = get_stft_file_name(frame_length, frame_step)
+    if stft_name not in manifest["stems"]:
+        with progress_stage("stft"):
+            manifest = add_analysis_stft(analysis_dir, manifest, frame_length, frame_step)
+
+    waveform = load_analysis_waveform(analysis_dir, manifest)
+    frames = manifest["stft"][stft_name]["frames"]
+    stft = np.memmap(analysis_dir / stft_name, dtype=ANALYSIS_STFT_DTYPE, mode='r',
+                     shape=(frames, frame_length // 2 + 1, 2))
+    return waveform, stft
+
+
+# preview ---------------------------------------------------------------------
+# default length of a preview window
+PREVIEW_SECONDS = 20.0
+# previews are encoded small to be played right away
+PREVIEW_CODEC = Codec.MP3
+PREVIEW_BITRATE = 64
+
+
+def get_preview_settings_dict(config: SpleeterSettings, offset: float, duration: float) -> dict:
+    """
+    Get every setting which affects a preview
+    Args:
+        config: SpleeterSettings: spleeter settings
+        offset: float: window start in seconds
+        duration: float: window length in seconds
+    Returns:
+        dict: json serializable settings
+    """
+    return {
+        "split_mode": config.split_mode.value.name,
+        "use16kHZ": config.use16kHZ,
+        "usemwf": config.usemwf,
+        "backend": config.backend.value,
+        "offset": offset,
+        "seconds": duration,
+    }
+
+
+def get_preview(config: SpleeterSettings,
+                audio_file: Path,
+                output_path: Path,
+                offset: float = 0.0,
+                duration: float = PREVIEW_SECONDS) -> List[Path]:
+    """
+    Separate a short window of an audio file with the loaded model and encode
+    its stems at a low bitrate. Previews are cached under output_path/preview,
+    apart from full runs; a preview from the start of the audio is reused as
+    the first window of a later streaming run.
+    Args:
+        config: SpleeterSettings: spleeter settings (codec and bitrate are not used)
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        offset: float: window start in seconds
+        duration: float: window length in seconds
+    Returns:
+        List[Path]: encoded stems of the requested stems
+    Raises:
+        ValueError: if the window starts after the end of the audio
+    """
+    settings = get_preview_settings_dict(config, offset, duration)
+    preview_dir = output_path / "preview" / get_cache_key(
+        get_audio_hash(audio_file, output_path), settings)
+    stem_names = [f"{stem}.{PREVIEW_CODEC.value}" for stem in get_output_stems(config)]
+    if read_cache_manifest(preview_dir) is not None:
+        return [preview_dir / name for name in stem_names]
+
+    waveform = load_stereo_waveform(audio_file, duration=duration, offset=offset)
+    if waveform.shape[0] == 0:
+        raise ValueError(f"{audio_file.name} is shorter than {offset} seconds")
+    with separator_pool.acquire(config) as separator:
+        # every stem: the window can be the first window of a full run
+        sources = separator.separate(waveform)
+
+    tmp_dir = make_cache_tmp_dir(preview_dir)
+    try:
+        for stem, data in sources.items():
+            np.ascontiguousarray(data, dtype=RAW_STEM_DTYPE).tofile(
+                str(tmp_dir / f"{stem}.{RAW_STEM_SUFFIX}"))
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = [
+                executor.submit(encode_raw_stem, data,
+                                tmp_dir / f"{stem}.{PREVIEW_CODEC.value}",
+                                PREVIEW_CODEC, PREVIEW_BITRATE)
+                for stem, data in sources.items()
+            ]
+            for future in futures:
+                future.result()
+        commit_cache_dir(tmp_dir, preview_dir, {
+            "key": preview_dir.name,
+            "preview": True,
+            "audio_hash": get_file_hash(audio_file),
+            "source_name": audio_file.name,
+            "settings": settings,
+            "sample_rate": SPLEETER_SAMPLE_RATE,
+            "samples": waveform.shape[0],
+            "raw_stems": list(sources.keys()),
+            "stems": [f"{stem}.{ext}" for stem in sources
+                      for ext in (RAW_STEM_SUFFIX, PREVIEW_CODEC.value)],
+        })
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return [preview_dir / name for name in stem_names]
+
+
+def load_preview_window(config: SpleeterSettings,
+                        audio_file: Path,
+                        output_path: Path) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Find the longest cached preview from the start of the audio with the same model
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+    Returns:
+        Optional[Dict[str, np.ndarray]]: memory-mapped (samples, 2) raw stems, None if not found
+    """
+    model_settings = get_preview_settings_dict(config, 0.0, 0.0)
+    del model_settings["seconds"]
+    candidates = [
+        manifest for manifest in get_catalog(output_path).list_outputs(
+            get_audio_hash(audio_file, output_path))
+        if manifest.get("preview") and manifest["samples"] > 0
+        and {k: manifest["settings"].get(k) for k in model_settings} == model_settings
+        and set(manifest["raw_stems"]) == set(config.split_mode.value.stems)
+    ]
+    if not candidates:
+        return None
+    manifest = max(candidates, key=lambda x: x["samples"])
+    preview_dir = output_path / "preview" / manifest["key"]
+    try:
+        return {
+            stem: np.memmap(preview_dir / f"{stem}.{RAW_STEM_SUFFIX}", dtype=RAW_STEM_DTYPE,
+                            mode='r', shape=(manifest["samples"], 2))
+            for stem in manifest["raw_stems"]
+        }
+    except OSError:
+        # evicted meanwhile
+        return None
+
+
+# renditions ------------------------------------------------------------------
+# small stand-ins of stems and sources for the page: a short low-bitrate
+# excerpt and the waveform peaks, kept under output_path/rendition/[key]
+RENDITION_SECONDS = float(os.environ.get("SPLEETER_RENDITION_SECONDS", "60"))
+RENDITION_FILE_NAME = f"preview.{PREVIEW_CODEC.value}"
+WAVEFORM_PEAKS = 400
+# peaks are taken from a low sample rate mono decode
+PEAKS_SAMPLE_RATE = 8000
+PEAKS_BLOCK_SAMPLES = 256
+
+
+def get_waveform_peaks(audio_file: Path, n_peaks: int = WAVEFORM_PEAKS) -> List[float]:
+    """
+    Get peak levels of the whole audio, decoded block by block
+    Args:
+        audio_file: Path: audio file path
+        n_peaks: int: number of peaks
+    Returns:
+        List[float]: max absolute amplitude (0.0 to 1.0) of n_peaks equal parts
+    """
+    decoder = (
+        ffmpeg
+        .input(str(audio_file))
+        .output("pipe:", format="f32le", ac=1, ar=PEAKS_SAMPLE_RATE)
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdout=True)
+    )
+    block_bytes = PEAKS_BLOCK_SAMPLES * 4
+    block_peaks = []
+    try:
+        # pipes may return partial blocks: the rest waits for the next read
+        pending = b""
+        while True:
+            data = decoder.stdout.read(block_bytes * 256)
+            pending += data
+            if not data:
+                # last partial block, padded with silence
+                pending = pending[:len(pending) // 4 * 4]
+                pending += b"\0" * (-len(pending) % block_bytes)
+            whole = len(pending) // block_bytes * block_bytes
+            if whole:
+                samples = np.frombuffer(pending[:whole], dtype="<f4")
+                block_peaks.append(np.abs(samples.reshape(-1, PEAKS_BLOCK_SAMPLES)).max(axis=1))
+                pending = pending[whole:]
+            if not data:
+                break
+    finally:
+        decoder.stdout.close()
+        if decoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {audio_file.name}")
+    if not block_peaks:
+        return [0.0] * n_peaks
+    peaks = np.concatenate(block_peaks)
+    # equal parts of blocks; parts shorter than a block repeat it
+    edges = np.linspace(0, peaks.shape[0], n_peaks + 1).astype(int)
+    return [round(min(1.0, float(peaks[lo:max(hi, lo + 1)].max())), 3)
+            for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def get_rendition(audio_file: Path, output_path: Path) -> Tuple[Path, List[float]]:
+    """
+    Get a short low-bitrate excerpt and the waveform peaks of an audio file,
+    made once per file content
+    Args:
+        audio_file: Path: audio file path (stem, remix or source)
+        output_path: Path: output root path
+    Returns:
+        Tuple[Path, List[float]]: (excerpt EX: output_path/rendition/[key]/preview.mp3,
+            peaks of the whole audio, see get_waveform_peaks)
+    """
+    audio_hash = get_file_hash(audio_file)
+    rendition_dir = output_path / "rendition" / get_cache_key(audio_hash, {
+        "codec": PREVIEW_CODEC.value,
+        "bitrate": PREVIEW_BITRATE,
+        "seconds": RENDITION_SECONDS,
+        "peaks": WAVEFORM_PEAKS,
+    })
+    manifest = read_cache_manifest(rendition_dir)
+    if manifest is None:
+        tmp_dir = make_cache_tmp_dir(rendition_dir)
+        try:
+            with span("rendition") as current:
+                input_kwargs = {"t": RENDITION_SECONDS} if RENDITION_SECONDS > 0 else {}
+                (
+                    ffmpeg
+                    .input(str(audio_file), **input_kwargs)
+                    .output(str(tmp_dir / RENDITION_FILE_NAME),
+                            audio_bitrate=f"{PREVIEW_BITRATE}k")
+                    .global_args("-loglevel", "error")
+                    .overwrite_output()
+                    .run()
+                )
+                peaks = get_waveform_peaks(audio_file)
+                current.bytes_in = audio_file.stat().st_size
+                current.bytes_out = (tmp_dir / RENDITION_FILE_NAME).stat().st_size
+            manifest = commit_cache_dir(tmp_dir, rendition_dir, {
+                "key": rendition_dir.name,
+                "audio_hash": audio_hash,
+                "source_name": audio_file.name,
+                "peaks": peaks,
+                "stems": [RENDITION_FILE_NAME],
+            })
+        finally:
+            if tmp_dir.exists():
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+    return rendition_dir / RENDITION_FILE_NAME, manifest["peaks"]
+
+
+def make_renditions(audio_files: List[Path], output_path: Path):
+    """
+    Make renditions of new outputs; a failure leaves the rendition to be
+    made when the page asks for it
+    Args:
+        audio_files: List[Path]: new output files
+        output_path: Path: output root path
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(audio_files))) as executor:
+        futures = {executor.submit(get_rendition, audio_file, output_path): audio_file
+                   for audio_file in audio_files}
+        for future, audio_file in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{audio_file.name} : no rendition ({e!r})")
+
+
+# packed inference ------------------------------------------------------------
+# max stft frames of short clips packed into one model invocation (0: disabled)
+INFERENCE_BATCH_FRAMES = int(os.environ.get("SPLEETER_BATCH_FRAMES", "8192"))
+# only clips up to this length are packed
+PACKED_CLIP_MAX_SECONDS = 60.0
+# spleeter models cut the stft into independent segments of T frames
+SPLEETER_SEGMENT_FRAMES = 512
+
+
+def separate_packed(config: SpleeterSettings,
+                    audio_file_list: List[Path],
+                    output_path: Path,
+                    progress_callback: Callable[[float], None],
+                    max_batch_frames: int = INFERENCE_BATCH_FRAMES) -> List[Path]:
+    """
+    Separate many short clips with few model invocations.
+    Clips are concatenated into one waveform, each clip starting on a model
+    segment boundary and padded with zeros to whole segments, so the model sees
+    the same segments as when it runs on every clip alone. The separated
+    waveform is cut back into clips and committed to the raw stems cache.
+    MWF estimates its filter over the whole input, so it is never packed.
+    A clip which can't be read is left to the per-file path; when a packed
+    invocation fails, the clips of its group are separated one by one.
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: output root path
+        progress_callback: Callable[[float], None]: called with packed files ratio
+        max_batch_frames: int: max stft frames per model invocation
+    Returns:
+        List[Path]: audio files whose raw stems were separated here
+    """
+    if max_batch_frames <= 0 or config.usemwf or config.streaming:
+        return []
+
+    started = time.time()
+    segment_samples = SPLEETER_SEGMENT_FRAMES * SPLEETER_FRAME_STEP
+    max_batch_segments = max(1, max_batch_frames // SPLEETER_SEGMENT_FRAMES)
+    max_seconds = PACKED_CLIP_MAX_SECONDS if config.duration is None \
+        else min(PACKED_CLIP_MAX_SECONDS, config.duration)
+    catalog = get_catalog(output_path)
+
+    candidates = []
+    for audio_file in audio_file_list:
+        try:
+            duration = catalog.add_media(audio_file)["duration"]
+            if duration is None or duration > max_seconds \
+                    or audio_file in candidates \
+                    or read_cache_manifest(get_raw_stems_dir(config, audio_file, output_path)) is not None:
+                continue
+        except Exception as e:
+            # leave it to the per-file path, which reports the error
+            print(f"{audio_file.name} : not packed ({e!r})")
+            continue
+        candidates.append(audio_file)
+    if len(candidates) < 2:
+        return []
+
+    separated: List[Path] = []
+
+    def separate_group(group: List[Tuple[Path, np.ndarray]]):
+        # lay clips out on segment boundaries
+        offsets = []
+        total = 0
+        for audio_file, waveform in group:
+            offsets.append(total)
+            # one extra frame of zeros so the clip's last frames don't see the next clip
+            total += -(-(waveform.shape[0] + SPLEETER_FRAME_STEP * 4)
+                       // segment_samples) * segment_samples
+        packed = np.zeros((total, 2), dtype=np.float32)
+        for (audio_file, waveform), offset in zip(group, offsets):
+            packed[offset:offset + waveform.shape[0]] = waveform
+
+        try:
+            with separator_pool.acquire(config) as separator:
+                # padding between clips is silence too
+                sources = separator.separate(
+                    packed, "packed", SILENCE_THRESHOLD_DB if config.skip_silence else None)
+        except Exception as e:
+            print(f"{len(group)} clips : packed separation failed ({e!r}), separating one by one")
+            sources = None
+        del packed
+        if sources is None:
+            for audio_file, waveform in group:
+                try:
+                    list(get_split_audio(config, audio_file, output_path)[0])
+                except Exception as e:
+                    # the per-file path reports it again
+                    print(f"{audio_file.name} : not separated ({e!r})")
+                    continue
+                separated.append(audio_file)
+                progress_callback(len(separated) / len(candidates))
+            return
+        record_startup_metric("time_to_first_separation", started)
+
+        for (audio_file, waveform), offset in zip(group, offsets):
+            def produce(write: Callable[[str, np.ndarray], None]):
+                for stem, data in sources.items():
+                    write(stem, data[offset:offset + waveform.shape[0]])
+            try:
+                commit_raw_stems(config, audio_file, output_path, produce)
+            except Exception as e:
+                # leave it to the per-file path, which reports the error
+                print(f"{audio_file.name} : not packed ({e!r})")
+                continue
+            separated.append(audio_file)
+            progress_callback(len(separated) / len(candidates))
+
+    group: List[Tuple[Path, np.ndarray]] = []
+    group_segments = 0
+    for audio_file in candidates:
+        try:
+            waveform = load_stereo_waveform(audio_file, duration=config.duration)
+        except Exception as e:
+            # leave it to the per-file path, which reports the error
+            print(f"{audio_file.name} : not packed ({e!r})")
+            continue
+        segments = -(-(waveform.shape[0] + SPLEETER_FRAME_STEP * 4)
+                     // segment_samples)
+        if group and group_segments + segments > max_batch_segments:
+            separate_group(group)
+            group, group_segments = [], 0
+        group.append((audio_file, waveform))
+        group_segments += segments
+    if group:
+        separate_group(group)
+
+    return separated
+
+
+def load_raw_stem(raw_dir: Path, manifest: dict, stem: str) -> np.ndarray:
+    """
+    Memory-map a raw stem
+    Args:
+        raw_dir: Path: raw stems directory
+        manifest: dict: raw stems manifest
+        stem: str: stem name (EX: vocals)
+    Returns:
+        np.ndarray: (samples, 2) float16 memory-mapped array
+    """
+    samples = manifest["samples"][stem]
+    if samples == 0:
+        return np.zeros((0, 2), dtype=RAW_STEM_DTYPE)
+    return np.memmap(raw_dir / f"{stem}.{RAW_STEM_SUFFIX}", dtype=RAW_STEM_DTYPE,
+                     mode='r', shape=(samples, 2))
+
+
+def encode_raw_stem(raw_stem: np.ndarray, stem_path: Path, codec: Codec,
+                    bitrate: int, sample_rate: int = SPLEETER_SAMPLE_RATE):
+    """
+    Encode a raw stem by piping it to ffmpeg chunk by chunk
+    Args:
+        raw_stem: np.ndarray: (samples, 2) raw stem
+        stem_path: Path: output file path
+        codec: Codec: output codec
+        bitrate: int: output bitrate (kbps)
+        sample_rate: int: sample rate of the raw stem
+    """
+    with span("encode", codec=codec.value) as current:
+        encoder = open_stem_encoder(stem_path, codec, bitrate, sample_rate)
+        try:
+            for start in range(0, raw_stem.shape[0], ENCODE_CHUNK_SAMPLES):
+                encoder.stdin.write(np.ascontiguousarray(
+                    raw_stem[start:start + ENCODE_CHUNK_SAMPLES],
+                    dtype=np.float32).tobytes())
+        finally:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to encode {stem_path.name}")
+        current.bytes_in = raw_stem.nbytes
+        current.bytes_out = stem_path.stat().st_size
+
+
+def get_stem_file_names(config: SpleeterSettings) -> List[str]:
+    """
+    Get encoded file names of the requested stems
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        List[str]: file names (EX: ["vocals.mp3", "drums.mp3"])
+    """
+    return [f"{stem}.{config.codec.value}" for stem in get_output_stems(config)]
+
+
+def get_split_audio(config: SpleeterSettings,
+                    audio_file: Path,
+                    output_path: Path) -> Tuple[Generator[Path, None, None], bool]:
+    """
+    Split audio file
+    Results are cached by the content hash of the audio file and the settings,
+    so same audio uploaded under different names is separated only once.
+    Separation and encoding are cached separately: a codec or bitrate change
+    only re-encodes the cached raw stems.
+    Only the requested stems (config.stems) are separated and encoded; stems
+    requested later are added to the same cache entries.
+    Args:
+        SpleeterSettings: SpleeterSettings: spleeter settings
+    Returns:
+        Tuple[Generator[Path, None, None], bool]: (output_files, is_exist)
+    """
+
+    is_exist = False
+    cache_dir = get_separation_cache_dir(config, audio_file, output_path)
+    print("cache_dir:" + str(cache_dir))
+    stem_names = get_stem_file_names(config)
+
+    # check if separated audio exists
+    manifest = read_cache_manifest(cache_dir)
+    missing = [stem for stem in get_output_stems(config)
+               if manifest is None or f"{stem}.{config.codec.value}" not in manifest["stems"]]
+    if not missing:
+        print(
+            f"{audio_file.stem} [{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}] : already splited")
+        is_exist = True
+
+    else:
+        raw_dir, raw_manifest = get_raw_stems(config, audio_file, output_path)
+
+        # encode missing stems in parallel into a private working directory
+        tmp_dir = make_cache_tmp_dir(cache_dir)
+        try:
+            with progress_stage("encode"), \
+                    ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                futures = [
+                    executor.submit(
+                        encode_raw_stem,
+                        load_raw_stem(raw_dir, raw_manifest, stem),
+                        tmp_dir / f"{stem}.{config.codec.value}",
+                        config.codec, config.bitrate,
+                        raw_manifest["sample_rate"])
+                    for stem in missing
+                ]
+                # stems are the encode chunks
+                for i, future in enumerate(as_completed(futures)):
+                    future.result()
+                    progress_chunk(i + 1, len(futures))
+            if manifest is None:
+                manifest = commit_cache_dir(tmp_dir, cache_dir, {
+                    "key": cache_dir.name,
+                    "raw_key": raw_dir.name,
+                    "audio_hash": get_file_hash(audio_file),
+                    "source_name": audio_file.name,
+                    "settings": get_settings_dict(config),
+                    "stems": stem_names,
+                })
+            else:
+                encoded = set(manifest["stems"]) | set(stem_names)
+                manifest = extend_cache_dir(tmp_dir, cache_dir, {
+                    **manifest,
+                    "stems": [f"{stem}.{config.codec.value}" for stem in config.split_mode.value.stems
+                              if f"{stem}.{config.codec.value}" in encoded],
+                })
+        finally:
+            if tmp_dir.exists():
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not set(stem_names) <= set(manifest["stems"]):
+            # another worker committed the entry first with other stems
+            return get_split_audio(config, audio_file, output_path)
+
+    # return output file path list
+    return (cache_dir / stem for stem in stem_names), is_exist
+
+
+@dataclass
+class ZipOutput:
+    """
+    Zip of separated stems, built once (see build_zip_output)
+    Attributes:
+        path (Path): zip file path
+        named_file_list (List[Tuple[str, List[Path]]]): (source name, stem paths)
+        manifest (dict): catalog manifest of the zip (see commit_zip_output)
+        is_built (bool): the zip file is committed
+    """
+    path: Path
+    named_file_list: List[Tuple[str, List[Path]]]
+    manifest: dict
+    is_built: bool = False
+
+
+def build_zip_output(output_path: Path, zip_output: ZipOutput,
+                     fileobj: Optional[BinaryIO] = None) -> Path:
+    """
+    Build a zip and record it in the catalog
+    Args:
+        output_path: Path: output root path
+        zip_output: ZipOutput: zip to build
+        fileobj: Optional[BinaryIO]: also stream the zip to this file object as it is written
+    Returns:
+        Path: zip file path
+    """
+    if zip_output.is_built:
+        # built before: only stream it
+        if fileobj is not None:
+            with open(zip_output.path, 'rb') as f:
+                shutil.copyfileobj(f, fileobj)
+        return zip_output.path
+    zipit(zip_output.named_file_list, zip_output.path, fileobj)
+    commit_zip_output(output_path, zip_output.path, zip_output.manifest)
+    zip_output.is_built = True
+    return zip_output.path
+
+
+def get_audio_separated_zip(config: SpleeterSettings,
+                            audio_file: Path,
+                            output_path: Path) -> Path:
+    """
+    Get separated audio zip file
+    Args:
+        audio_file: Path: audio file path
+        output_path: Path: audio file path
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        Path: separated audio zip file path (EX: output_path/cache/[key]/RYDEEN_4stems.zip)
+    """
+    separated_audio_path_list, is_exist = get_split_audio(
+        config, audio_file, output_path)
+    zip_output = prepare_audio_separated_zip(
+        config, audio_file, output_path, list(separated_audio_path_list))
+    return build_zip_output(output_path, zip_output)
+
+
+def prepare_audio_separated_zip(config: SpleeterSettings,
+                                audio_file: Path,
+                                output_path: Path,
+                                separated_audio_path_list: List[Path]) -> ZipOutput:
+    """
+    Get zip of separated audio without building it (see build_zip_output)
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        separated_audio_path_list: List[Path]: separated stems (see get_split_audio)
+    Returns:
+        ZipOutput: zip (EX: output_path/cache/[key]/RYDEEN_4stems.zip)
+    """
+    zip_file_path = separated_audio_path_list[0].parent / \
+        f"{audio_file.stem}_{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}{get_stems_suffix(config)}.zip"
+
+    # check if separated audio zip file already exists
+    if read_zip_manifest(output_path, zip_file_path) is not None:
+        print(
+            f"{audio_file.stem} [{config.split_mode.value.name}] : already zipped")
+        return ZipOutput(zip_file_path, [], {}, is_built=True)
+
+    return ZipOutput(zip_file_path, [(audio_file.stem, separated_audio_path_list)], {
+        "audio_hash": get_audio_hash(audio_file, output_path),
+        "sources": [audio_file.name],
+        "settings": get_output_settings_dict(config),
+    })
+
+
+def get_stems_suffix(config: SpleeterSettings) -> str:
+    """
+    Get file name suffix of a stem subset
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        str: "" for every stem, else EX: "_vocals+drums"
+    """
+    stems = get_output_stems(config)
+    if len(stems) == len(config.split_mode.value.stems):
+        return ""
+    return "_" + "+".join(stems)
+
+
+def get_zip_key(output_path: Path, zip_file_path: Path) -> str:
+    return zip_file_path.absolute().relative_to(output_path.absolute()).as_posix()
+
+
+def read_zip_manifest(output_path: Path, zip_file_path: Path) -> Optional[dict]:
+    """
+    Get manifest of a cataloged zip
+    Args:
+        output_path: Path: output root path
+        zip_file_path: Path: zip file path under output_path
+    Returns:
+        Optional[dict]: manifest, None if the zip is not built yet or its file is gone
+    """
+    catalog = get_catalog(output_path)
+    zip_key = get_zip_key(output_path, zip_file_path)
+    manifest = catalog.get_output(zip_key)
+    if manifest is not None and not zip_file_path.exists():
+        catalog.remove_output(zip_key)
+        manifest = None
+    record_cache_lookup(catalog, "zip", manifest is not None)
+    return manifest
+
+
+def commit_zip_output(output_path: Path, zip_file_path: Path, manifest: dict):
+    """
+    Record a built zip in the catalog
+    Args:
+        output_path: Path: output root path
+        zip_file_path: Path: zip file path under output_path
+        manifest: dict: manifest of the zip
+    """
+    get_catalog(output_path).add_output(
+        get_zip_key(output_path, zip_file_path), "zip", zip_file_path,
+        {**manifest, "stems": [zip_file_path.name]})
+
+
+# codecs which are already compressed and gain almost nothing from deflate
+COMPRESSED_CODECS = {"mp3", "m4a", "ogg", "wma", "flac"}
+
+
+def write_zip(named_file_list: List[Tuple[str, List[Path]]], fileobj: BinaryIO):
+    """
+    Write separated stems as zip, renamed after their source audio.
+    fileobj does not need to be seekable. Only WAV stems are deflated.
+    Args:
+        named_file_list: List[Tuple[str, List[Path]]]: (source name, stem paths)
+        fileobj: BinaryIO: writable file object
+    """
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED) as zipf:
+        for name, file_list in named_file_list:
+            for file in file_list:
+                compress_type = zipfile.ZIP_STORED \
+                    if file.suffix[1:].lower() in COMPRESSED_CODECS \
+                    else zipfile.ZIP_DEFLATED
+                zipf.write(file, f"{name}/{name}_{file.name}",
+                           compress_type=compress_type)
+
+
+class _TeeWriter:
+    """
+    Write to a file and to a stream at once; not seekable, so zip entries
+    are written with data descriptors
+    """
+
+    def __init__(self, file: BinaryIO, stream: BinaryIO):
+        self.file = file
+        self.stream = stream
+
+    def write(self, data: bytes) -> int:
+        self.file.write(data)
+        self.stream.write(data)
+        return len(data)
+
+    def flush(self):
+        self.file.flush()
+        self.stream.flush()
+
+
+def zipit(named_file_list: List[Tuple[str, List[Path]]], zip_name: Path,
+          fileobj: Optional[BinaryIO] = None):
+    """
+    Zip separated stems into a file
+    Args:
+        named_file_list: List[Tuple[str, List[Path]]]: (source name, stem paths)
+        zip_name: Path: zip file path (written atomically)
+        fileobj: Optional[BinaryIO]: also stream the zip to this file object
+            as it is written (EX: a download); the file is kept only if it completes
+    """
+    tmp_zip_name = Path(f"{zip_name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        with span("zip") as current, open(tmp_zip_name, 'wb') as f:
+            write_zip(named_file_list, f if fileobj is None else _TeeWriter(f, fileobj))
+            current.bytes_in = sum(file.stat().st_size
+                                   for _, files in named_file_list for file in files)
+            current.bytes_out = f.tell()
+        os.replace(tmp_zip_name, zip_name)
+    finally:
+        if tmp_zip_name.exists():
+            os.remove(tmp_zip_name)
+
+
+def get_batch_zip_key(config: SpleeterSettings,
+                      audio_file_list: List[Path],
+                      output_path: Path) -> str:
+    """
+    Get key of a batch zip from content hashes, names and settings
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: output root path
+    Returns:
+        str: batch zip key
+    """
+    # names are part of the key because stems are renamed after their source
+    audio_list = sorted([get_audio_hash(audio_file, output_path), audio_file.stem]
+                        for audio_file in audio_file_list)
+    return get_cache_key(json.dumps(audio_list), get_output_settings_dict(config))
+
+
+def get_batch_zip_path(config: SpleeterSettings,
+                       audio_file_list: List[Path],
+                       output_path: Path) -> Path:
+    """
+    Get path of a batch zip
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: output root path
+    Returns:
+        Path: batch zip path (EX: output_path/5files-2stems_[key].zip)
+    """
+    batch_key = get_batch_zip_key(config, audio_file_list, output_path)
+    return output_path / \
+        f"{len(audio_file_list)}files-{config.split_mode.value.name}{'-16kHz' if config.use16kHZ else ''}{get_stems_suffix(config)}_{batch_key[:12]}.zip"
+
+
+# progress --------------------------------------------------------------------
+def get_split_stages(config: SpleeterSettings) -> List[str]:
+    """
+    Get stages of a separation in run order, for progress reporting
+    Args:
+        config: SpleeterSettings: spleeter settings
+    Returns:
+        List[str]: stage names
+    """
+    return ["decode", "stft", "inference", "wiener" if config.usemwf else "masks", "encode"]
+
+
+def make_split_tracker(config: SpleeterSettings,
+                       audio_file: Path,
+                       output_path: Path,
+                       progress_callback: Callable[[float], None],
+                       stages: Optional[List[str]] = None,
+                       listener: Optional[Callable[[ProgressState], None]] = None) -> ProgressTracker:
+    """
+    Make a progress tracker of one audio file; pass it to tracking() around the separation
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        progress_callback: Callable[[float], None]: called with progress from 0.0 to 1.0
+        stages: Optional[List[str]]: planned stages (None: see get_split_stages)
+        listener: Optional[Callable[[ProgressState], None]]: called with stage, chunks and eta
+    Returns:
+        ProgressTracker: tracker, with eta from the real time factors of the model
+    """
+    duration = get_catalog(output_path).add_media(audio_file)["duration"] or 0.0
+    if config.duration is not None:
+        duration = min(duration, config.duration)
+    return ProgressTracker(progress_callback, duration,
+                           stages if stages is not None else get_split_stages(config),
+                           get_model_spec(config), listener)
+
+
+# batch separation ------------------------------------------------------------
+# number of worker processes used for batch separation (1: run in-process)
+BATCH_WORKERS = int(os.environ.get(
+    "SPLEETER_BATCH_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+# tensorflow threads per worker process (0: share cpu cores between workers)
+BATCH_TF_THREADS = int(os.environ.get("SPLEETER_TF_THREADS", "0"))
+
+
+@dataclass
+class BatchResult:
+    """
+    Result of one file in a batch separation
+    Attributes:
+        audio_file (Path): source audio file
+        stems (List[Path]): separated stem paths (empty if failed)
+        error (Optional[str]): error message if the separation failed
+    """
+    audio_file: Path
+    stems: List[Path]
+    error: Optional[str] = None
+
+
+def _init_batch_worker(tf_threads: int):
+    # must run before tensorflow creates its thread pools in this process
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(tf_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(tf_threads)
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        # tensorflow runtime is already initialized
+        pass
+
+
+def _split_audio_in_worker(config: SpleeterSettings,
+                           audio_file: Path,
+                           output_path: Path,
+                           index: int = 0,
+                           progress_queue=None) -> List[Path]:
+    # progress goes back to the parent as (index, progress) through the queue;
+    # without a queue, stages go to the tracker set by the caller (in-process)
+    context = nullcontext()
+    if progress_queue is not None:
+        context = tracking(make_split_tracker(
+            config, audio_file, output_path,
+            lambda progress: progress_queue.put((index, progress))))
+    with context:
+        separated_audio_path_gen, is_exist = get_split_audio(
+            config, audio_file, output_path)
+        return list(separated_audio_path_gen)
+
+
+def _split_audio_in_pool(config: SpleeterSettings,
+                         audio_file: Path,
+                         output_path: Path,
+                         index: int,
+                         progress_queue) -> Tuple[List[Path], Optional[str], List[Span]]:
+    # spans of the worker go back with the result, so the parent's metrics
+    # show the stages run in workers
+    with metrics_registry.capturing() as spans:
+        try:
+            stems = _split_audio_in_worker(config, audio_file, output_path, index, progress_queue)
+            return stems, None, list(spans)
+        except Exception as e:
+            return [], repr(e), list(spans)
+
+
+_batch_executor: Optional[ProcessPoolExecutor] = None
+_batch_executor_workers = 0
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Get the shared batch worker pool; workers keep their models warm between batches
+    Args:
+        max_workers: int: number of worker processes
+    Returns:
+        ProcessPoolExecutor: worker pool
+    """
+    global _batch_executor, _batch_executor_workers
+    with _batch_executor_lock:
+        if _batch_executor is None or _batch_executor_workers != max_workers:
+            if _batch_executor is not None:
+                _batch_executor.shutdown(wait=False)
+            tf_threads = BATCH_TF_THREADS or max(
+                1, (os.cpu_count() or 1) // max_workers)
+            # tensorflow is not fork safe
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_batch_worker,
+                initargs=(tf_threads,))
+            _batch_executor_workers = max_workers
+        return _batch_executor
+
+
+def separate_batch(config: SpleeterSettings,
+                   audio_file_list: List[Path],
+                   output_path: Path,
+                   progress_callback: Callable[[float], None],
+                   max_workers: int = BATCH_WORKERS,
+                   result_callback: Optional[Callable[[BatchResult], None]] = None) -> List[BatchResult]:
+    """
+    Separate multiple audio files on a pool of worker processes
+    A failed file is reported in its BatchResult and does not abort the batch.
+    Progress includes the stages of the files being separated (workers send
+    it back through a queue); the eta goes to the progress listener of the
+    calling thread (see progress.observing).
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: output root path
+        progress_callback: Callable[[float], None]: called with done files ratio,
+            counting the done part of running files
+        max_workers: int: number of worker processes (1: run in-process)
+        result_callback: Optional[Callable[[BatchResult], None]]: called as soon as each file is done
+    Returns:
+        List[BatchResult]: results in the order of audio_file_list
+    """
+    results: Dict[int, BatchResult] = {}
+    pending: List[int] = []
+    total = max(1, len(audio_file_list))
+    # done part of running files; eta is measured on the files not cached
+    running: Dict[int, float] = {}
+    cached = [0]
+    started = time.perf_counter()
+    listener = get_progress_listener()
+    progress_lock = threading.Lock()
+
+    def publish():
+        with progress_lock:
+            done = len(results) + sum(running.values())
+            separated = done - cached[0]
+            left = len(audio_file_list) - done
+            finished = len(results)
+        progress_callback(done / total)
+        if listener is not None:
+            elapsed = time.perf_counter() - started
+            listener(ProgressState(
+                done / total, "separate", (finished, len(audio_file_list)),
+                elapsed * left / separated if separated > 0 else None))
+
+    def report_running(index: int, progress: float):
+        with progress_lock:
+            if index in results:
+                return
+            running[index] = progress
+        publish()
+
+    def report(index: int, result: BatchResult):
+        with progress_lock:
+            results[index] = result
+            running.pop(index, None)
+        if result.error is not None:
+            print(f"{result.audio_file.name} : failed ({result.error})")
+        if result_callback is not None:
+            result_callback(result)
+        publish()
+
+    # cached files don't need a worker; misses are counted by get_split_audio
+    catalog = get_catalog(output_path)
+    for i, audio_file in enumerate(audio_file_list):
+        try:
+            cache_dir = get_separation_cache_dir(config, audio_file, output_path)
+            manifest = read_cache_manifest(cache_dir, record_stats=False)
+        except Exception as e:
+            # EX: missing or unreadable file
+            report(i, BatchResult(audio_file, [], repr(e)))
+            continue
+        stem_names = get_stem_file_names(config)
+        if manifest is None or not set(stem_names) <= set(manifest["stems"]):
+            pending.append(i)
+        else:
+            record_cache_lookup(catalog, cache_dir.parent.name, True)
+            cached[0] += 1
+            report(i, BatchResult(audio_file,
+                                  [cache_dir / stem for stem in stem_names]))
+
+    if max_workers <= 1 or len(pending) <= 1:
+        for i in pending:
+            tracker = make_split_tracker(config, audio_file_list[i], output_path,
+                                         lambda progress, i=i: report_running(i, progress))
+            try:
+                with tracking(tracker):
+                    stems = _split_audio_in_worker(
+                        config, audio_file_list[i], output_path)
+                report(i, BatchResult(audio_file_list[i], stems))
+            except Exception as e:
+                report(i, BatchResult(audio_file_list[i], [], repr(e)))
+    elif pending:
+        executor = get_batch_executor(max_workers)
+        # a manager queue can be passed to tasks of an existing pool
+        manager = multiprocessing.get_context("spawn").Manager()
+        progress_queue = manager.Queue()
+
+        def drain_progress():
+            for item in iter(progress_queue.get, None):
+                report_running(*item)
+
+        drain_thread = threading.Thread(target=drain_progress, daemon=True)
+        drain_thread.start()
+        try:
+            future_to_index = {
+                executor.submit(_split_audio_in_pool,
+                                config, audio_file_list[i], output_path, i, progress_queue): i
+                for i in pending
+            }
+            for future in as_completed(future_to_index):
+                i = future_to_index[future]
+                try:
+                    stems, error, spans = future.result()
+                except Exception as e:
+                    # the worker itself failed (EX: killed)
+                    report(i, BatchResult(audio_file_list[i], [], repr(e)))
+                    continue
+                for worker_span in spans:
+                    # workers write their own metrics log
+                    metrics_registry.record(worker_span, log=False)
+                report(i, BatchResult(audio_file_list[i], stems, error))
+        finally:
+            progress_queue.put(None)
+            drain_thread.join()
+            manager.shutdown()
+
+    return [results[i] for i in range(len(audio_file_list))]
+
+
+def prepare_multi_audio_separated_zip(config: SpleeterSettings,
+                                      audio_file_list: List[Path],
+                                      output_path: Path,
+                                      progress_callback: Callable[[float], None]) -> ZipOutput:
+    """
+    Separate multiple audio files for one zip file, without building the zip,
+    so that it can be streamed to its first download (see build_zip_output)
+    Args:
+        config: SpleeterSettings: spleeter settings
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: output root path
+        progress_callback: Callable[[float], None]: called with separation progress
+    Returns:
+        ZipOutput: zip of the separated stems (EX: output_path/5files-2stems_[key].zip)
+    """
+    progress_callback(0.0)
+    zip_file_path = get_batch_zip_path(config, audio_file_list, output_path)
+
+    # check if separated audio zip file already exists
+    if read_zip_manifest(output_path, zip_file_path) is not None:
+        print(
+            f"{zip_file_path.name} : already zipped")
+        progress_callback(1.0)
+        return ZipOutput(zip_file_path, [], {}, is_built=True)
+
+    reported = [0.0]
+
+    def report(progress: float):
+        # packed inference and batch overlap: never move backwards
+        reported[0] = max(reported[0], progress)
+        progress_callback(reported[0])
+
+    # short clips share model invocations, then only need encoding
+    separate_packed(config, audio_file_list, output_path,
+                    progress_callback=lambda x: report(x * 0.5))
+    batch_results = separate_batch(
+        config, audio_file_list, output_path, progress_callback=report)
+    named_file_list = [(result.audio_file.stem, result.stems)
+                       for result in batch_results if result.error is None]
+
+    # keep the complete name free so that failed files are retried next time
+    if len(named_file_list) < len(audio_file_list):
+        zip_file_path = zip_file_path.parent / \
+            f"{zip_file_path.stem}_partial.zip"
+
+    progress_callback(1.0)
+    return ZipOutput(zip_file_path, named_file_list, {
+        "sources": [result.audio_file.name for result in batch_results
+                    if result.error is None],
+        "settings": get_output_settings_dict(config),
+    })
+
+
+def get_multi_audio_separated_zip(config: SpleeterSettings,
+                                  audio_file_list: List[Path],
+                                  output_path: Path,
+                                  progress_callback: Callable[[float], None]) -> Path:
+    """
+    Get separated multiple audio into one zip file
+    Args:
+        audio_file_list: List[Path]: audio file path list
+        output_path: Path: audio file path
+        config: SpleeterSettings: spleeter settings
+        progress_callback: Callable[[None], float]: pass progress as float
+    Returns:
+        Path: separated audio zip file path (EX: output_path/5files-2stems_[key].zip)
+    """
+    progress_max = float(len(audio_file_list)) + 1.0
+    zip_output = prepare_multi_audio_separated_zip(
+        config, audio_file_list, output_path,
+        lambda x: progress_callback(x * len(audio_file_list) / progress_max))
+    if not zip_output.is_built:
+        report_progress_state(ProgressState(len(audio_file_list) / progress_max, "zip"))
+        build_zip_output(output_path, zip_output)
+    progress_callback(1.0)
+    return zip_output.path
+
+
+# remix -----------------------------------------------------------------------
+REMIX_FILE_STEM = "remix"
+
+
+@dataclass
+class StemMix:
+    """
+    Mix settings of one stem
+    Attributes:
+        gain_db (float): gain in dB (default: 0.0)
+        mute (bool): leave the stem out (default: False)
+        pan (float): balance from -1.0 (left) to 1.0 (right) (default: 0.0)
+    """
+    gain_db: float = 0.0
+    mute: bool = False
+    pan: float = 0.0
+
+
+def get_stem_mix_gains(stem_mix: StemMix) -> np.ndarray:
+    """
+    Get left and right gains of a stem (equal power balance, unity at center)
+    Args:
+        stem_mix: StemMix: mix settings
+    Returns:
+        np.ndarray: float32 (2,) gains
+    """
+    if stem_mix.mute:
+        return np.zeros(2, dtype=np.float32)
+    angle = (min(1.0, max(-1.0, stem_mix.pan)) + 1.0) * np.pi / 4.0
+    gain = 10.0 ** (stem_mix.gain_db / 20.0)
+    return (gain * np.sqrt(2.0) * np.array([np.cos(angle), np.sin(angle)])).astype(np.float32)
+
+
+def get_remix_settings_dict(config: SpleeterSettings, mix: Dict[str, StemMix]) -> dict:
+    """
+    Get every setting which affects a remix; muted stems are left out
+    Args:
+        config: SpleeterSettings: spleeter settings
+        mix: Dict[str, StemMix]: mix settings by stem (missing stems are kept as they are)
+    Returns:
+        dict: json serializable settings
+    """
+    return {
+        **get_settings_dict(config),
+        "mix": {stem: asdict(mix.get(stem, StemMix()))
+                for stem in config.split_mode.value.stems
+                if not mix.get(stem, StemMix()).mute},
+    }
+
+
+def mix_raw_stems(raw_stems: Dict[str, np.ndarray],
+                  gains: Dict[str, np.ndarray],
+                  chunk_samples: int = ENCODE_CHUNK_SAMPLES) -> Iterator[np.ndarray]:
+    """
+    Mix raw stems chunk by chunk
+    Args:
+        raw_stems: Dict[str, np.ndarray]: (samples, 2) stems, usually memory mapped
+        gains: Dict[str, np.ndarray]: (2,) left and right gains by stem
+        chunk_samples: int: samples per chunk
+    Returns:
+        Iterator[np.ndarray]: float32 (samples, 2) chunks of the mix, clipped to [-1, 1]
+    """
+    n_samples = max((data.shape[0] for data in raw_stems.values()), default=0)
+    for start in range(0, n_samples, chunk_samples):
+        stop = min(n_samples, start + chunk_samples)
+        mixed = np.zeros((stop - start, 2), dtype=np.float32)
+        for stem, data in raw_stems.items():
+            part = data[start:stop]
+            mixed[:part.shape[0]] += part * gains[stem]
+        np.clip(mixed, -1.0, 1.0, out=mixed)
+        yield mixed
+
+
+def get_remix(config: SpleeterSettings,
+              audio_file: Path,
+              output_path: Path,
+              mix: Dict[str, StemMix]) -> Path:
+    """
+    Render a remix of the separated stems with per-stem gain, mute and pan.
+    The raw stems are memory mapped and mixed chunk by chunk straight into
+    the encoder, so memory does not grow with the audio length. Remixes are
+    cached by source, settings and mix under output_path/remix.
+    Args:
+        config: SpleeterSettings: spleeter settings (codec and bitrate of the remix)
+        audio_file: Path: audio file path
+        output_path: Path: output root path
+        mix: Dict[str, StemMix]: mix settings by stem (missing stems are kept as they are)
+    Returns:
+        Path: encoded remix (EX: output_path/remix/[key]/remix.mp3)
+    """
+    settings = get_remix_settings_dict(config, mix)
+    remix_dir = output_path / "remix" / get_cache_key(
+        get_audio_hash(audio_file, output_path), settings)
+    remix_name = f"{REMIX_FILE_STEM}.{config.codec.value}"
+    if read_cache_manifest(remix_dir) is not None:
+        return remix_dir / remix_name
+
+    # muted stems are not separated at all
+    stems = list(settings["mix"].keys())
+    if stems:
+        raw_dir, raw_manifest = get_raw_stems(
+            replace(config, stems=stems), audio_file, output_path)
+        raw_stems = {stem: load_raw_stem(raw_dir, raw_manifest, stem) for stem in stems}
+        sample_rate = raw_manifest["sample_rate"]
+    else:
+        raw_stems = {}
+        sample_rate = SPLEETER_SAMPLE_RATE
+    gains = {stem: get_stem_mix_gains(mix.get(stem, StemMix())) for stem in stems}
+
+    tmp_dir = make_cache_tmp_dir(remix_dir)
+    try:
+        with span("remix", codec=config.codec.value) as current, progress_stage("remix"):
+            encoder = open_stem_encoder(
+                tmp_dir / remix_name, config.codec, config.bitrate, sample_rate)
+            n_samples = max((data.shape[0] for data in raw_stems.values()), default=0)
+            n_chunks = -(-n_samples // ENCODE_CHUNK_SAMPLES)
+            try:
+                for i, mixed in enumerate(mix_raw_stems(raw_stems, gains)):
+                    encoder.stdin.write(mixed.tobytes())
+                    progress_chunk(i + 1, n_chunks)
+            finally:
+                encoder.stdin.close()
+                if encoder.wait() != 0:
+                    raise RuntimeError(f"ffmpeg failed to encode {remix_name}")
+            current.bytes_in = sum(data.nbytes for data in raw_stems.values())
+            current.bytes_out = (tmp_dir / remix_name).stat().st_size
+        commit_cache_dir(tmp_dir, remix_dir, {
+            "key": remix_dir.name,
+            "audio_hash": get_file_hash(audio_file),
+            "source_name": audio_file.name,
+            "settings": settings,
+            "stems": [remix_name],
+        })
+    finally:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return remix_dir / remix_name
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# app modules import each other by file name, as when run by `streamlit run`
+sys.path.insert(0, str(Path(__file__).parent.parent / "spleeter_stremlit"))
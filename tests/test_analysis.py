@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+
+def test_stft_is_cached_exactly(tmp_path, monkeypatch):
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    waveform = (np.random.default_rng(0).standard_normal((50000, 2)) * 0.1).astype(np.float32)
+    decoded = []
+
+    def load_stereo_waveform(audio_file, duration=None):
+        decoded.append(audio_file)
+        return waveform
+
+    monkeypatch.setattr(utils, "load_stereo_waveform", load_stereo_waveform)
+    output_path = tmp_path / "output"
+    expected = utils.compute_stft(waveform)
+
+    _, first = utils.get_analysis(utils.parse_model_spec("2stems"), audio_file, output_path)
+    blocks = []
+    monkeypatch.setattr(utils, "iter_stft_blocks", lambda *args: blocks.append(args) or iter([]))
+    # another model of the same source
+    cached_waveform, cached = utils.get_analysis(
+        utils.parse_model_spec("4stems"), audio_file, output_path)
+
+    assert decoded == [audio_file]
+    assert blocks == []
+    np.testing.assert_array_equal(cached_waveform, waveform)
+    assert cached.dtype == np.complex64
+    np.testing.assert_array_equal(first, expected)
+    np.testing.assert_array_equal(cached, expected)
@@ -0,0 +1,25 @@
+import numpy as np
+
+import backends
+from backends import get_intra_op_threads, get_spectrogram_features
+
+
+def test_spectrogram_features():
+    params = {"T": 4, "F": 3}
+    stft = (np.arange(6 * 5 * 2) - 20).reshape(6, 5, 2).astype(np.complex64)
+
+    features = get_spectrogram_features(stft, params)
+
+    # frames padded to whole segments, magnitudes of the first F bins
+    assert features.shape == (2, 4, 3, 2)
+    assert features.dtype == np.float32
+    np.testing.assert_array_equal(features.reshape(8, 3, 2)[:6], np.abs(stft[:, :3]))
+    assert not features.reshape(8, 3, 2)[6:].any()
+
+
+def test_intra_op_threads(monkeypatch):
+    monkeypatch.setattr(backends, "INTRA_OP_THREADS", 2)
+
+    # settings win over the configured threads
+    assert get_intra_op_threads(0) == 2
+    assert get_intra_op_threads(4) == 4
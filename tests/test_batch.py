@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+
+def fake_split_audio(config, audio_file, output_path):
+    stem = output_path / f"{audio_file.stem}.mp3"
+    stem.write_bytes(b"")
+    return (path for path in [stem]), False
+
+
+def test_batch_continues_after_missing_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "probe_audio", lambda audio_file: {
+        "duration": 30.0, "sample_rate": 44100, "channels": 2})
+    monkeypatch.setattr(utils, "get_split_audio", fake_split_audio)
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+    valid = tmp_path / "valid.wav"
+    valid.write_bytes(b"0" * 16)
+
+    results = utils.separate_batch(utils.parse_model_spec("2stems"),
+                                   [tmp_path / "missing.wav", valid],
+                                   output_path, lambda progress: None, max_workers=1)
+
+    assert "FileNotFoundError" in results[0].error
+    assert results[1].error is None
+    assert results[1].stems == [output_path / "valid.mp3"]
+
+
+class SegmentSeparator:
+    """
+    Stands in for the model: every output sample depends on the stft frames
+    of its whole model segment, as the network's estimates do
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    @contextmanager
+    def acquire(self, config):
+        yield self
+
+    def separate(self, waveform, audio_descriptor="", silence_db=None):
+        self.calls += 1
+        stft = utils.compute_stft(waveform)
+        segment_frames = utils.SPLEETER_SEGMENT_FRAMES
+        n_segments = -(-stft.shape[0] // segment_frames)
+        scales = np.array([1.0 / (1.0 + np.abs(stft[i * segment_frames:(i + 1) * segment_frames]).max())
+                           for i in range(n_segments)], dtype=np.float32)
+        # frame of a sample: the first one whose window covers it
+        frames = np.arange(waveform.shape[0]) // utils.SPLEETER_FRAME_STEP + 1
+        scale = scales[frames // segment_frames][:, None]
+        return {"vocals": waveform * scale, "accompaniment": waveform * (1.0 - scale)}
+
+
+def setup_clips(tmp_path, monkeypatch, lengths):
+    waveforms = {}
+    rng = np.random.default_rng(0)
+    for i, length in enumerate(lengths):
+        audio_file = tmp_path / f"clip{i}.wav"
+        audio_file.write_bytes(bytes([i]) * 16)
+        waveforms[audio_file] = (rng.standard_normal((length, 2)) * 0.1).astype(np.float32)
+    monkeypatch.setattr(utils, "probe_audio", lambda audio_file: {
+        "duration": 10.0, "sample_rate": 44100, "channels": 2})
+    monkeypatch.setattr(utils, "load_stereo_waveform",
+                        lambda audio_file, duration=None: waveforms[audio_file])
+    return waveforms
+
+
+def test_packed_matches_unpacked(tmp_path, monkeypatch):
+    segment_samples = utils.SPLEETER_SEGMENT_FRAMES * utils.SPLEETER_FRAME_STEP
+    # the first clip and its padding end exactly on a segment boundary;
+    # the second one is a whole segment, so its padding takes one more
+    waveforms = setup_clips(tmp_path, monkeypatch, [
+        segment_samples - 4 * utils.SPLEETER_FRAME_STEP, segment_samples, 3000])
+    separator = SegmentSeparator()
+    monkeypatch.setattr(utils, "separator_pool", separator)
+    config = utils.parse_model_spec("2stems")
+    output_path = tmp_path / "output"
+
+    separated = utils.separate_packed(config, list(waveforms), output_path, lambda x: None,
+                                      max_batch_frames=utils.SPLEETER_SEGMENT_FRAMES * 8)
+
+    assert separated == list(waveforms)
+    assert separator.calls == 1
+    for audio_file, waveform in waveforms.items():
+        raw_dir = utils.get_raw_stems_dir(config, audio_file, output_path)
+        manifest = utils.read_cache_manifest(raw_dir)
+        for stem, expected in separator.separate(waveform).items():
+            np.testing.assert_allclose(utils.load_raw_stem(raw_dir, manifest, stem),
+                                       expected, atol=1e-3)
+
+
+def test_failed_packing_falls_back_per_file(tmp_path, monkeypatch):
+    waveforms = setup_clips(tmp_path, monkeypatch, [3000, 4000])
+    missing = tmp_path / "missing.wav"
+
+    class BrokenSeparator(SegmentSeparator):
+        def separate(self, waveform, audio_descriptor="", silence_db=None):
+            raise RuntimeError("out of memory")
+
+    split_files = []
+
+    def fake_split_audio(config, audio_file, output_path):
+        split_files.append(audio_file)
+        return iter([]), False
+
+    monkeypatch.setattr(utils, "separator_pool", BrokenSeparator())
+    monkeypatch.setattr(utils, "get_split_audio", fake_split_audio)
+
+    separated = utils.separate_packed(utils.parse_model_spec("2stems"),
+                                      [missing] + list(waveforms), tmp_path / "output",
+                                      lambda x: None)
+
+    assert separated == list(waveforms)
+    assert split_files == list(waveforms)
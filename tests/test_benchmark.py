@@ -0,0 +1,53 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from benchmark import (compare_results, get_signal_to_distortion,  # noqa: E402
+                       measure)
+
+
+def test_measure():
+    result = measure("sleep", lambda: sum(range(100000)), audio_seconds=10.0)
+    assert result.wall_seconds > 0
+    assert result.peak_rss_bytes > 0
+    assert result.rtf == result.wall_seconds / 10.0
+
+
+@pytest.mark.skipif(not Path("/proc/self/task").exists(), reason="needs /proc")
+def test_measure_counts_child_processes():
+    busy = "import time\nend = time.process_time() + 0.5\nwhile time.process_time() < end: pass"
+    result = measure("child", lambda: subprocess.run([sys.executable, "-c", busy], check=True),
+                     audio_seconds=1.0)
+    # the parent only waits, so the cpu time is the child's
+    assert result.cpu_seconds >= 0.3
+
+
+def test_compare_results():
+    baseline = [
+        {"name": "decode:example", "wall_seconds": 1.0, "peak_rss_bytes": 100},
+        {"name": "removed", "wall_seconds": 1.0, "peak_rss_bytes": 100},
+    ]
+    results = [
+        {"name": "decode:example", "wall_seconds": 1.1, "peak_rss_bytes": 100},
+        {"name": "new", "wall_seconds": 9.0, "peak_rss_bytes": 900},
+    ]
+    assert compare_results(results, baseline, threshold=0.2) == []
+
+    results[0]["wall_seconds"] = 1.5
+    regressions = compare_results(results, baseline, threshold=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("decode:example: wall_seconds")
+
+
+def test_signal_to_distortion():
+    reference = {"vocals": np.ones((100, 2)), "other": np.full((100, 2), 2.0)}
+    assert get_signal_to_distortion(reference, reference) == float("inf")
+    estimate = {"vocals": np.ones((100, 2)) * 1.1, "other": np.full((100, 2), 2.2)}
+    # 10 % error on every stem: 20 dB
+    assert get_signal_to_distortion(reference, estimate) == pytest.approx(20.0)
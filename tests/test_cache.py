@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+
+class HalfSeparator:
+    """
+    Stands in for the model: both stems are half of the mixture
+    """
+
+    @contextmanager
+    def acquire(self, config):
+        yield self
+
+    def run(self, stft, n_samples, stems=None, model_outputs=None, fetch_model_outputs=False):
+        return {stem: np.full((n_samples, 2), 0.5, dtype=np.float32) for stem in stems}, {}
+
+
+@pytest.fixture
+def song(tmp_path, monkeypatch):
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    monkeypatch.setattr(utils, "load_stereo_waveform",
+                        lambda audio_file, duration=None: np.zeros((3000, 2), dtype=np.float32))
+    monkeypatch.setattr(utils, "separator_pool", HalfSeparator())
+    return audio_file
+
+
+def test_interrupted_commit_leaves_no_entry(song, tmp_path, monkeypatch):
+    config = utils.parse_model_spec("2stems")
+    output_path = tmp_path / "output"
+
+    def crashing_encode_raw_stem(raw_stem, stem_path, codec, bitrate, sample_rate=44100):
+        # killed halfway through the file
+        stem_path.write_bytes(b"partial")
+        raise RuntimeError("ffmpeg failed to encode")
+
+    monkeypatch.setattr(utils, "encode_raw_stem", crashing_encode_raw_stem)
+    with pytest.raises(RuntimeError):
+        list(utils.get_split_audio(config, song, output_path)[0])
+
+    cache_dir = utils.get_separation_cache_dir(config, song, output_path)
+    assert not cache_dir.exists()
+    # neither the entry nor its working directory is left behind
+    assert list(cache_dir.parent.iterdir()) == []
+    assert utils.read_cache_manifest(cache_dir) is None
+
+    monkeypatch.setattr(utils, "encode_raw_stem",
+                        lambda raw_stem, stem_path, *args: stem_path.write_bytes(b"stem"))
+    output_files, is_exist = utils.get_split_audio(config, song, output_path)
+
+    assert not is_exist
+    assert [path.read_bytes() for path in output_files] == [b"stem", b"stem"]
+
+
+def test_second_commit_keeps_first_entry(song, tmp_path):
+    config = utils.parse_model_spec("2stems")
+
+    def produce(value):
+        def write_stems(write):
+            for stem in config.split_mode.value.stems:
+                write(stem, np.full((100, 2), value, dtype=np.float32))
+        return write_stems
+
+    raw_dir, first = utils.commit_raw_stems(config, song, tmp_path, produce(0.25))
+    # another worker finished the same entry later
+    _, second = utils.commit_raw_stems(config, song, tmp_path, produce(0.5))
+
+    assert second == first
+    assert [path.name for path in raw_dir.parent.iterdir()] == [raw_dir.name]
+    assert utils.load_raw_stem(raw_dir, first, "vocals")[0, 0] == 0.25
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from cache_manager import CacheManager, parse_size  # noqa: E402
+from utils import (commit_cache_dir, extend_cache_dir, get_catalog,  # noqa: E402
+                   make_cache_tmp_dir, read_cache_manifest, read_zip_manifest)
+
+
+def test_parse_size():
+    assert parse_size("") is None
+    assert parse_size("512") == 512
+    assert parse_size("1.5K") == 1536
+    assert parse_size("20G") == 20 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_evict_cost_aware_and_pinned(tmp_path):
+    output_path = tmp_path / "output"
+    catalog = get_catalog(output_path)
+    for key, kind, size in [("a", "raw", 1000), ("b", "cache", 500), ("c", "zip", 300)]:
+        entry_path = output_path / kind / key
+        entry_path.mkdir(parents=True)
+        (entry_path / "vocals.wav").write_bytes(b"0" * size)
+        catalog.add_output(key, kind, entry_path,
+                           {"audio_hash": f"hash-{key}", "stems": ["vocals.wav"]})
+    catalog.pin("hash-b", "session")
+
+    cache_manager = CacheManager(output_path, tmp_path / "upload", budget=600)
+    report = cache_manager.evict()
+
+    # zip goes first, the pinned entry is kept even though raw is kept longer
+    assert [entry.key for entry in report.evicted] == ["c", "a"]
+    assert report.pinned == 1
+    assert not (output_path / "raw" / "a").exists()
+    assert (output_path / "cache" / "b").exists()
+    assert cache_manager.get_stats()["raw_eviction"] == 1
+
+
+def test_evict_forgets_outputs_inside_entry(tmp_path):
+    output_path = tmp_path / "output"
+    catalog = get_catalog(output_path)
+    entry_path = output_path / "cache" / "a"
+    entry_path.mkdir(parents=True)
+    (entry_path / "vocals.mp3").write_bytes(b"0" * 100)
+    catalog.add_output("a", "cache", entry_path, {"audio_hash": "hash-a", "stems": ["vocals.mp3"]})
+    zip_path = entry_path / "song_2stems.zip"
+    zip_path.write_bytes(b"0" * 100)
+    catalog.add_output("cache/a/song_2stems.zip", "zip", zip_path,
+                       {"audio_hash": "hash-a", "stems": [zip_path.name]})
+    catalog.pin("cache/a/song_2stems.zip", "session")
+
+    CacheManager(output_path, tmp_path / "upload", budget=0).evict()
+
+    assert not entry_path.exists()
+    assert catalog.get_output("cache/a/song_2stems.zip") is None
+
+
+def test_missing_files_are_not_hits(tmp_path):
+    output_path = tmp_path / "output"
+    catalog = get_catalog(output_path)
+    entry_path = output_path / "cache" / "a"
+    entry_path.mkdir(parents=True)
+    (entry_path / "vocals.mp3").write_bytes(b"0" * 100)
+    catalog.add_output("a", "cache", entry_path, {"audio_hash": "hash-a", "stems": ["vocals.mp3"]})
+    zip_path = output_path / "2files-2stems.zip"
+    zip_path.write_bytes(b"0" * 100)
+    catalog.add_output("2files-2stems.zip", "zip", zip_path, {"stems": [zip_path.name]})
+    assert read_cache_manifest(entry_path) is not None
+    assert read_zip_manifest(output_path, zip_path) is not None
+
+    (entry_path / "vocals.mp3").unlink()
+    zip_path.unlink()
+
+    assert read_cache_manifest(entry_path) is None
+    assert read_zip_manifest(output_path, zip_path) is None
+    assert catalog.get_output("a") is None
+
+
+def test_remove_stale_tmp(tmp_path):
+    upload_path = tmp_path / "upload"
+    upload_path.mkdir()
+    stale = upload_path / ".tmp-hash-1"
+    fresh = upload_path / ".tmp-hash-2"
+    for tmp in (stale, fresh):
+        tmp.write_bytes(b"0")
+    os.utime(stale, (0, 0))
+
+    assert CacheManager(tmp_path / "output", upload_path).remove_stale_tmp() == 1
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_batch_counts_lookups_once(tmp_path, monkeypatch):
+    import utils
+
+    def fake_split_audio(config, audio_file, output_path):
+        # the real one looks the entry up again before separating
+        read_cache_manifest(utils.get_separation_cache_dir(config, audio_file, output_path))
+        return (path for path in [output_path / f"{audio_file.stem}.mp3"]), False
+
+    monkeypatch.setattr(utils, "probe_audio", lambda audio_file: {
+        "duration": 30.0, "sample_rate": 44100, "channels": 2})
+    monkeypatch.setattr(utils, "get_split_audio", fake_split_audio)
+    audio_files = [tmp_path / "a.wav", tmp_path / "b.wav"]
+    for i, audio_file in enumerate(audio_files):
+        audio_file.write_bytes(bytes([i]) * 16)
+
+    output_path = tmp_path / "output"
+    utils.separate_batch(utils.parse_model_spec("2stems"), audio_files, output_path,
+                         lambda progress: None, max_workers=1)
+
+    stats = get_catalog(output_path).get_stats()
+    assert stats["cache_miss"] == 2
+    assert "cache_hit" not in stats
+
+
+def test_extended_entry_counts_new_files_only(tmp_path):
+    output_path = tmp_path / "output"
+    cache_dir = output_path / "cache" / "a"
+    tmp_dir = make_cache_tmp_dir(cache_dir)
+    (tmp_dir / "vocals.mp3").write_bytes(b"0" * 100)
+    manifest = commit_cache_dir(tmp_dir, cache_dir, {"audio_hash": "hash-a", "stems": ["vocals.mp3"]})
+    catalog = get_catalog(output_path)
+    # a zip kept inside the entry is an output of its own
+    zip_path = cache_dir / "song_2stems.zip"
+    zip_path.write_bytes(b"0" * 1000)
+    catalog.add_output("cache/a/song_2stems.zip", "zip", zip_path,
+                       {"audio_hash": "hash-a", "stems": [zip_path.name]})
+
+    tmp_dir = make_cache_tmp_dir(cache_dir)
+    (tmp_dir / "drums.mp3").write_bytes(b"0" * 50)
+    extend_cache_dir(tmp_dir, cache_dir, {**manifest, "stems": ["vocals.mp3", "drums.mp3"]})
+
+    sizes = {row["key"]: row["size"] for row in catalog.list_all_outputs()}
+    manifest_size = (cache_dir / "manifest.json").stat().st_size
+    assert sizes == {"a": 150 + manifest_size, "cache/a/song_2stems.zip": 1000}
+    assert read_cache_manifest(cache_dir)["stems"] == ["vocals.mp3", "drums.mp3"]
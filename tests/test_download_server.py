@@ -0,0 +1,65 @@
+import http.client
+import socket
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+from spleeter_stremlit.download_server import (DownloadServer, add_stream,
+                                               get_browser_host, is_served_path,
+                                               parse_range_header)
+
+
+def test_parse_range_header():
+    assert parse_range_header(None, 100) is None
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=90-", 100) == (90, 99)
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=50-500", 100) == (50, 99)
+    assert parse_range_header("bytes=0-1,5-9", 100) is None
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=100-", 100)
+
+
+def test_get_browser_host():
+    assert get_browser_host("127.0.0.1") == "localhost"
+    assert get_browser_host("0.0.0.0") == socket.gethostname()
+    assert get_browser_host("192.168.0.2") == "192.168.0.2"
+    assert get_browser_host("fe80::1") == "[fe80::1]"
+
+
+def test_is_served_path():
+    assert is_served_path(Path("cache/abc/vocals.mp3"))
+    assert is_served_path(Path("remix/abc/remix.mp3"))
+    assert is_served_path(Path("2files-2stems_abc.zip"))
+    assert not is_served_path(Path("catalog.sqlite3"))
+    assert not is_served_path(Path("journal.jsonl"))
+    assert not is_served_path(Path("analysis/abc/waveform.f32"))
+    assert not is_served_path(Path("raw/abc/vocals.f16"))
+    assert not is_served_path(Path("cache/.tmp-abc/vocals.mp3"))
+    assert not is_served_path(Path("2files-2stems_abc.zip.tmp-1-2"))
+
+
+def test_stream(tmp_path):
+    server = DownloadServer(tmp_path, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    body = bytes(range(256)) * 1000
+
+    def write(fileobj):
+        for i in range(0, len(body), 1000):
+            fileobj.write(body[i:i + 1000])
+
+    try:
+        url = add_stream(server, "batch/a.zip", "a.zip", write)
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request("GET", urlparse(url).path)
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader("Transfer-Encoding") == "chunked"
+        assert response.read() == body
+        connection.request("GET", "/streams/missing.zip")
+        assert connection.getresponse().status == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from headless import JobJournal, expand_inputs  # noqa: E402
+from utils import BatchResult  # noqa: E402
+
+
+def test_expand_inputs(tmp_path):
+    for name in ("a.mp3", "b.wav", "c.txt"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "list.txt").write_text("# comment\n\nb.wav\na.mp3\n")
+    (tmp_path / "list.json").write_text(json.dumps([str(tmp_path / "b.wav")]))
+
+    files = expand_inputs([str(tmp_path / "*.mp3")],
+                          [tmp_path / "list.txt", tmp_path / "list.json"])
+
+    assert files == [tmp_path / "a.mp3", tmp_path / "b.wav"]
+    with pytest.raises(FileNotFoundError):
+        expand_inputs([str(tmp_path / "missing.mp3")])
+
+
+def test_journal_resume(tmp_path):
+    stem = tmp_path / "vocals.mp3"
+    stem.write_bytes(b"")
+    journal = JobJournal(tmp_path / "journal.jsonl")
+    journal.record("done", BatchResult(Path("a.mp3"), [stem]))
+    journal.record("failed", BatchResult(Path("b.mp3"), [], "error"))
+    journal.record("evicted", BatchResult(Path("c.mp3"), [tmp_path / "gone.mp3"]))
+    # killed while writing
+    with open(tmp_path / "journal.jsonl", 'a') as f:
+        f.write('{"key": "torn", "sta')
+
+    resumed = JobJournal(tmp_path / "journal.jsonl")
+
+    assert resumed.get_outputs("done") == [stem]
+    assert resumed.get_outputs("failed") is None
+    assert resumed.get_outputs("evicted") is None
+    assert resumed.get_outputs("torn") is None
+    resumed.record("next", BatchResult(Path("d.mp3"), [stem]))
+    assert JobJournal(tmp_path / "journal.jsonl").get_outputs("next") == [stem]
@@ -0,0 +1,32 @@
+import io
+import os
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+
+def test_same_content_is_stored_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "probe_audio", lambda audio_file: {
+        "duration": 1.0, "sample_rate": 44100, "channels": 2})
+    upload_path = tmp_path / "upload"
+    catalog = utils.get_catalog(tmp_path / "output")
+    content = os.urandom(3 * 1024 * 1024)
+
+    first, first_hash = utils.ingest_upload(io.BytesIO(content), "song.mp3", upload_path)
+    catalog.add_media(first, first_hash)
+    again, again_hash = utils.ingest_upload(io.BytesIO(content), "song.mp3", upload_path)
+    catalog.add_media(again, again_hash)
+    renamed, _ = utils.ingest_upload(io.BytesIO(content), "copy.mp3", upload_path)
+
+    assert again == first and again_hash == first_hash
+    objects = list((upload_path / utils.UPLOAD_OBJECTS_DIR_NAME).iterdir())
+    assert len(objects) == 1
+    assert objects[0].read_bytes() == content
+    # named files are links to the stored content
+    assert os.path.samefile(first, objects[0])
+    assert os.path.samefile(renamed, objects[0])
+    assert catalog.list_media(upload_path) == [first.absolute()]
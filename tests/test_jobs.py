@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from jobs import JobManager, JobStatus  # noqa: E402
+
+
+def test_same_key_joins_running_job():
+    job_manager = JobManager(max_workers=2)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn(progress_callback):
+        calls.append(threading.get_ident())
+        started.set()
+        release.wait(5.0)
+        return "stems"
+
+    jobs = []
+    submitters = [threading.Thread(target=lambda: jobs.append(job_manager.submit("key", fn)))
+                  for _ in range(2)]
+    for submitter in submitters:
+        submitter.start()
+    for submitter in submitters:
+        submitter.join()
+    assert started.wait(5.0)
+    other = job_manager.submit("other", lambda progress_callback: "other")
+    release.set()
+    job_manager._executor.shutdown(wait=True)
+
+    assert jobs[0] is jobs[1]
+    assert len(calls) == 1
+    assert jobs[0].status == JobStatus.DONE and jobs[0].result == "stems"
+    assert other is not jobs[0] and other.result == "other"
+    # finished jobs are not joined
+    assert job_manager._active == {}
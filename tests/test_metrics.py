@@ -0,0 +1,34 @@
+import pytest
+
+from metrics import MetricsRegistry, Span
+
+
+def test_prometheus_export(tmp_path):
+    registry = MetricsRegistry(log_path=str(tmp_path / "metrics.jsonl"))
+    registry.record(Span("encode", {"codec": "mp3"}, duration=0.2, bytes_in=100, bytes_out=10))
+    registry.record(Span("encode", {"codec": "mp3"}, duration=20.0, error="RuntimeError()"))
+    registry.inc("spleeter_cache_requests_total", kind="raw", result="hit")
+
+    text = registry.to_prometheus()
+    assert 'spleeter_cache_requests_total{kind="raw",result="hit"} 1' in text
+    assert 'spleeter_stage_duration_seconds_bucket{codec="mp3",stage="encode",le="0.5"} 1' in text
+    assert 'spleeter_stage_duration_seconds_count{codec="mp3",stage="encode"} 2' in text
+    assert 'spleeter_stage_bytes_in_total{stage="encode"} 100' in text
+    assert 'spleeter_stage_errors_total{stage="encode"} 1' in text
+    assert len((tmp_path / "metrics.jsonl").read_text().splitlines()) == 2
+    assert [x.duration for x in registry.recent_spans()] == pytest.approx([0.2, 20.0])
+
+
+def test_worker_spans_are_recorded_once(tmp_path):
+    worker = MetricsRegistry(log_path=str(tmp_path / "worker.jsonl"))
+    parent = MetricsRegistry(log_path=str(tmp_path / "worker.jsonl"))
+    with worker.capturing() as spans:
+        worker.record(Span("inference", {"model": "2stems"}, duration=1.5))
+    worker.record(Span("inference", {"model": "2stems"}, duration=3.0))
+    assert [x.duration for x in spans] == pytest.approx([1.5])
+
+    for worker_span in spans:
+        parent.record(worker_span, log=False)
+    assert 'spleeter_stage_duration_seconds_count{model="2stems",stage="inference"} 1' in parent.to_prometheus()
+    # the worker wrote its log lines
+    assert len((tmp_path / "worker.jsonl").read_text().splitlines()) == 2
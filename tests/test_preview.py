@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+SAMPLE_RATE = utils.SPLEETER_SAMPLE_RATE
+
+
+class HalfSeparator:
+    """
+    Stands in for the model: both stems are half of the mixture
+    """
+
+    @contextmanager
+    def acquire(self, config):
+        yield self
+
+    def separate(self, waveform, audio_descriptor="", silence_db=None):
+        return {"vocals": waveform * 0.5, "accompaniment": waveform * 0.5}
+
+
+def fake_encode_raw_stem(raw_stem, stem_path, codec, bitrate, sample_rate=SAMPLE_RATE):
+    stem_path.write_bytes(np.asarray(raw_stem, dtype=np.float32).tobytes())
+
+
+@pytest.fixture
+def song(tmp_path, monkeypatch):
+    # 3 seconds, every sample holds its own time in seconds
+    seconds = np.arange(3 * SAMPLE_RATE, dtype=np.float32) / SAMPLE_RATE
+    waveform = np.repeat(seconds[:, np.newaxis], 2, axis=1)
+
+    def load_stereo_waveform(audio_file, duration=None, offset=0.0):
+        start = int(offset * SAMPLE_RATE)
+        end = waveform.shape[0] if duration is None else start + int(duration * SAMPLE_RATE)
+        return waveform[start:end]
+
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    monkeypatch.setattr(utils, "load_stereo_waveform", load_stereo_waveform)
+    monkeypatch.setattr(utils, "separator_pool", HalfSeparator())
+    monkeypatch.setattr(utils, "encode_raw_stem", fake_encode_raw_stem)
+    return audio_file
+
+
+def test_preview_window(song, tmp_path):
+    config = utils.parse_model_spec("2stems")
+    output_path = tmp_path / "output"
+
+    stems = utils.get_preview(config, song, output_path, offset=1.5, duration=1.0)
+
+    assert [path.name for path in stems] == ["vocals.mp3", "accompaniment.mp3"]
+    vocals = np.frombuffer(stems[0].read_bytes(), dtype=np.float32).reshape(-1, 2)
+    assert vocals.shape == (SAMPLE_RATE, 2)
+    # starts at the offset
+    assert vocals[0] == pytest.approx([0.75, 0.75])
+    assert vocals[-1] == pytest.approx([0.5 * (2.5 - 1 / SAMPLE_RATE)] * 2, abs=1e-3)
+    # the window does not start at 0, so it is not a first window
+    assert utils.load_preview_window(config, song, output_path) is None
+
+    with pytest.raises(ValueError):
+        utils.get_preview(config, song, output_path, offset=5.0, duration=1.0)
+
+
+def test_first_window_is_longest_preview_from_start(song, tmp_path):
+    config = utils.parse_model_spec("2stems")
+    output_path = tmp_path / "output"
+    utils.get_preview(config, song, output_path, duration=0.5)
+    utils.get_preview(config, song, output_path, duration=1.0)
+
+    first_window = utils.load_preview_window(config, song, output_path)
+
+    assert set(first_window) == {"vocals", "accompaniment"}
+    assert first_window["vocals"].shape == (SAMPLE_RATE, 2)
+    assert first_window["vocals"][0] == pytest.approx([0.0, 0.0])
+    # other models have no first window
+    assert utils.load_preview_window(utils.parse_model_spec("4stems"), song, output_path) is None
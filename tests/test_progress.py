@@ -0,0 +1,62 @@
+import pytest
+
+from progress import (DEFAULT_REAL_TIME_FACTORS, ProgressTracker,
+                      progress_chunk, progress_stage, tracking)
+
+
+def test_progress_tracker():
+    progress = []
+    states = []
+    tracker = ProgressTracker(progress.append, 60.0, ["decode", "inference", "masks"],
+                              profile="test-progress", listener=states.append)
+    expected = {stage: DEFAULT_REAL_TIME_FACTORS[stage]
+                for stage in ["decode", "inference", "masks"]}
+    total = sum(expected.values())
+
+    with tracking(tracker):
+        # decode is cached: done as soon as inference starts
+        with progress_stage("inference"):
+            progress_chunk(1, 2)
+            # nested stages are part of the outer one
+            with progress_stage("masks"):
+                progress_chunk(1, 1)
+            assert states[-1].stage == "inference"
+            assert states[-1].chunk == (1, 2)
+            assert states[-1].eta is not None
+        progress_chunk(1, 1)
+
+    assert progress[0] == pytest.approx(expected["decode"] / total)
+    assert progress[1] == pytest.approx((expected["decode"] + expected["inference"] / 2) / total)
+    assert progress[-1] == pytest.approx((expected["decode"] + expected["inference"]) / total)
+    assert progress == sorted(progress)
+    # not tracked any more
+    assert len(progress) == 3
+
+
+def test_batch_progress_in_process(tmp_path, monkeypatch):
+    pytest.importorskip("spleeter.audio")
+    import utils
+
+    def fake_split_audio(config, audio_file, output_path):
+        with progress_stage("inference"):
+            progress_chunk(1, 2)
+            progress_chunk(2, 2)
+        return (path for path in [output_path / f"{audio_file.stem}.mp3"]), False
+
+    monkeypatch.setattr(utils, "probe_audio", lambda audio_file: {
+        "duration": 30.0, "sample_rate": 44100, "channels": 2})
+    monkeypatch.setattr(utils, "get_split_audio", fake_split_audio)
+    audio_files = [tmp_path / "a.wav", tmp_path / "b.wav"]
+    for i, audio_file in enumerate(audio_files):
+        audio_file.write_bytes(bytes([i]) * 16)
+
+    progress = []
+    results = utils.separate_batch(utils.parse_model_spec("2stems"), audio_files,
+                                   tmp_path / "output", progress.append, max_workers=1)
+
+    assert [result.error for result in results] == [None, None]
+    # moves inside each file, not only once per file
+    assert len(progress) > len(audio_files)
+    assert 0.0 < progress[0] < 0.5
+    assert progress == sorted(progress)
+    assert progress[-1] == 1.0
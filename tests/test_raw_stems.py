@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from spleeter.audio import Codec  # noqa: E402
+
+import utils  # noqa: E402
+
+SAMPLES = 5000
+
+
+class FakeSeparator:
+    """
+    Stands in for the model: returns fixed stems and records every run
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.runs = []
+
+    @contextmanager
+    def acquire(self, config):
+        yield self
+
+    def run(self, stft, n_samples, stems=None, model_outputs=None, fetch_model_outputs=False):
+        self.runs.append((list(stems), model_outputs is not None))
+        fetched = {"estimates": np.ones((4, 2), dtype=np.float32)} if fetch_model_outputs else {}
+        return {stem: self.sources[stem][:n_samples] for stem in stems}, fetched
+
+
+def fake_encode_raw_stem(raw_stem, stem_path, codec, bitrate, sample_rate=44100):
+    stem_path.write_bytes(np.asarray(raw_stem, dtype=np.float32).tobytes())
+
+
+def setup_song(tmp_path, monkeypatch, split_mode):
+    rng = np.random.default_rng(0)
+    waveform = (rng.standard_normal((SAMPLES, 2)) * 0.1).astype(np.float32)
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    separator = FakeSeparator({
+        stem: (rng.standard_normal((SAMPLES, 2)) * 0.1).astype(np.float32)
+        for stem in split_mode.value.stems})
+    monkeypatch.setattr(utils, "load_stereo_waveform",
+                        lambda audio_file, duration=None: waveform)
+    monkeypatch.setattr(utils, "separator_pool", separator)
+    monkeypatch.setattr(utils, "encode_raw_stem", fake_encode_raw_stem)
+    return audio_file, separator
+
+
+def test_raw_stems_round_trip(tmp_path):
+    config = utils.parse_model_spec("2stems")
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    vocals = (np.random.default_rng(0).standard_normal((SAMPLES, 2)) * 0.1).astype(np.float32)
+
+    def produce(write):
+        # appended in two parts, as streaming windows are
+        write("vocals", vocals[:1000])
+        write("vocals", vocals[1000:])
+        write("accompaniment", -vocals)
+
+    raw_dir, manifest = utils.commit_raw_stems(config, audio_file, tmp_path, produce)
+
+    assert manifest["samples"] == {"vocals": SAMPLES, "accompaniment": SAMPLES}
+    assert utils.read_cache_manifest(raw_dir) == manifest
+    raw_vocals = utils.load_raw_stem(raw_dir, manifest, "vocals")
+    assert raw_vocals.dtype == np.float16
+    np.testing.assert_array_equal(raw_vocals, vocals.astype(np.float16))
+    np.testing.assert_allclose(raw_vocals, vocals, atol=1e-3)
+
+
+def test_new_codec_encodes_from_raw_stems(tmp_path, monkeypatch):
+    config = utils.parse_model_spec("2stems")
+    audio_file, separator = setup_song(tmp_path, monkeypatch, config.split_mode)
+    output_path = tmp_path / "output"
+
+    mp3_files, _ = utils.get_split_audio(config, audio_file, output_path)
+    wav_files, is_exist = utils.get_split_audio(
+        replace(config, codec=Codec.WAV), audio_file, output_path)
+
+    # the network ran once; the wav files were encoded from the raw stems
+    assert len(separator.runs) == 1
+    assert not is_exist
+    assert [path.name for path in mp3_files] == ["vocals.mp3", "accompaniment.mp3"]
+    for path in wav_files:
+        encoded = np.frombuffer(path.read_bytes(), dtype=np.float32).reshape(-1, 2)
+        np.testing.assert_allclose(encoded, separator.sources[path.stem], atol=1e-3)
+
+
+def test_only_requested_stems_are_written(tmp_path, monkeypatch):
+    config = replace(utils.parse_model_spec("4stems"), stems=["vocals"])
+    audio_file, separator = setup_song(tmp_path, monkeypatch, config.split_mode)
+    output_path = tmp_path / "output"
+
+    output_files, _ = utils.get_split_audio(config, audio_file, output_path)
+
+    cache_dir = utils.get_separation_cache_dir(config, audio_file, output_path)
+    assert [path.name for path in output_files] == ["vocals.mp3"]
+    assert sorted(path.name for path in cache_dir.iterdir()) == \
+        sorted(["vocals.mp3", utils.CACHE_MANIFEST_NAME])
+    raw_dir, raw_manifest = utils.get_raw_stems(config, audio_file, output_path)
+    assert list(raw_manifest["samples"]) == ["vocals"]
+    assert not (raw_dir / f"drums.{utils.RAW_STEM_SUFFIX}").exists()
+    assert separator.runs == [(["vocals"], False)]
+
+    # a stem asked for later is added from the kept network estimates
+    utils.get_split_audio(replace(config, stems=["drums"]), audio_file, output_path)
+
+    assert separator.runs == [(["vocals"], False), (["drums"], True)]
+    assert sorted(path.name for path in cache_dir.iterdir()) == \
+        sorted(["vocals.mp3", "drums.mp3", utils.CACHE_MANIFEST_NAME])
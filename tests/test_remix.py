@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from utils import StemMix, get_stem_mix_gains, mix_raw_stems  # noqa: E402
+
+
+def test_stem_mix_gains():
+    assert get_stem_mix_gains(StemMix()) == pytest.approx([1.0, 1.0])
+    assert get_stem_mix_gains(StemMix(mute=True)) == pytest.approx([0.0, 0.0])
+    assert get_stem_mix_gains(StemMix(pan=-1.0)) == pytest.approx([2 ** 0.5, 0.0], abs=1e-6)
+    assert get_stem_mix_gains(StemMix(gain_db=-20.0)) == pytest.approx([0.1, 0.1])
+
+
+def test_mix_raw_stems_in_chunks():
+    raw_stems = {
+        "vocals": np.full((10, 2), 0.25, dtype=np.float16),
+        "drums": np.full((7, 2), 0.5, dtype=np.float16),
+    }
+    gains = {"vocals": np.array([1.0, 0.0], dtype=np.float32),
+             "drums": np.array([2.0, 2.0], dtype=np.float32)}
+    mixed = np.concatenate(list(mix_raw_stems(raw_stems, gains, chunk_samples=4)))
+
+    assert mixed.shape == (10, 2)
+    # clipped to [-1, 1]
+    assert mixed[0] == pytest.approx([1.0, 1.0])
+    assert mixed[9] == pytest.approx([0.25, 0.0])
@@ -0,0 +1,34 @@
+from dataclasses import replace
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+
+class FakeSeparator:
+    def __init__(self, params_descriptor, MWF=False, backend=None, intra_op_threads=0):
+        self.params_descriptor = params_descriptor
+        self.intra_op_threads = intra_op_threads
+
+
+def test_threads_load_another_separator(monkeypatch):
+    monkeypatch.setattr(utils, "SpectrogramSeparator", FakeSeparator)
+    pool = utils.SeparatorPool(max_size=2)
+    config = utils.parse_model_spec("2stems-16kHz")
+
+    with pool.acquire(config) as default_threads:
+        pass
+    with pool.acquire(replace(config, threads=4)) as four_threads:
+        pass
+    with pool.acquire(replace(config, threads=4)) as again:
+        pass
+
+    assert default_threads is not four_threads
+    assert again is four_threads
+    assert four_threads.params_descriptor == "spleeter:2stems-16kHz"
+    assert four_threads.intra_op_threads == 4
+    assert pool.loaded_keys() == [("2stems", True, False, "tensorflow", 0),
+                                  ("2stems", True, False, "tensorflow", 4)]
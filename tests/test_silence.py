@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from utils import find_silent_segments  # noqa: E402
+
+
+def test_find_silent_segments():
+    step, segment_frames = 1024, 8
+    waveform = np.zeros((step * 100, 2), dtype=np.float32)
+    waveform[:step * 10] = 0.1
+    waveform[step * 70:step * 71, 1] = 0.1
+    # under the threshold
+    waveform[step * 30:step * 50] = 1e-4
+
+    silent = find_silent_segments(waveform, -60.0, 4096, step, segment_frames)
+
+    # 104 frames: segments of 8 frames, each frame sees the 4 blocks before it
+    assert silent.shape == (13,)
+    assert list(np.flatnonzero(~silent)) == [0, 1, 8, 9]
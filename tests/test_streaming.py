@@ -0,0 +1,85 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+import utils  # noqa: E402
+
+SAMPLE_RATE = utils.SPLEETER_SAMPLE_RATE
+
+
+class WindowSeparator:
+    """
+    Stands in for the model: stems depend on the samples only, plus a small
+    error which grows towards the edges of every window
+    """
+
+    def __init__(self):
+        self.windows = []
+
+    def separate(self, waveform, audio_descriptor="", silence_db=None):
+        self.windows.append(waveform.shape[0])
+        edge = np.abs(np.linspace(-1.0, 1.0, waveform.shape[0], dtype=np.float32))[:, np.newaxis]
+        error = 1e-3 * edge ** 8
+        return {"vocals": waveform * 0.25 + error, "accompaniment": waveform * 0.75 - error}
+
+
+@pytest.fixture
+def song(tmp_path, monkeypatch):
+    waveform = (np.random.default_rng(0).standard_normal((int(3.3 * SAMPLE_RATE), 2)) * 0.1) \
+        .astype(np.float32)
+
+    def load_stereo_waveform(audio_file, duration=None, offset=0.0):
+        start = int(round(offset * SAMPLE_RATE))
+        end = waveform.shape[0] if duration is None else start + int(round(duration * SAMPLE_RATE))
+        return waveform[start:end]
+
+    audio_file = tmp_path / "song.wav"
+    audio_file.write_bytes(b"0" * 16)
+    monkeypatch.setattr(utils, "load_stereo_waveform", load_stereo_waveform)
+    monkeypatch.setattr(utils, "get_audio_duration", lambda audio_file: waveform.shape[0] / SAMPLE_RATE)
+    monkeypatch.setattr(utils, "STREAMING_CHUNK_SECONDS", 1.0)
+    monkeypatch.setattr(utils, "STREAMING_OVERLAP_SECONDS", 0.25)
+    return audio_file, waveform
+
+
+def separate(config, audio_file, separator, first_window=None):
+    parts = {}
+    utils.separate_waveform(separator, config, audio_file,
+                            lambda stem, data: parts.setdefault(stem, []).append(data),
+                            first_window)
+    return {stem: np.concatenate(data) for stem, data in parts.items()}
+
+
+def test_streaming_matches_whole_file(song):
+    audio_file, waveform = song
+    config = utils.parse_model_spec("2stems")
+    separator = WindowSeparator()
+
+    whole = separate(config, audio_file, separator)
+    streamed = separate(replace(config, streaming=True), audio_file, separator)
+
+    # one whole window, then 1 s chunks with 0.25 s overlap
+    assert separator.windows == [waveform.shape[0]] + [int(1.25 * SAMPLE_RATE)] * 3 + \
+        [int(0.3 * SAMPLE_RATE)]
+    for stem, data in whole.items():
+        assert streamed[stem].shape == data.shape
+        np.testing.assert_allclose(streamed[stem], data, atol=2e-3)
+
+
+def test_streaming_continues_after_first_window(song):
+    audio_file, waveform = song
+    config = replace(utils.parse_model_spec("2stems"), streaming=True)
+    separator = WindowSeparator()
+    # a 1.5 s preview from the start
+    first_window = separator.separate(waveform[:int(1.5 * SAMPLE_RATE)])
+
+    streamed = separate(config, audio_file, separator, first_window)
+
+    # the preview is not separated again
+    assert separator.windows[1] == int(1.25 * SAMPLE_RATE)
+    assert streamed["vocals"].shape == waveform.shape
+    np.testing.assert_allclose(streamed["vocals"], waveform * 0.25, atol=2e-3)
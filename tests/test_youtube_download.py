@@ -0,0 +1,54 @@
+import shutil
+import struct
+import threading
+import wave
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+if shutil.which("ffmpeg") is None:
+    pytest.skip("ffmpeg is required", allow_module_level=True)
+
+from utils import download_youtube_as_mp3, get_youtube_info  # noqa: E402
+
+
+@pytest.fixture
+def audio_url(tmp_path):
+    # local http stand-in for youtube: yt-dlp's generic extractor handles a direct audio url
+    served_dir = tmp_path / "served"
+    served_dir.mkdir()
+    with wave.open(str(served_dir / "tone.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"".join(struct.pack("<h", (i % 80) * 100)
+                               for i in range(8000)))
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(SimpleHTTPRequestHandler, directory=str(served_dir)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/tone.wav"
+    server.shutdown()
+
+
+def test_download_youtube_as_mp3(audio_url, tmp_path):
+    output_path = tmp_path / "upload"
+    progress = []
+    youtube_info = get_youtube_info(audio_url)
+    assert youtube_info is get_youtube_info(audio_url)
+
+    file_list = download_youtube_as_mp3(
+        audio_url, output_path, progress.append, 64, youtube_info)
+    assert len(file_list) == 1
+    assert file_list[0].name.endswith(f" [{youtube_info.items[0].id}].mp3")
+    assert progress[-1] == 1.0
+    assert progress == sorted(progress)
+
+    # already downloaded entries are skipped
+    mtime = file_list[0].stat().st_mtime_ns
+    assert download_youtube_as_mp3(
+        audio_url, output_path, progress.append, 64) == file_list
+    assert file_list[0].stat().st_mtime_ns == mtime
@@ -0,0 +1,67 @@
+import io
+import zipfile
+
+import pytest
+
+pytest.importorskip("spleeter.audio")
+pytest.importorskip("ffmpeg")
+
+from utils import (ZipOutput, build_zip_output, get_batch_zip_key,  # noqa: E402
+                   parse_model_spec, read_zip_manifest, write_zip)
+
+
+def test_batch_zip_key_ignores_order(tmp_path):
+    audio_files = []
+    for name in ("a", "b", "c"):
+        audio_file = tmp_path / f"{name}.mp3"
+        audio_file.write_bytes(name.encode() * 16)
+        audio_files.append(audio_file)
+    output_path = tmp_path / "output"
+    config = parse_model_spec("2stems")
+
+    key = get_batch_zip_key(config, audio_files, output_path)
+
+    assert get_batch_zip_key(config, audio_files[::-1], output_path) == key
+    assert get_batch_zip_key(config, audio_files[:2], output_path) != key
+    assert get_batch_zip_key(parse_model_spec("4stems"), audio_files, output_path) != key
+
+
+def test_only_wav_is_deflated(tmp_path):
+    stems = []
+    for name in ("vocals.mp3", "drums.m4a", "bass.wav"):
+        stem = tmp_path / name
+        stem.write_bytes(b"0" * 1000)
+        stems.append(stem)
+    fileobj = io.BytesIO()
+
+    write_zip([("song", stems)], fileobj)
+
+    with zipfile.ZipFile(fileobj) as zipf:
+        compress_types = {info.filename: info.compress_type for info in zipf.infolist()}
+    assert compress_types == {
+        "song/song_vocals.mp3": zipfile.ZIP_STORED,
+        "song/song_drums.m4a": zipfile.ZIP_STORED,
+        "song/song_bass.wav": zipfile.ZIP_DEFLATED,
+    }
+
+
+def test_zip_is_streamed_while_built(tmp_path):
+    stem = tmp_path / "vocals.mp3"
+    stem.write_bytes(b"0" * 1000)
+    output_path = tmp_path / "output"
+    zip_output = ZipOutput(output_path / "1files-2stems_abc.zip", [("song", [stem])],
+                           {"sources": ["song.mp3"]})
+    output_path.mkdir()
+    stream = io.BytesIO()
+
+    build_zip_output(output_path, zip_output, stream)
+
+    assert zip_output.is_built
+    assert stream.getvalue() == zip_output.path.read_bytes()
+    with zipfile.ZipFile(zip_output.path) as zipf:
+        assert zipf.namelist() == ["song/song_vocals.mp3"]
+    assert read_zip_manifest(output_path, zip_output.path)["sources"] == ["song.mp3"]
+    # later downloads send the built file
+    again = io.BytesIO()
+    build_zip_output(output_path, zip_output, again)
+    assert again.getvalue() == stream.getvalue()